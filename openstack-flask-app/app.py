@@ -1,12 +1,477 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, g, abort, send_file
 import asyncio
+import functools
+import os
+import re
+import threading
+import time
 import openstack_client as osc
-from flask import send_file
+from flask import Response
 from flask import session
-import os
+from key_store import PrivateKeyStore
+from token_store import TokenStore
+from upstream_executor import UpstreamExecutor, ServiceBusy
+from inventory_store import InventoryStore
+import inventory_export
+from server_index import ServerIndex, SORT_KEYS
+from usage import UsageAggregator
+import profiler
+import regions
+from fragment_cache import FragmentCache
+from autoscaler import Autoscaler, FakeComputeBackend, OpenStackComputeBackend, ScaleGroupSpec, SpecStore
+from datetime import datetime
+from urllib.parse import urlencode, urlsplit
 
 app = Flask(__name__)
-app.secret_key = "supersecret"
+# Ký cookie session (auth_key, region); đặt OSC_SECRET_KEY giống nhau cho mọi worker khi deploy
+app.secret_key = os.environ.get("OSC_SECRET_KEY", "supersecret")
+
+# Private key vừa tạo chỉ nằm trong RAM (TTL 5 phút) của worker đã tạo nó, không ghi ra đĩa / cache
+# dùng chung => nhiều worker thì load balancer phải sticky theo session (xem README).
+KEY_TTL = 300
+private_keys = PrivateKeyStore(ttl=KEY_TTL)
+
+# ======================
+# UPSTREAM EXECUTOR (admission control)
+# ======================
+# Mọi lời gọi openstack_client chạy trên pool riêng với giới hạn theo service
+# (OSC_SERVICE_LIMITS, OSC_MAX_QUEUE); quá tải => 503 ngay thay vì treo.
+executor = UpstreamExecutor.from_env()
+
+
+async def upstream(service, fn, *args):
+    return await executor.run(service, fn, *args)
+
+
+@app.errorhandler(ServiceBusy)
+def service_busy(e):
+    return f"⏳ Server busy ({e.service}), please retry in a moment.", 503, {"Retry-After": "2"}
+
+
+@app.errorhandler(osc.QuotaExceeded)
+def quota_exceeded(e):
+    # Pre-flight từ chối trước khi gửi request tạo nào => quay lại form kèm lý do
+    flash(f"⚠️ {e}", "danger")
+    return redirect(request.referrer or url_for('instances'))
+
+
+@app.route('/metrics/upstream')
+def upstream_metrics():
+    return jsonify(executor.metrics())
+
+
+@app.route('/metrics/http-cache')
+def http_cache_metrics():
+    return jsonify(osc.http_cache.metrics())
+
+
+# ======================
+# WARM-UP & READINESS
+# ======================
+# OSC_WARMUP=1 => xác thực, resolve catalog và prefetch flavors/images/networks
+# trong background ngay khi app khởi động; /readyz chỉ trả 200 khi xong.
+_started_at = time.monotonic()
+_ready = threading.Event()
+_startup = {"warmup": None, "warmup_error": None, "first_response_seconds": None}
+
+
+def _run_warmup():
+    try:
+        _startup["warmup"] = osc.warmup()
+    except Exception as e:
+        _startup["warmup_error"] = str(e)
+    finally:
+        _ready.set()
+
+
+if os.environ.get("OSC_WARMUP", "0") == "1":
+    threading.Thread(target=_run_warmup, name="osc-warmup", daemon=True).start()
+else:
+    _ready.set()
+
+
+@app.after_request
+def _record_first_response(response):
+    # Time-to-first-response kể từ khi process khởi động (đo hiệu quả warm-up)
+    if _startup["first_response_seconds"] is None and request.endpoint not in ('healthz', 'readyz'):
+        _startup["first_response_seconds"] = time.monotonic() - _started_at
+    return response
+
+
+@app.route('/healthz')
+def healthz():
+    return jsonify(status="ok")
+
+
+@app.route('/readyz')
+def readyz():
+    body = {
+        "ready": _ready.is_set(),
+        "uptime_seconds": time.monotonic() - _started_at,
+        **_startup,
+    }
+    return jsonify(body), (200 if _ready.is_set() else 503)
+
+
+# ======================
+# ON-DEMAND PROFILER
+# ======================
+# Lấy mẫu stack của request (request thread + event loop + worker upstream) khi:
+# - admin gửi header X-Profile-Token: <OSC_PROFILE_TOKEN> (chỉ header: query string lọt vào log / Referer),
+# - hoặc request rơi vào tỉ lệ OSC_PROFILE_SAMPLE_RATE.
+# Kết quả (collapsed stacks cho flamegraph) nằm trong OSC_PROFILE_DIR, xem tại /profiles.
+PROFILER_ENDPOINTS = {"static", "profiles", "profile_download"}
+
+# Async view chạy trên thread event loop của asgiref => profiler phải theo cả thread đó
+_ensure_sync = app.ensure_sync
+app.ensure_sync = lambda func: _ensure_sync(profiler.follow_coroutine(func))
+
+
+def profile_admin():
+    # Kiểm tra token trên từng request, không lưu vào session (cookie ký bằng secret_key của app)
+    return profiler.is_admin(request.headers.get("X-Profile-Token"))
+
+
+@app.before_request
+def start_profile():
+    if request.endpoint in PROFILER_ENDPOINTS:
+        return
+    reason = profiler.requested(request.headers.get("X-Profile-Token"))
+    if reason:
+        g.profile = profiler.start(f"{request.method} {request.endpoint or request.path}", reason)
+
+
+@app.after_request
+def tag_profile(response):
+    if g.get("profile"):
+        g.profile_status = response.status_code
+        response.headers["X-Profile-Id"] = g.profile.id
+    return response
+
+
+@app.teardown_request
+def stop_profile(exc):
+    session_ = g.pop("profile", None)
+    if session_ is not None:
+        # Client cũ còn gửi ?_profile=<token>: không lưu nó vào metadata của profile
+        query = urlencode([(k, v) for k, v in request.args.items(multi=True) if k != "_profile"])
+        profiler.stop(session_, path=f"{request.path}?{query}" if query else request.path,
+                      status=g.get("profile_status", 500),
+                      error=str(exc) if exc else None)
+
+
+@app.route('/profiles')
+def profiles():
+    if not profile_admin():
+        abort(403)
+    return render_template('profiles.html', profiles=profiler.list_profiles(), profile_dir=profiler.PROFILE_DIR)
+
+
+@app.route('/profiles/<name>.collapsed')
+def profile_download(name):
+    if not profile_admin():
+        abort(403)
+    path = profiler.profile_path(name)
+    if path is None:
+        abort(404)
+    return send_file(path, mimetype='text/plain', as_attachment=request.args.get('download') == '1')
+
+
+# ======================
+# PER-USER LOGIN (opt-in)
+# ======================
+# OSC_USER_AUTH=1 => mỗi user đăng nhập bằng tài khoản Keystone của mình.
+# Token + catalog nằm trong TokenStore (hết hạn theo expires_at), session chỉ giữ key ngẫu nhiên;
+# mỗi request gắn conn của user vào openstack_client (osc.use_conn). Với OSC_CACHE_BACKEND=sqlite
+# store nằm trong cache dùng chung => login ở worker nào cũng dùng được ở mọi worker; mặc định RAM (LRU).
+# Mặc định (0): cả app dùng tài khoản dịch vụ trong clouds.yaml như trước.
+USER_AUTH = os.environ.get("OSC_USER_AUTH", "0") == "1"
+tokens = TokenStore(max_entries=int(os.environ.get("OSC_TOKEN_STORE_SIZE", "1000")),
+                    backend=osc.cache if osc.cache.shared else None)
+PUBLIC_ENDPOINTS = {"login", "static", "healthz", "readyz", "upstream_metrics", "fragment_metrics",
+                    "http_cache_metrics"}
+
+
+@app.before_request
+def bind_user_conn():
+    # Luôn đặt lại (kể cả None) để thread được tái sử dụng không mang conn của request trước
+    conn = tokens.get(session.get("auth_key")) if USER_AUTH else None
+    osc.use_conn(conn)
+    g.user = conn
+    if USER_AUTH and conn is None and request.endpoint not in PUBLIC_ENDPOINTS:
+        # Không xoá auth_key: miss có thể chỉ là store của worker này; login lại sẽ thay key
+        if "/fragment/" in request.path or request.path.startswith("/api/"):
+            return "🔒 Login required", 401
+        return redirect(url_for('login', next=request.full_path.rstrip('?')))
+
+
+@app.before_request
+def bind_target():
+    # Cloud/region của mọi trang: ?region=<label> cho riêng request này, nếu không thì lựa chọn trong session.
+    # Luôn đặt lại (None = target mặc định) như bind_user_conn.
+    label = request.args.get('region') or session.get('region')
+    target = osc.find_target(label) if label else None
+    osc.use_target(target)
+    g.target = target
+
+
+def current_scope(target=None):
+    """Project của user đang đăng nhập ("default" = tài khoản dịch vụ), kèm cloud/region nếu khác mặc định."""
+    user = g.get("user")
+    scope = re.sub(r"[^A-Za-z0-9_-]", "_", user["project_id"]) if user else "default"
+    target = target or g.get("target")
+    if target is not None and target != osc.default_target():
+        scope += "@" + re.sub(r"[^A-Za-z0-9_-]", "_", target.label)
+    return scope
+
+
+@app.context_processor
+def inject_user():
+    user = g.get("user")
+    return {"current_user": f"{user['user']}@{user['project']}" if user else None, "user_auth": USER_AUTH}
+
+
+def local_url(target):
+    """`target` nếu là đường dẫn trong app, nếu không thì trang chủ (chống open redirect)."""
+    # Trình duyệt coi \ như / và bỏ tab / xuống dòng: /\evil.example => //evil.example
+    parts = urlsplit(target)
+    if (not target.startswith('/') or '\\' in target or any(ord(c) < 0x20 for c in target)
+            or parts.scheme or parts.netloc):
+        return url_for('home')
+    return target
+
+
+@app.route('/login', methods=['GET', 'POST'])
+async def login():
+    if not USER_AUTH:
+        return redirect(url_for('home'))
+    if request.method == 'POST':
+        try:
+            conn = await upstream(
+                "identity", osc.authenticate,
+                request.form['username'].strip(),
+                request.form['password'],
+                request.form['project_name'].strip(),
+                request.form.get('domain', '').strip() or None,
+            )
+        except ServiceBusy:
+            raise
+        except Exception:
+            flash("❌ Login failed: check username, password and project.", "danger")
+            return render_template('login.html'), 401
+
+        tokens.discard(session.pop("auth_key", None))
+        session["auth_key"] = tokens.put(conn)
+        flash(f"✅ Logged in as {conn['user']} (project {conn['project']})", "success")
+        return redirect(local_url(request.args.get('next', '')))
+
+    return render_template('login.html')
+
+
+@app.route('/logout', methods=['POST'])
+def logout():
+    tokens.discard(session.pop("auth_key", None))
+    flash("👋 Logged out.", "info")
+    return redirect(url_for('login'))
+
+
+# ======================
+# INVENTORY SNAPSHOT (degraded mode)
+# ======================
+# Mỗi lần fetch thành công được ghi (background) vào SQLite; khi upstream chậm hơn
+# OSC_LIVE_TIMEOUT giây, lỗi, quá tải hoặc app còn đang warm-up thì trang được
+# render từ snapshot kèm mốc "data as of", còn live fetch vẫn chạy tiếp và cập nhật snapshot.
+LIVE_TIMEOUT = float(os.environ.get("OSC_LIVE_TIMEOUT", "5"))
+INVENTORY_PATH = os.environ.get("OSC_INVENTORY_PATH", os.path.join(app.instance_path, "inventory.db"))
+os.makedirs(app.instance_path, exist_ok=True)
+
+# Snapshot và index tìm kiếm tách theo project (current_scope), tạo khi cần
+_inventories = {}
+_server_indexes = {}
+_usage = {}
+_scoped_lock = threading.Lock()
+
+
+def inventory_store(target=None):
+    scope = current_scope(target)
+    with _scoped_lock:
+        if scope not in _inventories:
+            path = INVENTORY_PATH if scope == "default" else os.path.join(app.instance_path, f"inventory-{scope}.db")
+            _inventories[scope] = InventoryStore(path)
+        return _inventories[scope]
+
+
+def server_index():
+    """Index tìm kiếm / lọc cho bảng instances (cập nhật incremental mỗi lần có server list mới)."""
+    scope = current_scope()
+    with _scoped_lock:
+        return _server_indexes.setdefault(scope, ServerIndex())
+
+
+def usage_aggregator():
+    """Tổng tài nguyên theo flavor / image / status / network của project hiện tại."""
+    scope = current_scope()
+    with _scoped_lock:
+        return _usage.setdefault(scope, UsageAggregator())
+
+
+def _save_snapshot(store, kind, pick=None):
+    def callback(future):
+        if not future.cancelled() and future.exception() is None:
+            store.save_async(kind, pick(future.result()) if pick else future.result())
+    return callback
+
+
+async def fetch_inventory(kind, service, fn, save=True, select=None):
+    """Live data nếu kịp, nếu không thì snapshot cùng kind (lọc bằng `select`)."""
+    store = inventory_store()
+    live = None
+    try:
+        future = executor.submit(service, fn)
+        if save:
+            future.add_done_callback(_save_snapshot(store, kind))
+        live = asyncio.wrap_future(future)
+        live.add_done_callback(lambda f: f.cancelled() or f.exception())  # tránh "never retrieved"
+        timeout = LIVE_TIMEOUT if _ready.is_set() else 0
+        return await asyncio.wait_for(asyncio.shield(live), timeout)
+    except Exception as e:  # timeout, ServiceBusy hoặc upstream lỗi
+        error = e
+
+    records, fetched_at = store.load(kind)
+    if records is None:
+        # Chưa có snapshot: chờ live (hoặc báo lỗi gốc)
+        if live is None:
+            raise error
+        return await live
+
+    if select:
+        records = [r for r in records if select(r)]
+    g.data_as_of = min(getattr(g, "data_as_of", fetched_at), fetched_at)
+    return records
+
+
+# HTML đã render của từng dòng server / network, dùng lại khi fingerprint không đổi
+# (OSC_FRAGMENT_CACHE_SIZE dòng, LRU). Template gọi {{ cached_row('_server_row.html', s) }}.
+fragments = FragmentCache(app.jinja_env, max_entries=int(os.environ.get("OSC_FRAGMENT_CACHE_SIZE", "5000")))
+app.jinja_env.globals["cached_row"] = fragments.render
+
+
+@app.route('/metrics/fragments')
+def fragment_metrics():
+    return jsonify(fragments.metrics())
+
+
+@app.context_processor
+def inject_data_as_of():
+    as_of = getattr(g, "data_as_of", None)
+    return {"data_as_of": datetime.fromtimestamp(as_of).strftime("%Y-%m-%d %H:%M:%S") if as_of else None}
+
+
+@app.route('/api/inventory/servers')
+def inventory_servers():
+    """Truy vấn snapshot theo name (prefix), status, network, ip — không gọi upstream."""
+    return jsonify(inventory_store().query_servers(
+        name=request.args.get('name'),
+        status=request.args.get('status'),
+        network=request.args.get('network'),
+        ip=request.args.get('ip'),
+    ))
+
+
+@app.route('/api/inventory/export')
+def inventory_export_stream():
+    """
+    Export gzip NDJSON của project (?kinds=networks,routers,keypairs,security_groups,servers).
+    Đọc upstream theo trang và nén dần trong lúc gửi => RAM không đổi theo kích thước project.
+    Dòng cuối là record "summary"; thiếu dòng này nghĩa là export bị ngắt giữa chừng.
+    """
+    kinds = request.args.get('kinds', ','.join(inventory_export.KINDS)).split(',')
+    conn = osc.get_conn()
+    records = inventory_export.export_records(conn, [k for k in kinds if k in inventory_export.KINDS])
+    filename = f"inventory-{conn['project']}-{datetime.now():%Y%m%d-%H%M%S}.ndjson.gz"
+    return Response(
+        inventory_export.gzip_stream(inventory_export.ndjson_lines(records)),
+        mimetype='application/gzip',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"', 'Cache-Control': 'no-store'},
+    )
+
+
+# ======================
+# REGIONS (multi-cloud fan-out)
+# ======================
+# Target = cloud + region trong clouds.yaml (OSC_TARGETS). Phạm vi gộp: mọi hàm list trong REGION_KINDS,
+# nhưng chỉ qua /regions (trang) và /api/regions/<kind> (JSON). Các trang thường (/networks, /instances,
+# /routers, /keypair, ...) làm việc trên MỘT target (chọn ở navbar hoặc ?region=), không gộp.
+# Fan-out gọi song song qua pool "fanout" của regions; mỗi region có deadline + timeout HTTP riêng
+# (api_timeout / OSC_REGION_TIMEOUT, chỉ áp cho lời gọi của fan-out): region chậm / chết => snapshot
+# của region đó hoặc báo lỗi, các region khác vẫn hiển thị; thời gian trang ~ region chậm nhất.
+REGION_KINDS = {
+    "servers": osc.list_servers_detailed,
+    "networks": osc.list_networks_with_subnets,
+    "routers": osc.list_routers,
+    "keypairs": osc.list_keypairs,
+    "images": osc.list_images,
+    "flavors": osc.list_flavors,
+}
+
+
+@app.context_processor
+def inject_targets():
+    if not request.endpoint or request.endpoint in PUBLIC_ENDPOINTS:
+        return {}
+    return {"targets": osc.list_targets(), "current_target": g.get("target") or osc.default_target()}
+
+
+@app.route('/regions/select', methods=['POST'])
+def select_region():
+    target = osc.find_target(request.form.get('region', ''))
+    if target is None:
+        abort(400)
+    if target == osc.default_target():
+        session.pop('region', None)
+    else:
+        session['region'] = target.label
+    flash(f"🌍 Working on {target.label}", "info")
+    return redirect(local_url(request.form.get('next', '')))
+
+
+async def fetch_regions(kind, targets, save=True):
+    """REGION_KINDS[kind] trên mọi target song song; region lỗi / quá hạn => snapshot của region đó (nếu có)."""
+    fn = REGION_KINDS[kind]
+    stores = {t.label: inventory_store(t) for t in targets}
+
+    def submit(target, job):
+        # Pool "fanout" riêng: region treo không chiếm slot "compute"/"network" của các trang khác
+        future = regions.submit_job(target, job)
+        if save:
+            future.add_done_callback(_save_snapshot(stores[target.label], kind, pick=lambda r: r[0]))
+        return future
+
+    def fallback(target):
+        records, fetched_at = stores[target.label].load(kind)
+        if records is None:
+            return None
+        return records, datetime.fromtimestamp(fetched_at).strftime("%Y-%m-%d %H:%M:%S")
+
+    return await regions.gather(fn, targets, submit=submit, fallback=fallback)
+
+
+@app.route('/regions')
+async def regions_view():
+    targets = regions.parse_targets(','.join(request.args.getlist('regions')))
+    kinds = ("servers", "networks", "routers", "keypairs")
+    views = await asyncio.gather(*(fetch_regions(kind, targets) for kind in kinds))
+    return render_template('regions.html', selected=[t.label for t in targets], **dict(zip(kinds, views)))
+
+
+@app.route('/api/regions/<kind>')
+async def regions_api(kind):
+    """?regions=cloud/RegionOne,othercloud (mặc định: mọi target) — items gắn "region", kèm trạng thái từng region."""
+    if kind not in REGION_KINDS:
+        abort(404)
+    view = await fetch_regions(kind, regions.parse_targets(','.join(request.args.getlist('regions'))))
+    return jsonify(view.to_dict())
+
 
 @app.route('/')
 def home():
@@ -17,7 +482,7 @@ def home():
 # ======================
 @app.route('/networks')
 async def networks():
-    nets = await asyncio.to_thread(osc.list_networks_with_subnets)
+    nets = await fetch_inventory("networks", "network", osc.list_networks_with_subnets)
     return render_template('networks.html', networks=nets)
 
 
@@ -26,14 +491,14 @@ async def create_network():
     name = request.form['name']
     subnet_name = request.form['subnet_name']
     cidr = request.form['cidr']
-    await asyncio.to_thread(osc.create_network, name, subnet_name, cidr)
+    await upstream("network", osc.create_network, name, subnet_name, cidr)
     flash("✅ Network created successfully!", "success")
     return redirect(url_for('networks'))
 
 
 @app.route('/delete-network/<id>')
 async def delete_network(id):
-    await asyncio.to_thread(osc.delete_network, id)
+    await upstream("network", osc.delete_network, id)
     flash("🗑️ Network deleted!", "warning")
     return redirect(url_for('networks'))
 
@@ -44,8 +509,9 @@ async def delete_network(id):
 @app.route('/routers')
 async def routers():
     routers, external_nets = await asyncio.gather(
-        asyncio.to_thread(osc.list_routers),
-        asyncio.to_thread(osc.list_external_networks)
+        fetch_inventory("routers", "network", osc.list_routers),
+        fetch_inventory("networks", "network", osc.list_external_networks,
+                        save=False, select=lambda n: n.external)
     )
     return render_template('routers.html', routers=routers, external_networks=external_nets)
 
@@ -54,14 +520,14 @@ async def routers():
 async def create_router():
     name = request.form['name']
     external_net_id = request.form['external_network_id']
-    await asyncio.to_thread(osc.create_router, name, external_net_id)
+    await upstream("network", osc.create_router, name, external_net_id)
     flash("🚀 Router created successfully!", "success")
     return redirect(url_for('routers'))
 
 
 @app.route('/delete-router/<id>')
 async def delete_router(id):
-    await asyncio.to_thread(osc.delete_router, id)
+    await upstream("network", osc.delete_router, id)
     flash("🗑️ Router deleted!", "warning")
     return redirect(url_for('routers'))
 
@@ -71,25 +537,92 @@ async def delete_router(id):
 # ======================
 @app.route('/instances')
 async def instances():
-    instances, images, flavors, networks, security_groups, keypairs = await asyncio.gather(
-        asyncio.to_thread(osc.list_servers_detailed),
-        asyncio.to_thread(osc.list_images),
-        asyncio.to_thread(osc.list_flavors),
-        asyncio.to_thread(osc.list_networks),
-        asyncio.to_thread(osc.list_security_groups),
-        asyncio.to_thread(osc.list_keypairs)
+    # Shell trả về ngay, form / bảng được tải song song qua fragment endpoint.
+    # ?full=1 (fallback <noscript>) render cả trang trong một lần như trước.
+    if request.args.get('full') != '1':
+        return render_template('instances.html', inline=False)
+
+    (form, table) = await asyncio.gather(instance_form_context(), instance_table_context())
+    return render_template('instances.html', inline=True, **form, **table)
+
+
+async def instance_form_context():
+    """Dữ liệu cho form Create Instance (image, flavor, network, SG, keypair)."""
+    images, flavors, networks, security_groups, keypairs = await asyncio.gather(
+        fetch_inventory("images", "image", osc.list_images),
+        fetch_inventory("flavors", "compute", osc.list_flavors),
+        fetch_inventory("networks", "network", osc.list_networks, save=False),
+        fetch_inventory("security_groups", "network", osc.list_security_groups),
+        fetch_inventory("keypairs", "compute", osc.list_keypairs)
     )
-    return render_template(
-        'instances.html',
-        instances=instances,
-        images=images,
-        flavors=flavors,
-        networks=networks,
-        security_groups=security_groups,
-        keypairs=keypairs
+    return dict(images=images, flavors=flavors, networks=networks,
+                security_groups=security_groups, keypairs=keypairs)
+
+
+async def instance_table_context():
+    """Dữ liệu cho bảng instances — chỉ trang được yêu cầu, lọc / sort trên index trong RAM."""
+    servers = await fetch_inventory("servers", "compute", osc.list_servers_detailed)
+    index = server_index()
+    index.update(servers)
+    query = instance_query_args()
+    page_items, total = index.query(**query)
+    return dict(
+        instances=page_items,
+        total=total,
+        query=query,
+        pages=max(1, -(-total // query['page_size'])),
+        facets=index.facets(),
     )
 
 
+def render_fragment(template, max_age, **context):
+    """Render một fragment HTML kèm Cache-Control riêng + ETag (If-None-Match => 304)."""
+    response = app.make_response(render_template(template, **context))
+    # Dữ liệu lấy từ snapshot (degraded) thì không cho browser giữ lại
+    age = 0 if getattr(g, "data_as_of", None) else max_age
+    response.headers["Cache-Control"] = f"private, max-age={age}, must-revalidate"
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+@app.route('/instances/fragment/form')
+async def instances_form_fragment():
+    # Image / flavor / network / keypair ít thay đổi => cache ngắn phía browser
+    return render_fragment('_instances_form.html', 60, **await instance_form_context())
+
+
+@app.route('/instances/fragment/table')
+async def instances_table_fragment():
+    # Trạng thái server đổi liên tục => luôn revalidate (ETag vẫn tiết kiệm băng thông)
+    return render_fragment('_instances_table.html', 0, **await instance_table_context())
+
+
+@app.template_global()
+def url_with_args(endpoint=None, **changes):
+    """URL của `endpoint` (mặc định trang hiện tại) giữ query hiện tại, thay một số arg (phân trang, sort)."""
+    args = request.args.to_dict()
+    args.update({k: v for k, v in changes.items() if v is not None})
+    if endpoint is None:
+        return url_for(request.endpoint, **request.view_args, **args)
+    return url_for(endpoint, **args)
+
+
+def instance_query_args():
+    """Đọc query string của /instances: q, name, status, network, ip, sort, dir, page, per_page."""
+    args = request.args
+    return {
+        "q": args.get('q', '').strip() or None,
+        "name": args.get('name', '').strip() or None,
+        "status": args.get('status') or None,
+        "network": args.get('network') or None,
+        "ip": args.get('ip', '').strip() or None,
+        "sort": args.get('sort', 'name') if args.get('sort') in SORT_KEYS else 'name',
+        "desc": args.get('dir') == 'desc',
+        "page": max(1, args.get('page', 1, type=int)),
+        "page_size": min(500, max(1, args.get('per_page', 50, type=int))),
+    }
+
+
 @app.route('/create-instance', methods=['POST'])
 async def create_instance():
     name = request.form['name']
@@ -99,17 +632,39 @@ async def create_instance():
     security_group = request.form['security_group']
     key_name = request.form['key_name']
 
-    await asyncio.to_thread(
-        osc.create_instance,
+    wait = request.form.get('wait') == '1'
+
+    requested_at = time.time()
+    server = await upstream(
+        "compute", osc.create_instance,
         name, image, flavor, network_ids, key_name, security_group
     )
-    flash("✅ Instance created successfully!", "success")
+    if wait:
+        # Poll ngoài pool "compute": chờ tới 600s không giữ slot của các trang khác
+        flash_provisioning(await upstream("wait", osc.wait_for_servers, [server['id']], requested_at, 600))
+    else:
+        flash("✅ Instance created successfully!", "success")
     return redirect(url_for('instances'))
 
 
+def flash_provisioning(states):
+    """Tóm tắt kết quả wait_for_servers thành một flash message."""
+    active = [st for st in states.values() if st['status'] == 'ACTIVE']
+    failed = len(states) - len(active)
+    msg = f"⏱️ {len(active)}/{len(states)} instance(s) ACTIVE"
+    if active:
+        msg += f" (slowest {max(st['seconds_to_active'] for st in active):.0f}s)"
+    if failed:
+        msg += f", {failed} not ACTIVE: " + ", ".join(
+            f"{sid[:8]}={st['status']}{' (timeout)' if st['timed_out'] else ''}"
+            for sid, st in states.items() if st['status'] != 'ACTIVE'
+        )
+    flash(msg, "success" if not failed else "warning")
+
+
 @app.route('/delete-instance/<id>')
 async def delete_instance(id):
-    await asyncio.to_thread(osc.delete_instance, id)
+    await upstream("compute", osc.delete_instance, id)
     flash("🗑️ Instance deleted!", "warning")
     return redirect(url_for('instances'))
 
@@ -120,13 +675,33 @@ async def delete_instance(id):
 @app.route('/assign-floating-ip/<instance_id>', methods=['POST'])
 async def assign_floating_ip(instance_id):
     try:
-        await asyncio.to_thread(osc.assign_floating_ip, instance_id)
+        await upstream("network", osc.assign_floating_ip, instance_id)
         flash("🌐 Floating IP assigned successfully!", "success")
+    except ServiceBusy:
+        raise  # 503 + Retry-After (service_busy)
     except Exception as e:
         flash(f"⚠️ Failed to assign Floating IP: {e}", "danger")
     return redirect(url_for('instances'))
 
 
+@app.route('/assign-floating-ips', methods=['POST'])
+async def assign_floating_ips_bulk():
+    base_name = request.form.get('base_name', '').strip() or None
+    instance_ids = request.form.getlist('instance_ids')
+    try:
+        # Điều phối trong "batch", từng POST / PUT đi qua giới hạn của "network"
+        mapping = await upstream("batch", osc.assign_floating_ips_bulk, instance_ids, base_name, 8,
+                                 functools.partial(executor.submit, "network"))
+        assigned = {iid: ip for iid, ip in mapping.items() if ip}
+        flash(f"🌐 Assigned floating IPs to {len(assigned)}/{len(mapping)} instance(s): "
+              + ", ".join(assigned.values()), "success" if len(assigned) == len(mapping) else "warning")
+    except ServiceBusy:
+        raise  # 503 + Retry-After (service_busy)
+    except Exception as e:
+        flash(f"⚠️ Failed to assign Floating IPs: {e}", "danger")
+    return redirect(url_for('instances'))
+
+
 # ======================
 # SCALE (ASYNC)
 # ======================
@@ -142,36 +717,61 @@ async def scale():
             network_id = request.form['network_id'].strip()
             key_name = request.form['key_name'].strip()
             target_count = int(request.form['target_count'])
+            wait = request.form.get('wait') == '1'
+            on_quota = 'clamp' if request.form.get('on_quota') == 'clamp' else 'reject'
+
+            if request.form.get('managed') == '1':
+                # Giao cho autoscaler giữ group ở kích thước này (tạo / thay server lỗi tự động)
+                error = autoscaler_denied(base_name)
+                if error:
+                    flash(error, "danger")
+                    return redirect(url_for('scale'))
+                autoscaler.set_group(scale_group_spec(request.form, autoscaler_project()))
+                autoscaler.start()
+                flash(f"🔁 Autoscaler now keeps '{base_name}' at {target_count} instance(s).", "success")
+                return redirect(url_for('autoscaler_status'))
 
             try:
-                await asyncio.to_thread(
-                    osc.scale_up_instances,
-                    base_name, image, flavor, network_id, key_name, target_count
+                requested_at = time.time()
+                created = await upstream(
+                    "compute", osc.scale_up_instances,
+                    base_name, image, flavor, network_id, key_name, target_count, False, 600, on_quota
                 )
-                flash(f"✅ Scaled UP to {target_count} instance(s) successfully!", "success")
+                if wait and created:
+                    # Poll ngoài pool "compute": chờ tới 600s không giữ slot của các trang khác
+                    flash_provisioning(await upstream("wait", osc.wait_for_servers, created, requested_at, 600))
+                else:
+                    flash(f"✅ Scaled UP to {target_count} instance(s) successfully!", "success")
+            except ServiceBusy:
+                raise  # 503 + Retry-After (service_busy)
             except Exception as e:
                 flash(f"⚠️ Failed to scale up: {str(e)}", "danger")
 
         elif action == 'scale_down':
-            target_count = int(request.form['target_count'])  # chỉ cần target_count, không cần base_name
+            base_name = request.form['base_name'].strip()
+            target_count = int(request.form['target_count'])
 
             try:
-                await asyncio.to_thread(
-                    osc.scale_down_instances,
-                    "",  # giữ placeholder cho base_name để tương thích
+                await upstream(
+                    "compute", osc.scale_down_instances,
+                    base_name,
                     target_count
                 )
-                flash(f"🗑️ Scaled DOWN to {target_count} instance(s).", "warning")
+                flash(f"🗑️ Scaled DOWN '{base_name}' to {target_count} instance(s).", "warning")
+            except ServiceBusy:
+                raise  # 503 + Retry-After (service_busy)
             except Exception as e:
                 flash(f"⚠️ Failed to scale down: {str(e)}", "danger")
 
         return redirect(url_for('instances'))
 
     # Nếu GET, hiển thị form và load danh sách thông tin
-    images = await asyncio.to_thread(osc.list_images)
-    flavors = await asyncio.to_thread(osc.list_flavors)
-    networks = await asyncio.to_thread(osc.list_networks)
-    keypairs = await asyncio.to_thread(osc.list_keypairs)
+    images, flavors, networks, keypairs = await asyncio.gather(
+        fetch_inventory("images", "image", osc.list_images),
+        fetch_inventory("flavors", "compute", osc.list_flavors),
+        fetch_inventory("networks", "network", osc.list_networks, save=False),
+        fetch_inventory("keypairs", "compute", osc.list_keypairs),
+    )
 
     return render_template(
         'scale.html',
@@ -181,6 +781,131 @@ async def scale():
         keypairs=keypairs
     )
 
+# ======================
+# USAGE (vCPU / RAM / disk theo flavor, image, status, network)
+# ======================
+async def project_usage():
+    servers, flavors, images = await asyncio.gather(
+        fetch_inventory("servers", "compute", osc.list_servers_detailed),
+        fetch_inventory("flavors", "compute", osc.list_flavors),
+        fetch_inventory("images", "image", osc.list_images),
+    )
+    aggregator = usage_aggregator()
+    aggregator.update(servers, flavors, images)
+    return aggregator.snapshot()
+
+
+@app.route('/usage')
+async def usage():
+    return render_template('usage.html', usage=await project_usage())
+
+
+@app.route('/api/usage')
+async def usage_api():
+    return jsonify(await project_usage())
+
+
+# ======================
+# TOPOLOGY (network → subnet → router → instance, reachability)
+# ======================
+async def project_topology():
+    topo, servers = await asyncio.gather(
+        upstream("network", osc.get_topology),
+        fetch_inventory("servers", "compute", osc.list_servers_detailed),
+    )
+    return topo.to_dict({s.id: s.name for s in servers})
+
+
+@app.route('/topology')
+async def topology():
+    return render_template('topology.html', topology=await project_topology())
+
+
+@app.route('/api/topology')
+async def topology_api():
+    return jsonify(await project_topology())
+
+
+# ======================
+# AUTOSCALER (desired size + reconcile loop)
+# ======================
+# Loop khởi động khi có group đầu tiên (hoặc ngay lúc start nếu store đã có group từ lần chạy trước).
+# Desired state nằm trong OSC_AUTOSCALER_PATH (SQLite) dùng chung cho mọi worker; chỉ worker giữ lease
+# mới reconcile. OSC_AUTOSCALER_BACKEND=fake => backend giả lập trong RAM.
+# Mỗi group gắn project của người tạo; reconcile dùng tài khoản dịch vụ nên chỉ user của project
+# tài khoản đó được đặt / sửa / gỡ group, và chỉ thấy group của project mình (autoscaler_denied).
+_autoscaler_interval = float(os.environ.get("OSC_AUTOSCALER_INTERVAL", "15"))
+autoscaler = Autoscaler(
+    FakeComputeBackend() if os.environ.get("OSC_AUTOSCALER_BACKEND") == "fake" else OpenStackComputeBackend(osc),
+    interval=_autoscaler_interval,
+    cooldown=float(os.environ.get("OSC_AUTOSCALER_COOLDOWN", "30")),
+    store=SpecStore(
+        os.environ.get("OSC_AUTOSCALER_PATH", os.path.join(app.instance_path, "autoscaler.db")),
+        lease_seconds=max(60.0, _autoscaler_interval * 4),
+    ),
+)
+if autoscaler.groups():
+    autoscaler.start()
+
+
+def scale_group_spec(form, project_id):
+    return ScaleGroupSpec(
+        base_name=form['base_name'].strip(),
+        desired=int(form.get('desired', form.get('target_count'))),
+        image=form['image'].strip(),
+        flavor=form['flavor'].strip(),
+        network_id=form['network_id'].strip(),
+        key_name=form['key_name'].strip(),
+        project_id=project_id,
+    )
+
+
+def autoscaler_project():
+    """Project của caller: user đang đăng nhập, hoặc tài khoản dịch vụ khi không bật OSC_USER_AUTH."""
+    user = g.get("user")
+    return user["project_id"] if user else autoscaler.backend.project_id()
+
+
+def autoscaler_denied(base_name):
+    """
+    Lý do caller không được đặt / sửa / gỡ group `base_name` (None = được).
+    Autoscaler tạo / xoá server bằng tài khoản dịch vụ => chỉ project của tài khoản đó quản lý group,
+    và chỉ group của chính project mình.
+    """
+    project_id = autoscaler_project()
+    if project_id != autoscaler.backend.project_id():
+        return "❌ Managed scale groups are only available in the autoscaler's project"
+    owner = autoscaler.owner(base_name)
+    if owner is not None and owner != project_id:
+        return f"❌ Scale group '{base_name}' belongs to another project"
+    return None
+
+
+@app.route('/autoscaler', methods=['GET', 'POST'])
+def autoscaler_status():
+    """GET: group (của project caller), quyết định và thời gian các vòng reconcile. POST (JSON): đặt desired."""
+    if request.method == 'POST':
+        try:
+            spec = scale_group_spec(request.get_json(force=True), autoscaler_project())
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify(error=f"❌ Invalid scale group: {e}"), 400
+        error = autoscaler_denied(spec.base_name)
+        if error:
+            return jsonify(error=error), 403
+        autoscaler.set_group(spec)
+        autoscaler.start()
+    return jsonify(autoscaler.status(autoscaler_project()))
+
+
+@app.route('/autoscaler/<base_name>/remove', methods=['POST'])
+def autoscaler_remove(base_name):
+    error = autoscaler_denied(base_name)
+    if error:
+        return jsonify(error=error), 403
+    autoscaler.remove_group(base_name)
+    return jsonify(autoscaler.status(autoscaler_project()))
+
+
 # ======================
 # KEYPAIR MANAGEMENT (ASYNC)
 # ======================
@@ -188,69 +913,85 @@ async def scale():
 @app.route('/keypair', methods=['GET'])
 async def keypair():
     """Display all keypairs"""
-    keypairs = await asyncio.to_thread(osc.list_keypairs)
+    keypairs = await fetch_inventory("keypairs", "compute", osc.list_keypairs)
     return render_template('keypair.html', keypairs=keypairs)
 
 @app.route('/create-keypair', methods=['POST'])
 async def create_keypair():
     key_name = request.form['key_name'].strip()
+    key_type = request.form.get('key_type') or None  # None => Nova tự sinh key
 
     try:
-        keypair = await asyncio.to_thread(osc.create_keypair, key_name)
-
-        # Write private key to temporary file
-        file_path = f"/tmp/{key_name}.pem"
-        with open(file_path, "w") as f:
-            f.write(keypair.private_key)
-        os.chmod(file_path, 0o600)
+        keypair = await upstream("compute", osc.create_keypair, key_name, key_type)
 
-        # Save filename in session for download
-        session['download_key_file'] = file_path
-        session['download_key_name'] = key_name
+        # Keep the private key in memory only, session holds an opaque token
+        old_token = session.pop('download_key_token', None)
+        if old_token:
+            private_keys.discard(old_token)
+        if keypair.get('private_key'):
+            session['download_key_token'] = private_keys.put(key_name, keypair['private_key'])
+            session['download_key_name'] = key_name
+            session['download_key_expires'] = time.time() + KEY_TTL
 
         flash(f"✅ Keypair '{key_name}' created successfully! Click the download button below.", "success")
         return redirect(url_for('keypair'))
 
+    except ServiceBusy:
+        raise  # 503 + Retry-After (service_busy)
     except Exception as e:
         flash(f"⚠️ Failed to create keypair: {str(e)}", "danger")
         return redirect(url_for('keypair'))
 
 @app.route('/download-keypair')
 async def download_keypair():
-    file_path = session.get('download_key_file')
-    key_name = session.get('download_key_name')
-
-    # If the file no longer exists, clear session + notify user
-    if not file_path or not os.path.exists(file_path):
-        session.pop('download_key_file', None)
-        session.pop('download_key_name', None)
-        flash("⚠️ Keypair file not found or already deleted.", "warning")
+    token = session.get('download_key_token')
+    item = private_keys.pop(token) if token else None
+
+    if item is None:
+        if token and session.get('download_key_expires', 0) > time.time():
+            # Chưa hết hạn nhưng không có ở worker này: giữ token để lần thử sau tới đúng worker
+            flash("⚠️ Private key is held by another app worker; retry the download "
+                  "(multi-worker deployments need sticky sessions).", "warning")
+            return redirect(url_for('keypair'))
+        # Expired, already downloaded or never created
+        for k in ('download_key_token', 'download_key_name', 'download_key_expires'):
+            session.pop(k, None)
+        flash("⚠️ Private key not found, expired or already downloaded.", "warning")
         return redirect(url_for('keypair'))
 
-    # Send file and clean up
-    response = await asyncio.to_thread(send_file, file_path, as_attachment=True)
-    os.remove(file_path)
-    session.pop('download_key_file', None)
-    session.pop('download_key_name', None)
-    return response
+    # Chỉ xoá token khỏi session khi đã lấy được key
+    for k in ('download_key_token', 'download_key_name', 'download_key_expires'):
+        session.pop(k, None)
+
+    key_name, pem = item
+    return Response(
+        pem,
+        mimetype="application/x-pem-file",
+        headers={
+            "Content-Disposition": f'attachment; filename="{key_name}.pem"',
+            "Cache-Control": "no-store",
+        },
+    )
 
 @app.route('/delete-keypair/<name>', methods=['POST'])
 async def delete_keypair(name):
     try:
-        await asyncio.to_thread(osc.delete_keypair, name)
+        await upstream("compute", osc.delete_keypair, name)
         flash(f"🗑️ Keypair '{name}' deleted successfully!", "success")
 
         # ✅ Remove download info if this keypair was the one downloaded
         if session.get('download_key_name') == name:
-            session.pop('download_key_file', None)
+            private_keys.discard(session.pop('download_key_token', None))
             session.pop('download_key_name', None)
+            session.pop('download_key_expires', None)
 
+    except ServiceBusy:
+        raise  # 503 + Retry-After (service_busy)
     except Exception as e:
         flash(f"⚠️ Failed to delete keypair: {str(e)}", "danger")
 
     return redirect(url_for('keypair'))
 
 
-
 if __name__ == '__main__':
     app.run(debug=True)
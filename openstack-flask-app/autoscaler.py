@@ -0,0 +1,467 @@
+import contextvars
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+
+import oplog
+
+
+@dataclass
+class ScaleGroupSpec:
+    """Kích thước mong muốn của một scale group + cấu hình để tạo thành viên mới."""
+    base_name: str
+    desired: int
+    image: str
+    flavor: str
+    network_id: str
+    key_name: str
+    security_group: str = "nhom07_secgr"
+    # Project sở hữu group ("" = spec cũ, coi như project của backend). Backend tạo / xoá server
+    # bằng một tài khoản duy nhất => chỉ group của đúng project đó được reconcile.
+    project_id: str = ""
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def _age_seconds(created, now):
+    if not created:
+        return 0.0
+    try:
+        ts = datetime.strptime(created, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        return 0.0
+    return now - ts
+
+
+def _member_index(base_name, name):
+    return int(name[len(base_name) + 1:])
+
+
+# ======================
+# COMPUTE BACKENDS
+# ======================
+class OpenStackComputeBackend:
+    """Backend thật: mọi thao tác đi qua openstack_client."""
+
+    def __init__(self, osc):
+        self.osc = osc
+
+    def project_id(self):
+        """Project mà backend tạo / xoá server trong đó (tài khoản dịch vụ trong clouds.yaml)."""
+        # Context rỗng: không mang conn của user / target của request đang gọi
+        return contextvars.Context().run(lambda: self.osc.get_conn()["project_id"])
+
+    def list_groups(self, base_names):
+        return self.osc.list_scale_groups(base_names)
+
+    def create(self, spec, name):
+        server = self.osc.create_instance(
+            name=name,
+            image=spec.image,
+            flavor=spec.flavor,
+            network_ids=[spec.network_id],
+            key_name=spec.key_name,
+            security_group=spec.security_group,
+            metadata={self.osc.SCALE_GROUP_KEY: spec.base_name},
+        )
+        return server["id"]
+
+    def delete(self, server_id):
+        self.osc.delete_instance(server_id)
+
+
+class FakeComputeBackend:
+    """
+    Backend giả lập trong RAM để test autoscaler không cần OpenStack:
+    server ở BUILD `build_seconds` giây rồi ACTIVE; với xác suất `error_rate`
+    (lấy theo thứ tự tất định mỗi `1/error_rate` lần tạo) server rơi vào ERROR,
+    `stuck_every` > 0 => cứ n server thì một server kẹt ở BUILD.
+    `latency` giây được thêm vào mỗi lời gọi.
+    """
+
+    def __init__(self, build_seconds=1.0, error_rate=0.0, stuck_every=0, latency=0.0, project_id="fake-project"):
+        self._project_id = project_id
+        self.build_seconds = build_seconds
+        self.error_rate = error_rate
+        self.stuck_every = stuck_every
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._servers = {}
+        self._created = itertools.count(1)
+        self.calls = {"list": 0, "create": 0, "delete": 0}
+
+    def _status(self, server, now):
+        if server["fate"] == "error":
+            return "ERROR"
+        if server["fate"] == "stuck" or now - server["t"] < self.build_seconds:
+            return "BUILD"
+        return "ACTIVE"
+
+    def project_id(self):
+        return self._project_id
+
+    def list_groups(self, base_names):
+        time.sleep(self.latency)
+        now = time.time()
+        with self._lock:
+            self.calls["list"] += 1
+            groups = {b: [] for b in base_names}
+            for s in self._servers.values():
+                base = s["name"].rsplit("_", 1)[0]
+                if base in groups:
+                    groups[base].append({
+                        "id": s["id"], "name": s["name"], "status": self._status(s, now),
+                        "created": s["created"], "group": base,
+                    })
+        for base, items in groups.items():
+            items.sort(key=lambda m: _member_index(base, m["name"]))
+        return groups
+
+    def create(self, spec, name):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls["create"] += 1
+            n = next(self._created)
+            fate = "ok"
+            if self.error_rate and n % max(1, round(1 / self.error_rate)) == 0:
+                fate = "error"
+            elif self.stuck_every and n % self.stuck_every == 0:
+                fate = "stuck"
+            sid = uuid.uuid4().hex
+            self._servers[sid] = {
+                "id": sid, "name": name, "fate": fate, "t": time.time(),
+                "created": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            }
+            return sid
+
+    def delete(self, server_id):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls["delete"] += 1
+            self._servers.pop(server_id, None)
+
+    def backdate(self, seconds):
+        """Lùi thời điểm tạo của mọi server (test server kẹt BUILD quá build_timeout)."""
+        with self._lock:
+            for s in self._servers.values():
+                ts = datetime.strptime(s["created"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp()
+                s["created"] = datetime.fromtimestamp(ts - seconds, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+# ======================
+# RATE LIMITER
+# ======================
+class _RateLimiter:
+    """Token bucket dùng chung cho mọi thao tác create / delete (`rate` thao tác/giây)."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# ======================
+# DESIRED STATE + LEADER LEASE (SQLite)
+# ======================
+class SpecStore:
+    """
+    Desired size của các group trên đĩa (sống qua restart) + lease bầu MỘT reconciler:
+    mọi gunicorn worker cùng đọc một danh sách group, nhưng chỉ worker giữ lease mới tạo / xoá server.
+    """
+
+    def __init__(self, path, lease_seconds=60.0):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._local = threading.local()
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS scale_groups (base_name TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        db.execute("CREATE TABLE IF NOT EXISTS leases "
+                   "(name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)")
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            self._local.db = db
+        return db
+
+    def put(self, spec):
+        self._db().execute("INSERT OR REPLACE INTO scale_groups (base_name, data) VALUES (?, ?)",
+                           (spec.base_name, json.dumps(spec.to_dict())))
+
+    def delete(self, base_name):
+        self._db().execute("DELETE FROM scale_groups WHERE base_name = ?", (base_name,))
+
+    def load(self):
+        rows = self._db().execute("SELECT data FROM scale_groups ORDER BY base_name").fetchall()
+        specs = [ScaleGroupSpec(**json.loads(data)) for (data,) in rows]
+        return {spec.base_name: spec for spec in specs}
+
+    def acquire_leader(self, name="autoscaler"):
+        """Giữ / gia hạn lease `name`; True nếu process này là reconciler."""
+        now = time.time()
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM leases WHERE name = ? AND (expires_at <= ? OR owner = ?)", (name, now, self.owner))
+            db.execute("INSERT OR IGNORE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)",
+                       (name, self.owner, now + self.lease_seconds))
+            row = db.execute("SELECT owner FROM leases WHERE name = ?", (name,)).fetchone()
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return row is not None and row[0] == self.owner
+
+    def release_leader(self, name="autoscaler"):
+        self._db().execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, self.owner))
+
+
+# ======================
+# AUTOSCALER (reconcile loop)
+# ======================
+class Autoscaler:
+    """
+    Giữ kích thước mong muốn (desired) cho từng scale group và reconcile định kỳ:
+    1. MỘT lời gọi list cho tất cả group (actual),
+    2. diff với desired: thiếu => tạo, thừa => xoá số thứ tự lớn nhất,
+       server ERROR hoặc BUILD quá `build_timeout` giây => xoá và tạo server thay thế,
+    3. thực thi song song (tối đa `max_parallel` thao tác, `rate` thao tác/giây,
+       mỗi group tối đa `max_batch` thao tác mỗi vòng),
+    4. group vừa thay đổi thì chỉ được tiếp tục cùng chiều; đổi chiều hoặc thay server lỗi
+       phải chờ `cooldown` giây.
+    Các quyết định + thời gian mỗi vòng được giữ lại cho /autoscaler.
+    Có `store` (SpecStore): desired state đọc từ store mỗi vòng và chỉ process giữ lease reconcile;
+    không có: chỉ trong RAM của process này.
+    """
+
+    def __init__(self, backend, interval=15.0, max_parallel=8, rate=5.0, max_batch=10,
+                 cooldown=30.0, build_timeout=900.0, history=200, store=None):
+        self.backend = backend
+        self.store = store
+        self.leader = store is None
+        self.interval = interval
+        self.max_batch = max_batch
+        self.cooldown = cooldown
+        self.build_timeout = build_timeout
+        self._limiter = _RateLimiter(rate, burst=max_parallel)
+        self._pool = ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="autoscaler")
+        self._lock = threading.Lock()
+        self._groups = {}
+        self._last_change = {}
+        self._decisions = deque(maxlen=history)
+        self._rounds = deque(maxlen=history)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---------- desired state ----------
+    def set_group(self, spec):
+        if self.store is not None:
+            self.store.put(spec)
+        with self._lock:
+            self._groups[spec.base_name] = spec
+        self._wake.set()  # reconcile ngay thay vì chờ hết interval
+
+    def remove_group(self, base_name):
+        """Ngừng quản lý group (không xoá server)."""
+        if self.store is not None:
+            self.store.delete(base_name)
+        with self._lock:
+            self._groups.pop(base_name, None)
+            self._last_change.pop(base_name, None)
+
+    def _sync_groups(self):
+        # Store là nguồn duy nhất: group do worker khác đặt / gỡ cũng được thấy ở đây
+        if self.store is not None:
+            groups = self.store.load()
+            with self._lock:
+                self._groups = groups
+
+    def groups(self):
+        self._sync_groups()
+        with self._lock:
+            return {name: spec.to_dict() for name, spec in self._groups.items()}
+
+    def owner(self, base_name):
+        """Project sở hữu group `base_name` (None nếu chưa có group này)."""
+        self._sync_groups()
+        with self._lock:
+            spec = self._groups.get(base_name)
+        if spec is None:
+            return None
+        return spec.project_id or self.backend.project_id()
+
+    # ---------- loop ----------
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="autoscaler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self.store is not None and self.leader:
+            self.store.release_leader()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.reconcile_once()
+            except Exception as e:
+                oplog.error("⚠️ Autoscaler round failed", op="autoscaler", error=str(e))
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def reconcile_once(self):
+        """Một vòng reconcile; trả về danh sách quyết định của vòng này."""
+        started = time.monotonic()
+        self._sync_groups()
+        with self._lock:
+            groups = dict(self._groups)
+            last_changes = dict(self._last_change)
+        if not groups:
+            return []
+        if self.store is not None:
+            self.leader = self.store.acquire_leader()
+            if not self.leader:
+                return []  # worker khác đang reconcile
+        # Group của project khác không bao giờ được tạo / xoá server bằng tài khoản của backend
+        project_id = self.backend.project_id()
+        groups = {name: spec for name, spec in groups.items() if (spec.project_id or project_id) == project_id}
+        if not groups:
+            return []
+
+        t = time.monotonic()
+        actual = self.backend.list_groups(list(groups))
+        list_seconds = time.monotonic() - t
+
+        now = time.time()
+        plans = [self._plan(spec, actual.get(name, []), now, last_changes) for name, spec in groups.items()]
+
+        # Tất cả thao tác của mọi group chạy song song trên cùng pool (bị chặn bởi rate limiter)
+        jobs = []
+        for plan in plans:
+            for name in plan.pop("_create"):
+                jobs.append((plan, "created", self._pool.submit(self._do, self.backend.create, groups[plan["group"]], name)))
+            for member in plan.pop("_delete"):
+                jobs.append((plan, "deleted", self._pool.submit(self._do, self.backend.delete, member["id"])))
+        for plan, field, future in jobs:
+            try:
+                future.result()
+                plan[field] += 1
+            except Exception as e:
+                plan["errors"].append(str(e))
+
+        finished = time.time()
+        with self._lock:
+            for plan in plans:
+                if plan["created"] or plan["deleted"]:
+                    self._last_change[plan["group"]] = (finished, plan["action"])
+                plan["seconds"] = round(time.monotonic() - started, 3)
+                if plan["action"] != "noop":
+                    self._decisions.append(plan)  # vòng không có gì đổi chỉ ghi vào _rounds
+                    oplog.info(f"🔁 Autoscaler {plan['action']} '{plan['group']}'", op="autoscaler",
+                               **{k: v for k, v in plan.items() if k not in ("at", "group")}, group=plan["group"])
+            self._rounds.append({
+                "at": finished,
+                "groups": len(groups),
+                "operations": len(jobs),
+                "converged": sum(p["action"] == "noop" for p in plans),
+                "list_seconds": round(list_seconds, 3),
+                "seconds": round(time.monotonic() - started, 3),
+            })
+        return plans
+
+    def _do(self, fn, *args):
+        self._limiter.acquire()
+        return fn(*args)
+
+    def _plan(self, spec, members, now, last_changes):
+        failed = [
+            m for m in members
+            if m["status"] == "ERROR"
+            or (m["status"] == "BUILD" and _age_seconds(m["created"], now) > self.build_timeout)
+        ]
+        failed_ids = {m["id"] for m in failed}
+        healthy = [m for m in members if m["id"] not in failed_ids]
+
+        plan = {
+            "group": spec.base_name, "at": now, "desired": spec.desired, "actual": len(members),
+            "healthy": len(healthy), "failed": len(failed), "action": "noop",
+            "created": 0, "deleted": 0, "errors": [], "_create": [], "_delete": [],
+        }
+
+        to_delete = list(failed)
+        missing = spec.desired - len(healthy)
+        if missing < 0:
+            to_delete += healthy[missing:]  # số thứ tự lớn nhất (mới nhất) trước
+        to_delete = to_delete[:self.max_batch]
+
+        next_index = max((_member_index(spec.base_name, m["name"]) for m in members), default=0) + 1
+        to_create = [f"{spec.base_name}_{next_index + i}" for i in range(min(max(missing, 0), self.max_batch))]
+
+        if failed:
+            plan["action"] = "replace"
+        elif to_create:
+            plan["action"] = "scale_up"
+        elif to_delete:
+            plan["action"] = "scale_down"
+        else:
+            return plan
+
+        # Cooldown: cùng chiều với lần thay đổi trước thì làm tiếp ngay (hội tụ nhanh theo batch),
+        # đổi chiều hoặc thay server lỗi thì chờ hết cooldown (tránh flapping / tạo-xoá liên tục)
+        last_at, last_action = last_changes.get(spec.base_name, (0, None))
+        if now - last_at < self.cooldown and (plan["action"] == "replace" or plan["action"] != last_action):
+            plan["action"] = "cooldown"
+            return plan
+
+        plan["_create"], plan["_delete"] = to_create, to_delete
+        return plan
+
+    # ---------- status ----------
+    def status(self, project_id=None):
+        """Trạng thái loop; có `project_id` => chỉ group (và quyết định) của project đó."""
+        self._sync_groups()
+        backend_project = self.backend.project_id() if project_id is not None else None
+        with self._lock:
+            groups = {name: spec for name, spec in self._groups.items()
+                      if project_id is None or (spec.project_id or backend_project) == project_id}
+            return {
+                "running": self._thread is not None and not self._stop.is_set(),
+                "leader": self.leader,
+                "interval": self.interval,
+                "cooldown": self.cooldown,
+                "build_timeout": self.build_timeout,
+                "groups": {name: spec.to_dict() for name, spec in groups.items()},
+                "rounds": list(self._rounds)[-20:],
+                "decisions": [d for d in self._decisions if d["group"] in groups][-50:],
+            }
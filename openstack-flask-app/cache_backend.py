@@ -0,0 +1,278 @@
+import hashlib
+import hmac
+import os
+import pickle
+import secrets
+import sqlite3
+import stat
+import threading
+import time
+import uuid
+
+# Mặc định: thư mục instance/ cạnh app (giống Flask app.instance_path), không phải /tmp dùng chung
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance")
+
+
+# ======================
+# IN-PROCESS BACKEND
+# ======================
+class InProcessCache:
+    """
+    Cache trong RAM của một process (mặc định).
+    Mỗi key có một lock riêng => chỉ một thread refresh, các thread khác chờ kết quả.
+    Mỗi `sweep_interval` giây, lần set() kế tiếp dọn key đã hết hạn (và lock không còn dùng),
+    để key theo từng project / user không tích luỹ mãi.
+    """
+
+    shared = False  # chỉ process này thấy
+
+    def __init__(self, sweep_interval=60):
+        self._items = {}  # key -> (expires_at, value)
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.time() + sweep_interval
+
+    def get(self, key):
+        entry = self._items.get(key)
+        if entry and entry[0] > time.time():
+            return entry[1]
+        return None
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        self._items[key] = (now + ttl, value)
+        if now >= self._next_sweep:
+            self._sweep(now)
+
+    def delete(self, key):
+        self._items.pop(key, None)
+
+    def _sweep(self, now):
+        with self._lock:
+            self._next_sweep = now + self.sweep_interval
+            for key, entry in list(self._items.items()):
+                # pop có điều kiện: thread khác có thể vừa set bản mới cho key này
+                if entry[0] <= now and self._items.get(key) is entry:
+                    self._items.pop(key, None)
+            for key, key_lock in list(self._locks.items()):
+                if key not in self._items and not key_lock.locked():
+                    del self._locks[key]
+
+    def get_or_refresh(self, key, ttl, loader, max_stale=None):
+        """
+        Trả về value còn hạn, nếu không thì gọi loader() (chỉ một thread/key).
+        `ttl` là số giây hoặc hàm ttl(value) -> số giây.
+        `max_stale` chỉ để cùng chữ ký với SQLiteCache: ở đây không bao giờ trả bản cũ.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        with key_lock:
+            value = self.get(key)
+            if value is not None:
+                return value
+            value = loader()
+            self.set(key, value, ttl(value) if callable(ttl) else ttl)
+            return value
+
+
+# ======================
+# SHARED BACKEND (SQLite WAL)
+# ======================
+class SQLiteCache:
+    """
+    Cache dùng chung cho mọi worker (gunicorn) trên cùng một host.
+    - File SQLite ở chế độ WAL: nhiều process đọc song song, một process ghi.
+    - Refresh theo "lease": với mỗi key chỉ một worker được bầu làm refresher,
+      các worker khác trả về bản cũ (nếu có) hoặc chờ kết quả thay vì cùng gọi upstream.
+    - Cache chứa token Keystone: thư mục và file phải thuộc uid của app, không cho group/other
+      (file có sẵn của user khác => từ chối, không dùng). Value được pickle kèm HMAC-SHA256
+      (key trong OSC_CACHE_SECRET hoặc file <path>.key 0600); row sai chữ ký bị coi như miss.
+    - Row đã quá hạn hơn `stale_seconds` được xoá định kỳ khi set().
+    """
+
+    shared = True  # mọi worker trên host cùng thấy
+
+    def __init__(self, path, lease_seconds=30, stale_seconds=300, secret=None, sweep_interval=300):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.stale_seconds = stale_seconds
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.time() + sweep_interval
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._local = threading.local()
+
+        _check_private(os.path.dirname(os.path.abspath(path)), directory=True)
+        # Tạo file với quyền 0600 trước khi SQLite mở; file có sẵn thì kiểm tra owner + quyền
+        fd = os.open(path, os.O_CREAT | os.O_RDWR | os.O_NOFOLLOW, 0o600)
+        try:
+            _check_private(path, st=os.fstat(fd))
+        finally:
+            os.close(fd)
+        self._secret = secret.encode() if isinstance(secret, str) else secret or _load_secret(path + ".key")
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            " key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _get_entry(self, key):
+        row = self._db().execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None, 0
+        blob = bytes(row[0])
+        mac, payload = blob[:32], blob[32:]
+        if not hmac.compare_digest(mac, self._sign(key, payload)):
+            return None, 0  # không phải do app ghi => không unpickle
+        return pickle.loads(payload), row[1]
+
+    def _sign(self, key, payload):
+        # Ký cả key: row hợp lệ của key này không chép sang key khác được
+        return hmac.new(self._secret, key.encode() + b"\0" + payload, hashlib.sha256).digest()
+
+    def get(self, key):
+        value, expires_at = self._get_entry(key)
+        return value if expires_at > time.time() else None
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._db().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, self._sign(key, payload) + payload, now + ttl),
+        )
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_interval
+            self._db().execute("DELETE FROM cache WHERE expires_at < ?", (now - self.stale_seconds,))
+
+    def delete(self, key):
+        self._db().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def _acquire_lease(self, key):
+        now = time.time()
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM leases WHERE key = ? AND expires_at <= ?", (key, now))
+            db.execute(
+                "INSERT OR IGNORE INTO leases (key, owner, expires_at) VALUES (?, ?, ?)",
+                (key, self.owner, now + self.lease_seconds),
+            )
+            row = db.execute("SELECT owner FROM leases WHERE key = ?", (key,)).fetchone()
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return row is not None and row[0] == self.owner
+
+    def _release_lease(self, key):
+        self._db().execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, self.owner))
+
+    def get_or_refresh(self, key, ttl, loader, max_stale=None):
+        """
+        Như InProcessCache.get_or_refresh, nhưng worker không giữ lease được trả bản cũ
+        tối đa `max_stale` giây sau khi hết hạn (mặc định stale_seconds; 0 = không bao giờ,
+        vd. token Keystone đã hết hạn thì vô dụng) — nếu không thì chờ refresher.
+        """
+        max_stale = self.stale_seconds if max_stale is None else max_stale
+        value, expires_at = self._get_entry(key)
+        now = time.time()
+        if value is not None and expires_at > now:
+            return value
+
+        deadline = now + self.lease_seconds
+        while True:
+            if self._acquire_lease(key):
+                try:
+                    value = loader()
+                    self.set(key, value, ttl(value) if callable(ttl) else ttl)
+                    return value
+                finally:
+                    self._release_lease(key)
+
+            # Worker khác đang refresh: trả bản cũ nếu chưa quá max_stale
+            stale, expires_at = self._get_entry(key)
+            if stale is not None and time.time() - expires_at < max_stale:
+                return stale
+            if time.time() > deadline:
+                # Refresher bị treo/chết — tự load và lưu lại để các worker khác không load lại mỗi lần
+                value = loader()
+                self.set(key, value, ttl(value) if callable(ttl) else ttl)
+                return value
+            time.sleep(0.05)
+            fresh = self.get(key)
+            if fresh is not None:
+                return fresh
+
+
+def _check_private(path, directory=False, st=None):
+    """Từ chối path không thuộc uid hiện tại, hoặc cho group/other quyền (thư mục: quyền ghi)."""
+    st = st or os.lstat(path)
+    if stat.S_ISLNK(st.st_mode):
+        raise Exception(f"❌ Refusing cache path {path}: symlink")
+    if st.st_uid != os.getuid():
+        raise Exception(f"❌ Refusing cache path {path}: owned by uid {st.st_uid}, not {os.getuid()}")
+    if st.st_mode & (0o022 if directory else 0o077):
+        raise Exception(f"❌ Refusing cache path {path}: mode {stat.S_IMODE(st.st_mode):o} is too open")
+
+
+def _load_secret(path):
+    """Key HMAC dùng chung cho mọi worker: tạo một lần (0600, atomic), các lần sau đọc lại."""
+    if not os.path.exists(path):
+        tmp = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}"
+        fd = os.open(tmp, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(secrets.token_bytes(32))
+        try:
+            os.link(tmp, path)  # worker khác tạo trước => FileExistsError, dùng key của nó
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp)
+    fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW)
+    try:
+        _check_private(path, st=os.fstat(fd))
+        secret = os.read(fd, 64)
+    finally:
+        os.close(fd)
+    if len(secret) < 32:
+        raise Exception(f"❌ Cache key {path} is truncated")
+    return secret
+
+
+# ======================
+# BACKEND SELECTION
+# ======================
+def create_backend():
+    """
+    OSC_CACHE_BACKEND=memory (mặc định) | sqlite
+    OSC_CACHE_PATH=<file>  (chỉ cho sqlite, mặc định instance/osc-cache.sqlite cạnh app, thư mục 0700)
+    OSC_CACHE_SECRET       (tuỳ chọn) key HMAC; mặc định sinh vào <OSC_CACHE_PATH>.key
+    """
+    kind = os.environ.get("OSC_CACHE_BACKEND", "memory")
+    if kind == "sqlite":
+        path = os.environ.get("OSC_CACHE_PATH")
+        if not path:
+            os.makedirs(DEFAULT_DIR, mode=0o700, exist_ok=True)
+            path = os.path.join(DEFAULT_DIR, "osc-cache.sqlite")
+        return SQLiteCache(path, secret=os.environ.get("OSC_CACHE_SECRET") or None)
+    if kind == "memory":
+        return InProcessCache()
+    raise Exception(f"❌ Unknown OSC_CACHE_BACKEND: {kind}")
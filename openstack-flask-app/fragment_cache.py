@@ -0,0 +1,76 @@
+import threading
+from collections import OrderedDict
+
+from markupsafe import Markup
+
+from models import Network, Server
+
+
+# ======================
+# FINGERPRINTS
+# ======================
+# Fingerprint đổi <=> HTML của dòng phải render lại. Giữ nguyên tuple (so sánh ==), không dùng hash():
+# hai giá trị khác nhau trùng hash sẽ trả về HTML cũ.
+def server_fingerprint(s):
+    # `updated` của Nova không phải lúc nào cũng đổi khi gắn floating IP => thêm status + addresses
+    return (s.updated, s.name, s.status, s.addresses)
+
+
+def network_fingerprint(n):
+    return (n.name, n.status, n.subnets)
+
+
+FINGERPRINTS = {
+    Server: server_fingerprint,
+    Network: network_fingerprint,
+}
+
+
+# ======================
+# RENDERED FRAGMENT CACHE (LRU)
+# ======================
+class FragmentCache:
+    """
+    Cache HTML đã render của từng dòng bảng (server, network), dùng chung cho mọi request / user.
+    Key = (template, resource ID); mỗi key chỉ giữ bản render của fingerprint mới nhất,
+    nên resource thay đổi thì bản cũ bị thay thế chứ không tích luỹ.
+    Quá `max_entries` => bỏ dòng ít dùng nhất (LRU).
+    """
+
+    def __init__(self, env, max_entries=5000):
+        self.env = env
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (template, id) -> (fingerprint, Markup)
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def render(self, template, obj):
+        """HTML của dòng `obj` qua `template` (biến `row` trong template), lấy từ cache nếu không đổi."""
+        fingerprint = FINGERPRINTS.get(type(obj), hash)(obj)
+        key = (template, obj.id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == fingerprint:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[1]
+            self._stats["misses"] += 1
+
+        # Render ngoài lock — hai request cùng render một dòng thì kết quả như nhau
+        html = Markup(self.env.get_template(template).render(row=obj))
+
+        with self._lock:
+            self._entries[key] = (fingerprint, html)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self):
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries), "max_entries": self.max_entries}
@@ -0,0 +1,104 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class _Entry:
+    __slots__ = ("etag", "last_modified", "digest", "result", "size")
+
+    def __init__(self, etag, last_modified, digest, result, size):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.digest = digest
+        self.result = result
+        self.size = size
+
+
+def content_digest(body):
+    return hashlib.blake2b(body, digest_size=16).digest()
+
+
+# ======================
+# CONDITIONAL GET CACHE (LRU, giới hạn theo dung lượng)
+# ======================
+class ConditionalCache:
+    """
+    Kết quả đã parse + chiếu (list model) của các GET dạng list, theo (token scope, URL, params, ...):
+    - lần sau gửi If-None-Match / If-Modified-Since nếu upstream đã trả ETag / Last-Modified;
+      304 => dùng lại kết quả cũ, không tải / decode body,
+    - upstream không có validator => so blake2b của body: giống hệt byte => bỏ qua decode + chiếu,
+      trả về đúng object cũ (code phía sau so sánh bằng `is` / `==` sẽ thấy không đổi).
+    Tổng kích thước body (byte) của các entry tối đa `max_bytes`; vượt => bỏ entry ít dùng nhất.
+    List trả về được dùng chung: caller không được sửa tại chỗ.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_entries=1024):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._stats = {"revalidated": 0, "unchanged": 0, "misses": 0, "evictions": 0}
+
+    def validators(self, key):
+        """Header điều kiện cho request tiếp theo của `key` (rỗng nếu chưa có / không có validator)."""
+        with self._lock:
+            entry = self._entries.get(key)
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def not_modified(self, key):
+        """Kết quả đã cache khi upstream trả 304 (None nếu entry đã bị loại)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["revalidated"] += 1
+            return entry.result
+
+    def lookup(self, key, digest, response):
+        """Kết quả đã cache nếu body của `response` (200) có cùng `digest` với lần trước, ngược lại None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.digest != digest:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            entry.etag = response.headers.get("ETag") or entry.etag
+            entry.last_modified = response.headers.get("Last-Modified") or entry.last_modified
+            self._stats["unchanged"] += 1
+            return entry.result
+
+    def store(self, key, response, result, size, digest=None):
+        """Lưu `result` của `response` (200); `size` = số byte body, `digest` = content_digest nếu có."""
+        etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+        if (digest is None and not etag and not last_modified) or size > self.max_bytes:
+            return  # không có cách nào nhận ra lần sau là "không đổi" / quá lớn
+        entry = _Entry(etag, last_modified, digest, result, size)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._entries and (self._bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def metrics(self):
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries), "bytes": self._bytes,
+                    "max_bytes": self.max_bytes, "max_entries": self.max_entries}
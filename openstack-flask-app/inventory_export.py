@@ -0,0 +1,394 @@
+import argparse
+import contextvars
+import functools
+import gzip
+import json
+import sys
+import threading
+import time
+import zlib
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import oplog
+import openstack_client as osc
+
+
+# ======================
+# FORMAT
+# ======================
+# Một record JSON mỗi dòng, nén gzip. Thứ tự = thứ tự phụ thuộc khi import:
+# meta, network, subnet, router, router_interface, keypair, security_group, server, summary.
+FORMAT_VERSION = 1
+KINDS = ("networks", "routers", "keypairs", "security_groups", "servers")
+
+_ROUTER_INTERFACE_OWNERS = [
+    "network:router_interface",
+    "network:router_interface_distributed",
+    "network:ha_router_replicated_interface",
+]
+
+
+# ======================
+# EXPORT (generator, RAM không đổi theo kích thước project)
+# ======================
+def _network(item):
+    return {
+        "kind": "network", "id": item["id"], "name": item.get("name"), "status": item.get("status"),
+        "external": bool(item.get("router:external")), "shared": bool(item.get("shared")),
+    }
+
+
+def _subnet(item):
+    return {
+        "kind": "subnet", "id": item["id"], "name": item.get("name"), "network_id": item.get("network_id"),
+        "cidr": item.get("cidr"), "ip_version": item.get("ip_version"), "gateway_ip": item.get("gateway_ip"),
+        "enable_dhcp": item.get("enable_dhcp"),
+    }
+
+
+def _router(item):
+    return {
+        "kind": "router", "id": item["id"], "name": item.get("name"), "status": item.get("status"),
+        "external_network_id": (item.get("external_gateway_info") or {}).get("network_id"),
+    }
+
+
+def _router_interface(item):
+    return {
+        "kind": "router_interface", "router_id": item.get("device_id"), "port_id": item["id"],
+        "subnet_ids": [ip.get("subnet_id") for ip in item.get("fixed_ips", [])],
+    }
+
+
+def _keypair(item):
+    kp = item.get("keypair", item)
+    # Chỉ phần public: Nova không bao giờ trả private key khi list
+    return {"kind": "keypair", "name": kp.get("name"), "type": kp.get("type", "ssh"),
+            "fingerprint": kp.get("fingerprint"), "public_key": kp.get("public_key")}
+
+
+def _security_group(item):
+    return {
+        "kind": "security_group", "id": item["id"], "name": item.get("name"),
+        "description": item.get("description"),
+        "rules": [
+            {k: r.get(k) for k in ("direction", "ethertype", "protocol", "port_range_min", "port_range_max",
+                                   "remote_ip_prefix", "remote_group_id")}
+            for r in item.get("security_group_rules", [])
+        ],
+    }
+
+
+def _server(item):
+    addresses = item.get("addresses") or {}
+    return {
+        "kind": "server", "id": item["id"], "name": item.get("name"), "status": item.get("status"),
+        "flavor": (item.get("flavor") or {}).get("id"), "image": (item.get("image") or {}).get("id"),
+        "key_name": item.get("key_name"),
+        "networks": list(addresses),
+        "addresses": [
+            {"network": net, "addr": a.get("addr"), "type": a.get("OS-EXT-IPS:type", "fixed")}
+            for net, addrs in addresses.items() for a in addrs
+        ],
+        "security_groups": sorted({sg.get("name") for sg in item.get("security_groups", []) if sg.get("name")}),
+        "metadata": item.get("metadata") or {},
+        "created": item.get("created"),
+    }
+
+
+def export_records(conn, kinds=KINDS, page_size=None):
+    """
+    Yield từng record của project (dict), đọc upstream theo trang bằng osc.iter_list:
+    chỉ một trang trong RAM tại một thời điểm, kể cả với project rất lớn.
+    """
+    neutron = osc.get_network_endpoint(conn["catalog"])
+    nova = osc.get_compute_endpoint(conn["catalog"])
+    counts = defaultdict(int)
+
+    sources = {
+        "networks": [
+            (f"{neutron}/v2.0/networks", "networks", _network, None),
+            (f"{neutron}/v2.0/subnets", "subnets", _subnet, None),
+        ],
+        "routers": [
+            (f"{neutron}/v2.0/routers", "routers", _router, None),
+            (f"{neutron}/v2.0/ports", "ports", _router_interface, {"device_owner": _ROUTER_INTERFACE_OWNERS}),
+        ],
+        "keypairs": [(f"{nova}/os-keypairs", "keypairs", _keypair, None)],
+        "security_groups": [(f"{neutron}/v2.0/security-groups", "security_groups", _security_group, None)],
+        "servers": [(f"{nova}/servers/detail", "servers", _server, None)],
+    }
+
+    yield {
+        "kind": "meta", "version": FORMAT_VERSION,
+        "cloud": conn.get("cloud", osc.CLOUD_NAME), "region": conn.get("region"),
+        "project": conn.get("project"), "project_id": conn.get("project_id"),
+        "exported_at": time.time(), "kinds": [k for k in KINDS if k in kinds],
+    }
+    for kind in KINDS:
+        if kind not in kinds:
+            continue
+        for url, key, project, params in sources[kind]:
+            for item in osc.iter_list(conn, url, key, f"export {key}", params=params, page_size=page_size):
+                record = project(item)
+                counts[record["kind"]] += 1
+                yield record
+    yield {"kind": "summary", "counts": dict(counts)}
+
+
+def ndjson_lines(records):
+    for record in records:
+        yield (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def gzip_stream(chunks, level=6):
+    """Nén gzip tăng dần: yield phần đã nén ngay khi zlib có dữ liệu ra (dùng cho HTTP streaming)."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 => header / trailer gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# ======================
+# IMPORT (replay network / router / keypair / instance definitions)
+# ======================
+def read_records(path):
+    """Đọc file NDJSON (.gz hoặc không) từng dòng một."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class _Replay:
+    """
+    Replay các định nghĩa trong export lên project hiện tại:
+    - network + subnet, router (+ gateway, interface), keypair (public key), server,
+    - tài nguyên đã tồn tại cùng tên thì bỏ qua (chạy lại được nhiều lần),
+    - ID cũ được ánh xạ sang tài nguyên mới theo tên network / CIDR của subnet,
+    - security group chỉ để audit (không tạo lại), server dùng lại image / flavor ID.
+    Network / router / keypair (ít) được gom rồi replay một lượt; server được đọc stream
+    và tạo song song tối đa `max_workers` cái, không giữ cả file trong RAM.
+    """
+
+    def __init__(self, max_workers=4, dry_run=False):
+        self.max_workers = max_workers
+        self.dry_run = dry_run
+        self.report = defaultdict(lambda: {"created": 0, "skipped": 0, "failed": 0, "errors": []})
+        self.networks = {}                      # old network id -> record
+        self.subnets = defaultdict(list)        # old network id -> [subnet record]
+        self.routers = []
+        self.interfaces = defaultdict(list)     # old router id -> [old subnet id]
+        self.keypairs = []
+        self.subnet_keys = {}                   # old subnet id -> (network name, cidr)
+        self.planned_networks = []              # tên network sẽ được tạo (dry run)
+        self._definitions_done = False
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inventory-import")
+        self._pending = set()
+
+    # ---------- helpers ----------
+    def _count(self, kind, field, error=None):
+        with self._lock:
+            self.report[kind][field] += 1
+            if error:
+                self.report[kind]["errors"].append(error)
+
+    def _run(self, kind, label, fn, *args, **kwargs):
+        try:
+            if not self.dry_run:
+                fn(*args, **kwargs)
+            self._count(kind, "created")
+        except Exception as e:
+            self._count(kind, "failed", f"{label}: {e}")
+            oplog.warning("⚠️ Import step failed", op="inventory_import", kind=kind, name=label, error=str(e))
+
+    def _skip(self, kind):
+        self._count(kind, "skipped")
+
+    def _submit(self, fn, *args, **kwargs):
+        # Giới hạn số job đang chờ => RAM không phụ thuộc số server trong file
+        while len(self._pending) >= self.max_workers * 2:
+            done, self._pending = wait(self._pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                future.result()  # lỗi ngoài _run (bug) => dừng import thay vì bị nuốt mất
+        job = functools.partial(fn, *args, **kwargs)
+        self._pending.add(self._pool.submit(contextvars.copy_context().run, job))
+
+    def _drain(self):
+        done, _ = wait(self._pending)
+        self._pending = set()
+        for future in done:
+            future.result()
+
+    @staticmethod
+    def _topology():
+        osc.invalidate("topology")
+        return osc.get_topology()
+
+    # ---------- phases ----------
+    def add(self, record):
+        kind = record.get("kind")
+        if kind == "network":
+            self.networks[record["id"]] = record
+        elif kind == "subnet":
+            self.subnets[record["network_id"]].append(record)
+            network = self.networks.get(record["network_id"], {})
+            self.subnet_keys[record["id"]] = (network.get("name"), record["cidr"])
+        elif kind == "router":
+            self.routers.append(record)
+        elif kind == "router_interface":
+            self.interfaces[record["router_id"]].extend(record["subnet_ids"])
+        elif kind == "keypair":
+            self.keypairs.append(record)
+        elif kind == "security_group":
+            self._skip("security_group")
+        elif kind == "server":
+            if not self._definitions_done:
+                self.replay_definitions()
+            self._submit(self._replay_server, record)
+
+    def replay_definitions(self):
+        self._definitions_done = True
+
+        # 🔹 1️⃣ Networks + subnets (external / shared network thuộc về admin => bỏ qua)
+        topo = self._topology()
+        existing = {n.get("name") for n in topo.networks.values()}
+        for old_id, network in self.networks.items():
+            subnets = self.subnets.get(old_id, [])
+            if network["external"] or network["shared"] or network["name"] in existing or not subnets:
+                self._skip("network")
+                continue
+            first = subnets[0]
+            self._submit(self._run, "network", network["name"], osc.create_network,
+                         network["name"], first["name"], first["cidr"])
+            if len(subnets) > 1:
+                self.report["network"]["errors"].append(
+                    f"{network['name']}: only the first subnet ({first['cidr']}) is replayed")
+            self.planned_networks.append(network["name"])
+        self._drain()
+
+        # 🔹 2️⃣ Routers: gateway theo tên external network, interface theo (network, CIDR)
+        topo = self._topology()
+        current_subnets = {
+            (topo.networks.get(s.get("network_id"), {}).get("name"), s.get("cidr")): sid
+            for sid, s in topo.subnets.items()
+        }
+        external_by_name = {topo.networks[n].get("name"): n for n in topo.external_network_ids}
+        existing = {r.get("name") for r in topo.routers.values()}
+        for router in self.routers:
+            if router["name"] in existing:
+                self._skip("router")
+                continue
+            old_ext = self.networks.get(router["external_network_id"], {}).get("name")
+            ext_id = external_by_name.get(old_ext) or next(iter(topo.external_network_ids), None)
+            subnet_ids = [current_subnets.get(self.subnet_keys.get(s)) for s in self.interfaces.get(router["id"], [])]
+            self._submit(self._replay_router, router, ext_id, [s for s in subnet_ids if s])
+        self._drain()
+
+        # 🔹 3️⃣ Keypairs (public key)
+        existing = {k.name for k in osc.list_keypairs()}
+        for keypair in self.keypairs:
+            if keypair["name"] in existing or not keypair.get("public_key"):
+                self._skip("keypair")
+                continue
+            self._submit(self._run, "keypair", keypair["name"], osc.create_keypair,
+                         keypair["name"], public_key=keypair["public_key"])
+        self._drain()
+
+        # 🔹 4️⃣ Chuẩn bị cho server: network theo tên, server đã có theo tên
+        topo = self._topology()
+        self.network_ids = {n.get("name"): nid for nid, n in topo.networks.items()}
+        if self.dry_run:
+            self.network_ids.update((name, f"(new) {name}") for name in self.planned_networks)
+        conn = osc.get_conn()
+        nova = osc.get_compute_endpoint(conn["catalog"])
+        self.server_names = {s["name"] for s in osc.iter_list(conn, f"{nova}/servers", "servers", "list servers")}
+
+    def _replay_router(self, router, ext_id, subnet_ids):
+        def create():
+            created = osc.create_router(router["name"], ext_id)
+            for subnet_id in subnet_ids:
+                osc.add_router_interface(created["id"], subnet_id)
+        self._run("router", router["name"], create)
+
+    def _replay_server(self, server):
+        if server["name"] in self.server_names:
+            self._skip("server")
+            return
+        network_ids = [self.network_ids[n] for n in server["networks"] if n in self.network_ids]
+        if not network_ids:
+            self._count("server", "failed", f"{server['name']}: none of {server['networks']} exists")
+            return
+        self._run(
+            "server", server["name"], osc.create_instance,
+            name=server["name"], image=server["image"], flavor=server["flavor"], network_ids=network_ids,
+            key_name=server["key_name"],
+            security_group=(server["security_groups"] or ["default"])[0],
+            metadata=server["metadata"] or None,
+        )
+
+    def finish(self):
+        if not self._definitions_done:
+            self.replay_definitions()
+        self._drain()
+        self._pool.shutdown()
+        return {kind: dict(stats) for kind, stats in self.report.items()}
+
+
+@oplog.operation()
+def import_inventory(records, max_workers=4, dry_run=False):
+    """
+    Replay một export (iterable các record, theo thứ tự của export_records) lên project hiện tại.
+    Trả về {kind: {"created", "skipped", "failed", "errors"}}.
+    """
+    replay = _Replay(max_workers=max_workers, dry_run=dry_run)
+    for record in records:
+        replay.add(record)
+    return replay.finish()
+
+
+# ======================
+# CLI
+# ======================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export / import project inventory as gzip NDJSON.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    exp = sub.add_parser("export", help="stream the project inventory to a .ndjson.gz file (or stdout)")
+    exp.add_argument("-o", "--output", default="-", help="output file, '-' = stdout")
+    exp.add_argument("--kinds", default=",".join(KINDS), help=f"comma separated subset of {','.join(KINDS)}")
+    exp.add_argument("--page-size", type=int, default=None)
+
+    imp = sub.add_parser("import", help="replay networks, routers, keypairs and servers from an export")
+    imp.add_argument("path")
+    imp.add_argument("--workers", type=int, default=4, help="max concurrent create calls")
+    imp.add_argument("--dry-run", action="store_true", help="report what would be created, change nothing")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        kinds = [k.strip() for k in args.kinds.split(",") if k.strip()]
+        unknown = set(kinds) - set(KINDS)
+        if unknown:
+            parser.error(f"unknown kinds: {', '.join(sorted(unknown))}")
+        chunks = gzip_stream(ndjson_lines(export_records(osc.get_conn(), kinds, args.page_size)))
+        out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+        return
+
+    report = import_inventory(read_records(args.path), max_workers=args.workers, dry_run=args.dry_run)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+import oplog
+from models import Flavor, Image, Keypair, Network, Router, SecurityGroup, Server
+
+
+# ======================
+# SCHEMA
+# ======================
+# kind -> (cột khoá, các cột được index để truy vấn không cần gọi upstream, model)
+KINDS = {
+    "servers": ("id", ("name", "status"), Server),
+    "networks": ("id", ("name", "status"), Network),
+    "routers": ("id", ("name", "status"), Router),
+    "images": ("id", ("name", "status"), Image),
+    "flavors": ("id", ("name",), Flavor),
+    "keypairs": ("name", (), Keypair),
+    "security_groups": ("id", ("name",), SecurityGroup),
+}
+
+_SCHEMA_EXTRA = """
+CREATE TABLE IF NOT EXISTS snapshot_meta (kind TEXT PRIMARY KEY, fetched_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS server_networks (
+    server_id TEXT NOT NULL, network TEXT NOT NULL, addr TEXT, ip_type TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_server_networks_server ON server_networks (server_id);
+CREATE INDEX IF NOT EXISTS ix_server_networks_network ON server_networks (network);
+CREATE INDEX IF NOT EXISTS ix_server_networks_addr ON server_networks (addr);
+CREATE TABLE IF NOT EXISTS subnets (
+    id TEXT PRIMARY KEY, network_id TEXT NOT NULL, name TEXT, cidr TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_subnets_network ON subnets (network_id);
+"""
+
+
+# ======================
+# INVENTORY SNAPSHOT (SQLite)
+# ======================
+class InventoryStore:
+    """
+    Snapshot inventory trên đĩa local để:
+    - render trang ngay khi khởi động / khi Nova, Neutron chậm hoặc lỗi (kèm mốc "data as of"),
+    - truy vấn server theo name / status / network mà không cần gọi upstream.
+    Ghi theo kiểu incremental (chỉ các record thay đổi) trên một writer thread riêng,
+    nên không nằm trong đường đi của request.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._queue = queue.Queue()
+
+        db = self._db()
+        for kind, (key, columns, _) in KINDS.items():
+            cols = "".join(f", {c} TEXT" for c in columns)
+            db.execute(f"CREATE TABLE IF NOT EXISTS {kind} ({key} TEXT PRIMARY KEY{cols}, data TEXT NOT NULL)")
+            for c in columns:
+                db.execute(f"CREATE INDEX IF NOT EXISTS ix_{kind}_{c} ON {kind} ({c})")
+        db.executescript(_SCHEMA_EXTRA)
+
+        threading.Thread(target=self._writer, name="inventory-writer", daemon=True).start()
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    # ---------- write ----------
+    def save_async(self, kind, records):
+        """Xếp lịch ghi snapshot; nếu cùng kind đang chờ thì chỉ giữ bản mới nhất."""
+        with self._pending_lock:
+            first = kind not in self._pending
+            self._pending[kind] = (time.time(), records)
+        if first:
+            self._queue.put(kind)
+
+    def _writer(self):
+        while True:
+            kind = self._queue.get()
+            with self._pending_lock:
+                fetched_at, records = self._pending.pop(kind)
+            try:
+                self.save(kind, records, fetched_at)
+            except Exception as e:
+                oplog.error(f"⚠️ Failed to write {kind} snapshot", op="inventory_save", kind=kind, error=str(e))
+
+    def save(self, kind, records, fetched_at=None):
+        key, columns, _ = KINDS[kind]
+        db = self._db()
+        existing = dict(db.execute(f"SELECT {key}, data FROM {kind}"))
+        seen = set()
+
+        db.execute("BEGIN")
+        try:
+            for rec in records:
+                rec = rec.to_dict()
+                rid = rec[key]
+                seen.add(rid)
+                data = json.dumps(rec, sort_keys=True, default=str)
+                if existing.get(rid) == data:
+                    continue  # không đổi => không ghi
+                db.execute(
+                    f"INSERT OR REPLACE INTO {kind} ({key}{''.join(', ' + c for c in columns)}, data)"
+                    f" VALUES ({', '.join('?' * (len(columns) + 2))})",
+                    (rid, *(rec.get(c) for c in columns), data),
+                )
+                self._save_links(db, kind, rec)
+
+            removed = [(rid,) for rid in existing if rid not in seen]
+            db.executemany(f"DELETE FROM {kind} WHERE {key} = ?", removed)
+            if kind == "servers":
+                db.executemany("DELETE FROM server_networks WHERE server_id = ?", removed)
+            elif kind == "networks":
+                db.executemany("DELETE FROM subnets WHERE network_id = ?", removed)
+
+            db.execute(
+                "INSERT OR REPLACE INTO snapshot_meta (kind, fetched_at) VALUES (?, ?)",
+                (kind, fetched_at or time.time()),
+            )
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def _save_links(self, db, kind, rec):
+        if kind == "servers":
+            db.execute("DELETE FROM server_networks WHERE server_id = ?", (rec["id"],))
+            db.executemany(
+                "INSERT INTO server_networks (server_id, network, addr, ip_type) VALUES (?, ?, ?, ?)",
+                [
+                    (rec["id"], net, addr["addr"], addr["type"])
+                    for net, addrs in rec["addresses"]
+                    for addr in addrs
+                ],
+            )
+        elif kind == "networks":
+            db.execute("DELETE FROM subnets WHERE network_id = ?", (rec["id"],))
+            db.executemany(
+                "INSERT OR REPLACE INTO subnets (id, network_id, name, cidr) VALUES (?, ?, ?, ?)",
+                [
+                    (sub["id"], rec["id"], sub["name"], sub["cidr"])
+                    for sub in rec["subnets"]
+                ],
+            )
+
+    # ---------- read ----------
+    def load(self, kind):
+        """Trả về (records, fetched_at); (None, None) nếu chưa có snapshot."""
+        db = self._db()
+        row = db.execute("SELECT fetched_at FROM snapshot_meta WHERE kind = ?", (kind,)).fetchone()
+        if row is None:
+            return None, None
+        key, _, model = KINDS[kind]
+        records = [
+            model.from_dict(json.loads(data))
+            for (data,) in db.execute(f"SELECT data FROM {kind} ORDER BY {key}")
+        ]
+        return records, row[0]
+
+    def query_servers(self, name=None, status=None, network=None, ip=None):
+        """Tìm server trong snapshot theo name (prefix), status, network hoặc IP."""
+        sql = "SELECT DISTINCT s.data FROM servers s"
+        where, args = [], []
+        if network or ip:
+            sql += " JOIN server_networks n ON n.server_id = s.id"
+        if name:
+            where.append("s.name LIKE ? ESCAPE '\\'")
+            args.append(name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if status:
+            where.append("s.status = ?")
+            args.append(status)
+        if network:
+            where.append("n.network = ?")
+            args.append(network)
+        if ip:
+            where.append("n.addr = ?")
+            args.append(ip)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        return [json.loads(data) for (data,) in self._db().execute(sql + " ORDER BY s.name", args)]
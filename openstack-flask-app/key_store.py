@@ -0,0 +1,70 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+
+# ======================
+# PRIVATE KEY STORE (in-memory, TTL)
+# ======================
+class PrivateKeyStore:
+    """
+    Giữ private key vừa tạo trong RAM cho đến khi user tải về.
+    - Mỗi key chỉ tải được một lần (pop).
+    - Hết hạn sau `ttl` giây.
+    - Giới hạn số entry và tổng dung lượng, entry cũ nhất bị loại trước.
+    Không ghi gì xuống filesystem — nên chỉ worker đã tạo key mới trả được key đó
+    (chạy nhiều worker => cần sticky session cho /download-keypair).
+    """
+
+    def __init__(self, ttl=300, max_entries=256, max_bytes=4 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()  # token -> (expires_at, name, pem_bytes)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def put(self, name, private_key):
+        """Lưu private key, trả về token ngẫu nhiên để đặt vào session."""
+        data = private_key.encode("utf-8") if isinstance(private_key, str) else private_key
+        if len(data) > self.max_bytes:
+            raise Exception("❌ Private key too large for the key store")
+
+        token = secrets.token_urlsafe(24)
+        with self._lock:
+            self._purge_expired()
+            self._items[token] = (time.monotonic() + self.ttl, name, data)
+            self._size += len(data)
+            while len(self._items) > self.max_entries or self._size > self.max_bytes:
+                _, (_, _, old) = self._items.popitem(last=False)
+                self._size -= len(old)
+        return token
+
+    def pop(self, token):
+        """Lấy (name, pem_bytes) và xoá khỏi store; None nếu không có hoặc đã hết hạn."""
+        with self._lock:
+            self._purge_expired()
+            item = self._items.pop(token, None)
+            if item is None:
+                return None
+            self._size -= len(item[2])
+            return item[1], item[2]
+
+    def discard(self, token):
+        self.pop(token)
+
+    def __contains__(self, token):
+        with self._lock:
+            self._purge_expired()
+            return token in self._items
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        # OrderedDict theo thứ tự chèn, TTL cố định => entry hết hạn luôn nằm đầu
+        while self._items:
+            token, (expires_at, _, data) = next(iter(self._items.items()))
+            if expires_at > now:
+                break
+            del self._items[token]
+            self._size -= len(data)
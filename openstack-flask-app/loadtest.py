@@ -0,0 +1,337 @@
+import argparse
+import contextvars
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+import requests
+
+from fake_openstack import FakeOpenStack, FakeServer, clouds_yaml
+
+
+# ======================
+# ROUTES & MIX
+# ======================
+# Tên ngắn => path; mix "instances=5,networks=2,routers=2,scale=1" (trọng số), hoặc path bất kỳ "/usage=1"
+ROUTES = {
+    "instances": "/instances?full=1",
+    "instances_shell": "/instances",
+    "instances_table": "/instances/fragment/table",
+    "networks": "/networks",
+    "routers": "/routers",
+    "scale": "/scale",
+    "usage": "/usage",
+    "topology": "/topology",
+}
+DEFAULT_MIX = "instances=4,networks=2,routers=2,scale=1"
+REPORT_VERSION = 1
+
+
+def parse_mix(value):
+    mix = {}
+    for item in filter(None, value.split(",")):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ROUTES and not name.startswith("/"):
+            raise ValueError(f"unknown route '{name}' (known: {', '.join(ROUTES)} or a /path)")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, p):
+    # Nearest-rank trên list đã sort
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+# ======================
+# UPSTREAM CALLS PER PAGE (in-process)
+# ======================
+# Mỗi virtual user đặt một bộ đếm vào ContextVar trước khi gửi request; UpstreamExecutor
+# copy contextvars sang worker => hook của openstack_client._http cộng đúng vào trang đã gây ra lời gọi.
+_page_calls = contextvars.ContextVar("loadtest_page_calls", default=None)
+
+
+def _count_upstream(response, *args, **kwargs):
+    counter = _page_calls.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+# ======================
+# DRIVERS
+# ======================
+class InProcessDriver:
+    """Gọi Flask app qua test client trong cùng process (không có socket / WSGI server ở giữa)."""
+
+    mode = "inproc"
+
+    def __init__(self):
+        import app as dashboard
+        import openstack_client as osc
+
+        self.app = dashboard.app
+        if _count_upstream not in osc._http.hooks["response"]:
+            osc._http.hooks["response"].append(_count_upstream)
+        self.target = "in-process"
+
+    def client(self):
+        client = self.app.test_client()
+
+        def get(path):
+            counter = [0]
+            token = _page_calls.set(counter)
+            try:
+                response = client.get(path)
+                response.close()
+                return response.status_code, counter[0]
+            finally:
+                _page_calls.reset(token)
+        return get
+
+
+class HttpDriver:
+    """Gọi app đang chạy qua HTTP (gunicorn / flask run); mỗi virtual user một requests.Session."""
+
+    mode = "http"
+
+    def __init__(self, base_url):
+        self.target = base_url.rstrip("/")
+
+    def client(self):
+        session = requests.Session()
+
+        def get(path):
+            response = session.get(self.target + path, allow_redirects=False, timeout=60)
+            return response.status_code, None
+        return get
+
+
+# ======================
+# RUN
+# ======================
+def _virtual_user(get, mix, deadline, budget, think, rng, records, stop):
+    names, weights = list(mix), list(mix.values())
+    while not stop.is_set() and time.monotonic() < deadline:
+        if budget is not None:
+            with budget["lock"]:
+                if budget["left"] <= 0:
+                    return
+                budget["left"] -= 1
+        name = rng.choices(names, weights)[0]
+        path = ROUTES.get(name, name)
+        started = time.perf_counter()
+        try:
+            status, upstream = get(path)
+        except Exception as e:
+            status, upstream = f"error: {type(e).__name__}", None
+        records.append((name, status, time.perf_counter() - started, upstream))
+        if think:
+            time.sleep(think)
+
+
+def _stats(records, elapsed):
+    latencies = sorted(r[2] * 1000 for r in records)
+    statuses = Counter(str(r[1]) for r in records)
+    errors = sum(n for code, n in statuses.items() if not code.isdigit() or int(code) >= 400)
+    upstream = [r[3] for r in records if r[3] is not None]
+    return {
+        "requests": len(records),
+        "errors": errors,
+        "error_rate": round(errors / len(records), 4) if records else 0.0,
+        "throughput_rps": round(len(records) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 2) if latencies else None,
+            "p50": _round(percentile(latencies, 50)),
+            "p95": _round(percentile(latencies, 95)),
+            "p99": _round(percentile(latencies, 99)),
+            "max": _round(latencies[-1] if latencies else None),
+        },
+        "status": dict(sorted(statuses.items())),
+        "upstream_calls_per_page": round(sum(upstream) / len(upstream), 2) if upstream else None,
+    }
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
+
+
+def _fake_stats(fake_url):
+    return requests.get(f"{fake_url}/_stats", timeout=10).json() if fake_url else None
+
+
+def run(driver, mix, users=10, duration=20.0, total_requests=None, think_ms=0, warmup=1, seed=1,
+        fake_url=None):
+    """Chạy load test, trả về report (dict JSON-serializable, key được sort khi ghi ra)."""
+    # 🔹 1️⃣ Warm-up: mỗi route vài request (cache, token, snapshot) — không tính vào kết quả
+    get = driver.client()
+    for name in mix:
+        for _ in range(warmup):
+            get(ROUTES.get(name, name))
+    if fake_url:
+        requests.post(f"{fake_url}/_reset", timeout=10)
+
+    # 🔹 2️⃣ Virtual users
+    per_user = [[] for _ in range(users)]
+    stop = threading.Event()
+    deadline = time.monotonic() + duration
+    budget = {"left": total_requests, "lock": threading.Lock()} if total_requests else None
+    threads = [
+        threading.Thread(
+            target=_virtual_user, name=f"vu-{i}",
+            args=(driver.client(), mix, deadline, budget, think_ms / 1000, random.Random(seed + i), per_user[i], stop),
+            daemon=True,
+        )
+        for i in range(users)
+    ]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    try:
+        for t in threads:
+            t.join()
+    except KeyboardInterrupt:
+        stop.set()
+        for t in threads:
+            t.join()
+    elapsed = time.monotonic() - started
+
+    # 🔹 3️⃣ Report
+    records = [r for rs in per_user for r in rs]
+    by_route = defaultdict(list)
+    for r in records:
+        by_route[r[0]].append(r)
+    upstream = _fake_stats(fake_url)
+    summary = _stats(records, elapsed)
+    if upstream and summary["upstream_calls_per_page"] is None and records:
+        # HTTP mode: chỉ có tổng số lời gọi của fake => trung bình trên mọi trang
+        summary["upstream_calls_per_page"] = round(upstream["total"] / len(records), 2)
+
+    return {
+        "version": REPORT_VERSION,
+        "mode": driver.mode,
+        "target": driver.target,
+        "config": {"users": users, "duration_s": duration, "requests": total_requests, "mix": mix,
+                   "think_ms": think_ms, "warmup": warmup, "seed": seed},
+        "elapsed_s": round(elapsed, 3),
+        "summary": summary,
+        "routes": {name: _stats(rs, elapsed) for name, rs in sorted(by_route.items())},
+        "upstream": upstream,
+    }
+
+
+# ======================
+# COMPARE
+# ======================
+def compare(before, after):
+    """Bảng so sánh hai report: throughput, p50 / p95 / p99, error rate, upstream calls / page."""
+    def row(label, a, b):
+        def val(s, *path):
+            for p in path:
+                s = (s or {}).get(p)
+            return s
+
+        cols = [("rps", ("throughput_rps",)), ("p50", ("latency_ms", "p50")), ("p95", ("latency_ms", "p95")),
+                ("p99", ("latency_ms", "p99")), ("err", ("error_rate",)), ("up/page", ("upstream_calls_per_page",))]
+        cells = []
+        for name, path in cols:
+            x, y = val(a, *path), val(b, *path)
+            delta = f" ({(y - x) / x:+.0%})" if isinstance(x, (int, float)) and isinstance(y, (int, float)) and x else ""
+            cells.append(f"{name} {x} → {y}{delta}")
+        return f"{label:<18} " + " | ".join(cells)
+
+    lines = [row("ALL", before["summary"], after["summary"])]
+    for name in sorted(set(before["routes"]) | set(after["routes"])):
+        lines.append(row(name, before["routes"].get(name), after["routes"].get(name)))
+    return "\n".join(lines)
+
+
+# ======================
+# CLI
+# ======================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent load test for the dashboard routes.")
+    sub = parser.add_subparsers(dest="command")
+
+    cmp_parser = sub.add_parser("compare", help="compare two JSON reports (before, after)")
+    cmp_parser.add_argument("before")
+    cmp_parser.add_argument("after")
+
+    parser.add_argument("--url", help="app base URL (HTTP mode); omitted => in-process test client")
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds to run")
+    parser.add_argument("--requests", type=int, help="stop after N requests in total")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"route weights, default '{DEFAULT_MIX}'")
+    parser.add_argument("--think-ms", type=float, default=0, help="pause between requests of a user")
+    parser.add_argument("--warmup", type=int, default=1, help="unmeasured requests per route first")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--fake-url", help="already running fake_openstack.py (for upstream call counts)")
+    parser.add_argument("--fake-servers", type=int, default=50)
+    parser.add_argument("--fake-networks", type=int, default=3)
+    parser.add_argument("--fake-latency", default="20", help="ms per upstream call, e.g. '20' or 'compute=80'")
+    parser.add_argument("--fake-jitter", default="5")
+    parser.add_argument("--fake-error-rate", default="0", help="e.g. '0.01' or 'network=0.05'")
+    parser.add_argument("--label", help="free text stored in the report")
+    parser.add_argument("-o", "--output", help="write the JSON report here (default stdout)")
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        with open(args.before) as a, open(args.after) as b:
+            print(compare(json.load(a), json.load(b)))
+        return
+
+    mix = parse_mix(args.mix)
+    fake_server = None
+    fake_config = None
+    fake_url = args.fake_url
+    if args.url:
+        driver = HttpDriver(args.url)
+    else:
+        # In-process: fake OpenStack trên thread nền + app trỏ tới nó (đặt env TRƯỚC khi import app)
+        if not fake_url:
+            fake = FakeOpenStack(args.fake_servers, args.fake_networks, args.fake_latency, args.fake_jitter,
+                                 args.fake_error_rate)
+            fake_server = FakeServer(fake)
+            fake_url = fake_server.__enter__()
+            fake_config = {"servers": args.fake_servers, "networks": args.fake_networks,
+                           "latency_ms": fake.latency_ms, "jitter_ms": fake.jitter_ms, "error_rate": fake.error_rate}
+        workdir = tempfile.mkdtemp(prefix="osc-loadtest-")
+        with open(os.path.join(workdir, "clouds.yaml"), "w") as f:
+            f.write(clouds_yaml(fake_url))
+        os.environ.update({
+            "OS_CLIENT_CONFIG_FILE": os.path.join(workdir, "clouds.yaml"),
+            "OS_CLOUD": "fake",
+            "OSC_INVENTORY_PATH": os.path.join(workdir, "inventory.db"),
+            "OSC_OPLOG_PATH": os.path.join(workdir, "oplog.ndjson"),
+        })
+        driver = InProcessDriver()
+
+    try:
+        report = run(driver, mix, args.users, args.duration, args.requests, args.think_ms, args.warmup,
+                     args.seed, fake_url)
+    finally:
+        if fake_server:
+            fake_server.__exit__(None, None, None)
+    report["label"] = args.label
+    report["fake"] = fake_config
+
+    text = json.dumps(report, indent=2, sort_keys=True, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        s = report["summary"]
+        print(f"✅ {s['requests']} requests, {s['throughput_rps']} req/s, p95 {s['latency_ms']['p95']} ms, "
+              f"errors {s['error_rate']:.1%} => {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+import sys
+from dataclasses import asdict, dataclass, replace
+
+
+# ======================
+# HELPERS
+# ======================
+def _intern(value):
+    """Intern các chuỗi lặp lại nhiều (status, flavor ID, tên network...) để dùng chung một object."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+# ======================
+# MODELS
+# ======================
+# Các model là dataclass frozen + __slots__: nhẹ hơn nhiều so với dict khi giữ
+# hàng nghìn record trong cache / inventory, và template vẫn dùng `s.name`, `s.status`...
+# - from_api(): parse JSON trả về từ OpenStack API
+# - to_dict() / from_dict(): dạng JSON-serializable (snapshot, API)
+class _Model:
+    __slots__ = ()
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+@dataclass(frozen=True, slots=True)
+class Address(_Model):
+    addr: str
+    type: str  # "fixed" | "floating"
+    version: int
+
+    @classmethod
+    def from_api(cls, data):
+        return cls(
+            addr=data.get("addr"),
+            type=_intern(data.get("OS-EXT-IPS:type", "fixed")),
+            version=data.get("version", 4),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Server(_Model):
+    id: str
+    name: str
+    status: str
+    flavor: str
+    image: str
+    # ((network_name, (Address, ...)), ...) — tuple thay cho dict lồng nhau
+    addresses: tuple
+    created: str = None
+    updated: str = None
+    key_name: str = None
+
+    @classmethod
+    def from_api(cls, data):
+        return cls(
+            id=data["id"],
+            name=data["name"],
+            status=_intern(data["status"]),
+            flavor=_intern(data["flavor"].get("id")),
+            image=_intern((data.get("image") or {}).get("id")),
+            addresses=tuple(
+                (_intern(net), tuple(Address.from_api(a) for a in addrs))
+                for net, addrs in (data.get("addresses") or {}).items()
+            ),
+            created=data.get("created"),
+            updated=data.get("updated"),
+            key_name=_intern(data.get("key_name")),
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        data["addresses"] = tuple(
+            (net, tuple(Address.from_dict(a) for a in addrs)) for net, addrs in data["addresses"]
+        )
+        return cls(**data)
+
+    @property
+    def networks(self):
+        return tuple(net for net, _ in self.addresses)
+
+    @property
+    def ips(self):
+        return tuple(a.addr for _, addrs in self.addresses for a in addrs)
+
+
+@dataclass(frozen=True, slots=True)
+class Subnet(_Model):
+    id: str
+    name: str
+    cidr: str
+    gateway_ip: str = None
+    network_id: str = None
+
+    @classmethod
+    def from_api(cls, data):
+        return cls(
+            id=data["id"],
+            name=data.get("name", "(no name)"),
+            cidr=data["cidr"],
+            gateway_ip=data.get("gateway_ip"),
+            network_id=data.get("network_id"),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Network(_Model):
+    id: str
+    name: str
+    status: str
+    external: bool
+    subnet_ids: tuple
+    # Chi tiết subnet — chỉ có khi lấy kèm danh sách subnet (list_networks_with_subnets)
+    subnets: tuple = ()
+
+    @classmethod
+    def from_api(cls, data):
+        return cls(
+            id=data["id"],
+            name=_intern(data.get("name", "(no name)")),
+            status=_intern(data.get("status", "UNKNOWN")),
+            external=data.get("router:external", False),
+            subnet_ids=tuple(data.get("subnets", [])),
+        )
+
+    def with_subnets(self, subnets_by_id):
+        """Bản sao kèm chi tiết subnet (subnets_by_id: {id: Subnet})."""
+        return replace(self, subnets=tuple(
+            subnets_by_id[sid] for sid in self.subnet_ids if sid in subnets_by_id
+        ))
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        data["subnet_ids"] = tuple(data["subnet_ids"])
+        data["subnets"] = tuple(Subnet.from_dict(s) for s in data["subnets"])
+        return cls(**data)
+
+
+@dataclass(frozen=True, slots=True)
+class Router(_Model):
+    id: str
+    name: str
+    status: str
+    external_network_id: str = None
+
+    @classmethod
+    def from_api(cls, data):
+        return cls(
+            id=data["id"],
+            name=data.get("name"),
+            status=_intern(data.get("status")),
+            external_network_id=_intern((data.get("external_gateway_info") or {}).get("network_id")),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Image(_Model):
+    id: str
+    name: str
+    status: str
+    disk_format: str
+    size: int
+
+    @classmethod
+    def from_api(cls, data):
+        return cls(
+            id=_intern(data["id"]),
+            name=data.get("name"),
+            status=_intern(data.get("status")),
+            disk_format=_intern(data.get("disk_format")),
+            size=data.get("size"),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Flavor(_Model):
+    id: str
+    name: str
+    vcpus: int
+    ram: int
+    disk: int
+    swap: object
+
+    @classmethod
+    def from_api(cls, data):
+        return cls(
+            id=_intern(data["id"]),
+            name=_intern(data.get("name")),
+            vcpus=data.get("vcpus"),
+            ram=data.get("ram"),
+            disk=data.get("disk"),
+            swap=data.get("swap"),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Keypair(_Model):
+    name: str
+    fingerprint: str
+    public_key: str
+    type: str = None
+
+    @classmethod
+    def from_api(cls, data):
+        return cls(
+            name=data.get("name"),
+            fingerprint=data.get("fingerprint"),
+            public_key=data.get("public_key"),
+            type=_intern(data.get("type")),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class SecurityGroupRule(_Model):
+    direction: str
+    ethertype: str
+    protocol: str
+    port_range_min: int
+    port_range_max: int
+    remote_ip_prefix: str
+
+    @classmethod
+    def from_api(cls, data):
+        return cls(
+            direction=_intern(data.get("direction")),
+            ethertype=_intern(data.get("ethertype")),
+            protocol=_intern(data.get("protocol")),
+            port_range_min=data.get("port_range_min"),
+            port_range_max=data.get("port_range_max"),
+            remote_ip_prefix=_intern(data.get("remote_ip_prefix")),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class SecurityGroup(_Model):
+    id: str
+    name: str
+    description: str
+    tenant_id: str
+    rules: tuple
+
+    @classmethod
+    def from_api(cls, data):
+        return cls(
+            id=data["id"],
+            name=_intern(data.get("name")),
+            description=data.get("description"),
+            tenant_id=_intern(data.get("tenant_id")),
+            rules=tuple(SecurityGroupRule.from_api(r) for r in data.get("security_group_rules", [])),
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        data["rules"] = tuple(SecurityGroupRule.from_dict(r) for r in data["rules"])
+        return cls(**data)
@@ -1,24 +1,245 @@
-import requests, yaml
+import requests
 import base64
+import contextvars
+import functools
+import hashlib
 import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
+
+import oplog
+from cache_backend import create_backend
+from http_cache import ConditionalCache, content_digest
+from models import Flavor, Image, Keypair, Network, Router, SecurityGroup, Server, Subnet
+from topology import Topology
+
+CLOUDS_YAML = os.environ.get("OS_CLIENT_CONFIG_FILE", "/home/phucdo/.config/openstack/clouds.yaml")
+CLOUD_NAME = os.environ.get("OS_CLOUD", "mycloud")
+
+# Token được dùng lại đến khi còn TOKEN_REFRESH_MARGIN giây trước expires_at
+TOKEN_REFRESH_MARGIN = 60
+# TTL (giây) cho dữ liệu tham chiếu: flavors, images, networks
+REFERENCE_TTL = float(os.environ.get("OSC_REFERENCE_TTL", "60"))
+# Quota / usage đổi theo từng lần tạo server => chỉ cache rất ngắn
+QUOTA_TTL = float(os.environ.get("OSC_QUOTA_TTL", "10"))
+# Topology (networks/subnets/routers/ports/floating IPs) dùng chung cho trang topology và floating IP
+TOPOLOGY_TTL = float(os.environ.get("OSC_TOPOLOGY_TTL", "15"))
+# Số record mỗi trang khi duyệt list theo trang (iter_list: export, ...)
+PAGE_SIZE = int(os.environ.get("OSC_PAGE_SIZE", "200"))
+# Các cloud / region mà trang tổng hợp fan-out tới: "mycloud", "mycloud/RegionTwo,othercloud", "*" = mọi cloud
+# trong clouds.yaml. Mặc định: mọi region của OS_CLOUD.
+TARGETS = os.environ.get("OSC_TARGETS", "")
+# Timeout (giây) mỗi lời gọi HTTP tới một region khi không có api_timeout trong clouds.yaml
+REGION_TIMEOUT = float(os.environ.get("OSC_REGION_TIMEOUT", "10"))
+
+
+class _TimeoutAdapter(HTTPAdapter):
+    # Lời gọi không tự đặt timeout => timeout của context (use_timeout, vd. job fan-out của một region);
+    # ngoài fan-out mặc định không có timeout: create_server, floating IP, ... được chờ như trước
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = _call_timeout.get()
+        return super().send(request, **kwargs)
+
+
+# 🔹 Một HTTP session dùng chung => giữ kết nối TLS (keep-alive) giữa các request
+_http = requests.Session()
+_http.mount("https://", _TimeoutAdapter(pool_connections=8, pool_maxsize=32))
+_http.mount("http://", _TimeoutAdapter(pool_connections=8, pool_maxsize=32))
+# Mỗi lời gọi upstream => một event (method, URL không kèm query, status, thời gian) trong oplog
+_http.hooks["response"].append(oplog.http_hook)
+
+
+# ======================
+# CONFIG (clouds.yaml)
+# ======================
+_config = None
+
+
+def _load_clouds():
+    global _config
+    if _config is None:
+        import yaml  # import muộn: chỉ cần khi đọc config lần đầu
+
+        with open(CLOUDS_YAML, "r") as f:
+            _config = yaml.safe_load(f)
+    return _config["clouds"]
+
+
+def load_cloud_config(cloud=None):
+    """Đọc clouds.yaml một lần duy nhất cho cả process; trả về entry của `cloud` (mặc định OS_CLOUD)."""
+    clouds = _load_clouds()
+    name = cloud or CLOUD_NAME
+    if name not in clouds:
+        raise Exception(f"❌ Cloud '{name}' not found in {CLOUDS_YAML}")
+    return clouds[name]
+
+
+# ======================
+# TARGETS (cloud + region)
+# ======================
+@dataclass(frozen=True)
+class Target:
+    cloud: str
+    region: str = None  # None = endpoint public đầu tiên trong catalog (như trước)
+    timeout: float = None
+
+    @property
+    def label(self):
+        return f"{self.cloud}/{self.region}" if self.region else self.cloud
+
+
+def cloud_targets(cloud):
+    """
+    Các region của `cloud` theo clouds.yaml: `regions: [RegionOne, {name: RegionTwo, values: {api_timeout: 20}}]`
+    hoặc `region_name: RegionOne`; api_timeout của cloud / region là timeout mỗi lời gọi HTTP.
+    """
+    entry = load_cloud_config(cloud)
+    timeout = float(entry.get("api_timeout") or REGION_TIMEOUT)
+    regions = entry.get("regions") or [entry.get("region_name")]
+    targets = []
+    for region in regions:
+        if isinstance(region, dict):
+            values = region.get("values") or {}
+            targets.append(Target(cloud, region["name"], float(values.get("api_timeout") or timeout)))
+        else:
+            targets.append(Target(cloud, region, timeout))
+    return targets
+
+
+@functools.lru_cache(maxsize=None)
+def list_targets():
+    """Các target được cấu hình (OSC_TARGETS), target đầu tiên là mặc định (tuple, đọc một lần)."""
+    spec = [item.strip() for item in TARGETS.split(",") if item.strip()] or [CLOUD_NAME]
+    if spec == ["*"]:
+        spec = list(_load_clouds())
+    targets = []
+    for item in spec:
+        cloud, _, region = item.partition("/")
+        for target in cloud_targets(cloud):
+            if (not region or target.region == region) and target not in targets:
+                targets.append(target)
+        if region and not any(t.cloud == cloud and t.region == region for t in targets):
+            # Region không khai báo trong clouds.yaml: vẫn dùng được nếu catalog có
+            targets.append(Target(cloud, region, cloud_targets(cloud)[0].timeout))
+    return tuple(targets)
+
+
+def find_target(label):
+    """Target có `label` ("cloud" hoặc "cloud/region") trong list_targets(), None nếu không có."""
+    return next((t for t in list_targets() if t.label == label), None)
+
+
+def default_target():
+    return list_targets()[0]
+
+
+# Target của context hiện tại (app đặt theo lựa chọn của user, fan-out đặt cho từng worker).
+_target = contextvars.ContextVar("osc_target", default=None)
+
+
+def use_target(target):
+    """Gọi các hàm bên dưới trên `target` (None = target mặc định) trong context hiện tại."""
+    return _target.set(target)
+
+
+def current_target():
+    return _target.get() or default_target()
+
+
+# Timeout HTTP (giây) cho mọi lời gọi trong context hiện tại; None = không giới hạn
+_call_timeout = contextvars.ContextVar("osc_call_timeout", default=None)
+
+
+def use_timeout(seconds):
+    """Đặt timeout mỗi lời gọi HTTP cho context hiện tại (regions đặt api_timeout của target cho job fan-out)."""
+    return _call_timeout.set(seconds)
+
+
+def _submit(pool, fn, *args, **kwargs):
+    # Mỗi job chạy trong bản copy context của caller: target, conn của user, bộ đếm loadtest
+    # và timeout HTTP của fan-out (use_timeout) đi theo sang worker thread như ở UpstreamExecutor.
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+# ======================
+# CACHE BACKEND
+# ======================
+# Token, catalog và dữ liệu tham chiếu dùng chung backend này
+# (OSC_CACHE_BACKEND=sqlite để chia sẻ giữa các gunicorn worker trên một host).
+cache = create_backend()
+
 
 # ======================
 # AUTHENTICATION (Keystone)
 # ======================
+def _parse_expires_at(value):
+    # Keystone: "2026-10-19T19:17:42.000000Z"
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def _token_ttl(conn):
+    return max(1, conn["expires_at"] - TOKEN_REFRESH_MARGIN - time.time())
+
+
+# Conn (token + catalog) của user đang đăng nhập, do app đặt cho từng request.
+# UpstreamExecutor copy contextvars sang worker thread nên các hàm bên dưới thấy được.
+_request_conn = contextvars.ContextVar("osc_request_conn", default=None)
+
+
+def use_conn(conn):
+    """Dùng `conn` (hoặc None = tài khoản dịch vụ trong clouds.yaml) cho context hiện tại."""
+    return _request_conn.set(conn)
+
+
 def get_conn():
-    # 🔹 1. Đọc file clouds.yaml
-    with open("/home/phucdo/.config/openstack/clouds.yaml", "r") as f:
-        config = yaml.safe_load(f)
+    """
+    Conn của user hiện tại nếu có (đã xác thực lúc login, không gọi lại Keystone),
+    nếu không thì tài khoản dịch vụ của cloud — dùng lại token còn hạn thay vì xác thực lại mỗi lần.
+    Catalog chỉ giữ endpoint thuộc region của target hiện tại.
+    """
+    target = current_target()
+    conn = _request_conn.get()
+    if conn is None:
+        # max_stale=0: token đã hết hạn thì mọi lời gọi upstream đều 401 => không bao giờ trả bản cũ
+        conn = cache.get_or_refresh(
+            f"conn:{target.cloud}", _token_ttl, functools.partial(authenticate, cloud=target.cloud), max_stale=0
+        )
+    elif target.cloud != CLOUD_NAME:
+        # Token của user chỉ hợp lệ trên Keystone của OS_CLOUD; không dùng tài khoản dịch vụ thay cho user
+        raise Exception(f"❌ Cloud '{target.cloud}' is not available with a user login")
+    return _in_region(conn, target)
+
+
+def _in_region(conn, target):
+    if target.region is None:
+        return conn
+    catalog = []
+    for service in conn["catalog"]:
+        endpoints = [e for e in service["endpoints"] if target.region in (e.get("region_id"), e.get("region"))]
+        if endpoints:
+            catalog.append({**service, "endpoints": endpoints})
+    return {**conn, "catalog": catalog, "cloud": target.cloud, "region": target.region}
 
-    cloud = config["clouds"]["mycloud"]
+
+@oplog.operation()
+def authenticate(username=None, password=None, project_name=None, domain_name=None, cloud=None):
+    """Xác thực password với Keystone; tham số bỏ trống lấy từ clouds.yaml (`cloud`, mặc định OS_CLOUD)."""
+    # 🔹 1. Đọc file clouds.yaml
+    cloud = load_cloud_config(cloud)
     auth = cloud["auth"]
 
     auth_url = auth["auth_url"]
-    username = auth["username"]
-    password = auth["password"]
-    project_name = auth["project_name"]
-    user_domain_name = auth["user_domain_name"]
-    project_domain_name = auth["project_domain_name"]
+    username = username or auth["username"]
+    password = password or auth["password"]
+    project_name = project_name or auth["project_name"]
+    user_domain_name = domain_name or auth["user_domain_name"]
+    project_domain_name = domain_name or auth["project_domain_name"]
 
     # 🔹 2. Payload xác thực
     payload = {
@@ -46,7 +267,7 @@ def get_conn():
 
     # 🔹 3. Gửi POST đến Keystone để lấy token
     url = f"{auth_url}/auth/tokens"
-    response = requests.post(url, json=payload, headers=headers)
+    response = _http.post(url, json=payload, headers=headers)
 
     if response.status_code != 201:
         raise Exception(f"❌ Authentication failed: {response.text}")
@@ -54,18 +275,200 @@ def get_conn():
     token = response.headers["X-Subject-Token"]
     token_info = response.json()
 
-    print("✅ Authentication successful!")
-    print(f"🔑 Token: {token[:20]}...")
+    oplog.info("✅ Authentication successful!", op="authenticate",
+               user=token_info["token"]["user"]["name"], project=token_info["token"]["project"]["name"])
 
     return {
         "token": token,
         "catalog": token_info["token"]["catalog"],
         "user": token_info["token"]["user"]["name"],
         "project": token_info["token"]["project"]["name"],
+        "project_id": token_info["token"]["project"]["id"],
+        "expires_at": _parse_expires_at(token_info["token"]["expires_at"]),
         "auth_url": auth_url,
     }
 
 
+# ======================
+# REFERENCE DATA CACHE
+# ======================
+def _cache_key(key):
+    # Theo cloud / region và project của conn hiện tại: user của project khác không thấy dữ liệu của nhau
+    return f"ref:{current_target().label}:{get_conn()['project_id']}:{key}"
+
+
+def cached(key, ttl=None):
+    """Cache kết quả của hàm list_* trong `ttl` giây (mặc định REFERENCE_TTL), theo project."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper():
+            return cache.get_or_refresh(_cache_key(key), ttl or REFERENCE_TTL, fn)
+        return wrapper
+    return decorator
+
+
+def invalidate(*keys):
+    for key in keys:
+        cache.delete(_cache_key(key))
+
+
+# ======================
+# JSON DECODING
+# ======================
+# orjson (nếu cài) decode nhanh hơn json chuẩn nhiều lần; ijson cho phép parse dạng stream.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+JSON_STREAMING = ijson is not None and os.environ.get("OSC_JSON_STREAMING", "0") == "1"
+
+
+def _decode(res):
+    if orjson is not None:
+        return orjson.loads(res.content)
+    return res.json()
+
+
+# ======================
+# HTTP HELPERS (single-flight GET)
+# ======================
+class _Flight:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+# Kết quả đã chiếu của các GET dạng list + ETag / Last-Modified / hash của body (LRU theo dung lượng)
+http_cache = ConditionalCache(
+    max_bytes=int(os.environ.get("OSC_HTTP_CACHE_BYTES", str(32 * 1024 * 1024))),
+    max_entries=int(os.environ.get("OSC_HTTP_CACHE_ENTRIES", "1024")),
+)
+
+
+def _scope(conn):
+    # Khoá theo phạm vi token (không giữ token thô trong key)
+    return hashlib.sha256(conn["token"].encode("utf-8")).hexdigest()[:16]
+
+
+def _single_flight(key, fn):
+    """
+    Các lời gọi đồng thời cùng `key` dùng chung một request upstream:
+    thread đầu tiên (leader) thực hiện fn(), các thread còn lại chờ và nhận
+    cùng kết quả (hoặc cùng exception). Không cache sau khi request kết thúc.
+    """
+    with _inflight_lock:
+        flight = _inflight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _inflight[key] = _Flight()
+
+    if not leader:
+        flight.event.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        flight.result = fn()
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        flight.event.set()
+
+
+def _fetch_list(conn, url, key, project, what, params=None):
+    """
+    GET một endpoint dạng list ({"<key>": [...]}) và chiếu từng record qua `project`.
+    - OSC_JSON_STREAMING=1 (+ ijson): parse tăng dần từ response stream, mỗi record
+      được chiếu ngay rồi bỏ => không giữ cả body lẫn cây JSON đầy đủ trong RAM.
+    - Ngược lại: decode cả body (orjson nếu có) rồi chiếu.
+    Single-flight theo (scope, URL, params, key, projection): caller đồng thời nhận chung list.
+    Revalidate qua http_cache: 304 hoặc body giống hệt lần trước => trả lại list đã chiếu.
+    """
+    if isinstance(params, dict):
+        params = sorted(params.items())
+    flight_key = (_scope(conn), url, tuple(params or ()), key, getattr(project, "__qualname__", repr(project)))
+
+    def _fetch():
+        headers = {"X-Auth-Token": conn["token"], **http_cache.validators(flight_key)}
+        if not JSON_STREAMING:
+            res = _http.get(url, params=params, headers=headers)
+            if res.status_code == 304:
+                cached_result = http_cache.not_modified(flight_key)
+                if cached_result is not None:
+                    return cached_result
+                res = _http.get(url, params=params, headers={"X-Auth-Token": conn["token"]})
+            if res.status_code != 200:
+                raise Exception(f"❌ Failed to {what}: {res.text}")
+            digest = content_digest(res.content)
+            cached_result = http_cache.lookup(flight_key, digest, res)
+            if cached_result is not None:
+                return cached_result
+            result = [project(rec) for rec in _decode(res).get(key, [])]
+            http_cache.store(flight_key, res, result, len(res.content), digest)
+            return result
+
+        res = _http.get(url, params=params, headers=headers, stream=True)
+        try:
+            if res.status_code == 304:
+                cached_result = http_cache.not_modified(flight_key)
+                if cached_result is not None:
+                    return cached_result
+                res.close()
+                res = _http.get(url, params=params, headers={"X-Auth-Token": conn["token"]}, stream=True)
+            if res.status_code != 200:
+                raise Exception(f"❌ Failed to {what}: {res.text}")
+            res.raw.decode_content = True  # giải nén gzip trong lúc đọc stream
+            result = [project(rec) for rec in ijson.items(res.raw, f"{key}.item", use_float=True)]
+            # Stream không giữ body => chỉ cache được khi upstream có ETag / Last-Modified
+            http_cache.store(flight_key, res, result, int(res.headers.get("Content-Length") or 0))
+            return result
+        finally:
+            res.close()
+
+    return _single_flight(flight_key, _fetch)
+
+
+def iter_list(conn, url, key, what, params=None, page_size=None):
+    """
+    Duyệt một endpoint dạng list theo trang (limit + link "next" của Nova / Neutron),
+    yield từng record thô. Chỉ giữ một trang trong RAM => dùng cho list rất lớn (export).
+    Endpoint không phân trang sẽ trả hết trong một trang và không có link "next".
+    """
+    headers = {"X-Auth-Token": conn["token"]}
+    params = {**(params or {}), "limit": page_size or PAGE_SIZE}
+    while url:
+        res = _http.get(url, params=params, headers=headers)
+        if res.status_code != 200:
+            raise Exception(f"❌ Failed to {what}: {res.text}")
+        body = _decode(res)
+        yield from body.get(key, [])
+        # Link "next" đã chứa sẵn limit / marker và các filter
+        url = next((link["href"] for link in body.get(f"{key}_links", []) if link.get("rel") == "next"), None)
+        params = None
+
+
+def _keypair_from_api(item):
+    # Nova bọc mỗi keypair trong {"keypair": {...}}
+    return Keypair.from_api(item.get("keypair", {}))
+
+
 # ======================
 # NETWORK API (Neutron)
 # ======================
@@ -81,30 +484,27 @@ def get_network_endpoint(catalog):
     raise Exception("❌ Không tìm thấy network endpoint trong catalog")
 
 
+def get_compute_endpoint(catalog):
+    """
+    Tìm URL của dịch vụ 'compute' (Nova) từ catalog của token.
+    """
+    for service in catalog:
+        if service["type"] == "compute":
+            for endpoint in service["endpoints"]:
+                if endpoint["interface"] == "public":
+                    return endpoint["url"]
+    raise Exception("❌ Nova endpoint not found in catalog")
+
+
 # ======================
 # LIST NETWORKS
 # ======================
+@cached("networks")
 def list_networks():
     conn = get_conn()
-    token = conn["token"]
     neutron_url = get_network_endpoint(conn["catalog"])
 
-    headers = {"X-Auth-Token": token}
-    resp = requests.get(f"{neutron_url}/v2.0/networks", headers=headers)
-    resp.raise_for_status()
-
-    networks = resp.json()["networks"]
-
-    result = []
-    for net in networks:
-        result.append({
-            "id": net["id"],
-            "name": net.get("name", "(no name)"),
-            "status": net.get("status", "UNKNOWN"),
-            "external": net.get("router:external", False),
-            "subnets": net.get("subnets", [])
-        })
-    return result
+    return _fetch_list(conn, f"{neutron_url}/v2.0/networks", "networks", Network.from_api, "list networks")
 
 
 # ======================
@@ -112,43 +512,19 @@ def list_networks():
 # ======================
 def list_networks_with_subnets():
     conn = get_conn()
-    token = conn["token"]
     neutron_url = get_network_endpoint(conn["catalog"])
-    headers = {"X-Auth-Token": token}
 
     # 🔹 Lấy danh sách network
-    nets_resp = requests.get(f"{neutron_url}/v2.0/networks", headers=headers)
-    nets_resp.raise_for_status()
-    networks = nets_resp.json()["networks"]
+    networks = _fetch_list(conn, f"{neutron_url}/v2.0/networks", "networks", Network.from_api, "list networks")
 
     # 🔹 Lấy danh sách subnet
-    subs_resp = requests.get(f"{neutron_url}/v2.0/subnets", headers=headers)
-    subs_resp.raise_for_status()
-    subnets = subs_resp.json()["subnets"]
-
-    subnet_dict = {s["id"]: s for s in subnets}
-
-    result = []
-    for net in networks:
-        subnet_details = []
-        for sid in net.get("subnets", []):
-            if sid in subnet_dict:
-                sub = subnet_dict[sid]
-                subnet_details.append({
-                    "id": sub["id"],
-                    "name": sub.get("name", "(no name)"),
-                    "cidr": sub["cidr"],
-                    "gateway_ip": sub.get("gateway_ip")
-                })
-        result.append({
-            "id": net["id"],
-            "name": net.get("name", "(no name)"),
-            "status": net.get("status", "UNKNOWN"),
-            "external": net.get("router:external", False),
-            "subnets": subnet_details
-        })
-    return result
+    subnets = _fetch_list(conn, f"{neutron_url}/v2.0/subnets", "subnets", Subnet.from_api, "list subnets")
+
+    subnet_dict = {s.id: s for s in subnets}
 
+    return [net.with_subnets(subnet_dict) for net in networks]
+
+@oplog.operation()
 def create_network(name, subnet_name, cidr):
     conn = get_conn()
     token = conn["token"]
@@ -177,13 +553,13 @@ def create_network(name, subnet_name, cidr):
     network_url = f"{neutron_endpoint}/v2.0/networks"
     net_payload = {"network": {"name": name, "admin_state_up": True}}
 
-    net_response = requests.post(network_url, json=net_payload, headers=headers)
+    net_response = _http.post(network_url, json=net_payload, headers=headers)
     if net_response.status_code not in (200, 201):
         raise Exception(f"❌ Failed to create network: {net_response.text}")
 
     network = net_response.json()["network"]
     network_id = network["id"]
-    print(f"✅ Created network: {network['name']} (ID: {network_id})")
+    oplog.info(f"✅ Created network: {network['name']}", op="create_network", network_id=network_id)
 
     # 🔹 3. Create subnet in that network
     subnet_url = f"{neutron_endpoint}/v2.0/subnets"
@@ -197,12 +573,15 @@ def create_network(name, subnet_name, cidr):
         }
     }
 
-    sub_response = requests.post(subnet_url, json=subnet_payload, headers=headers)
+    sub_response = _http.post(subnet_url, json=subnet_payload, headers=headers)
     if sub_response.status_code not in (200, 201):
         raise Exception(f"❌ Failed to create subnet: {sub_response.text}")
 
     subnet = sub_response.json()["subnet"]
-    print(f"✅ Created subnet: {subnet['name']} (CIDR: {subnet['cidr']})")
+    oplog.info(f"✅ Created subnet: {subnet['name']}", op="create_subnet", subnet_id=subnet["id"],
+               network_id=network_id, cidr=subnet["cidr"])
+
+    invalidate("networks", "topology")
 
     # 🔹 4. Return both objects
     return {
@@ -211,6 +590,7 @@ def create_network(name, subnet_name, cidr):
     }
 
 
+@oplog.operation()
 def delete_network(network_id):
     conn = get_conn()
     token = conn["token"]
@@ -236,12 +616,13 @@ def delete_network(network_id):
 
     # 🔹 2. Send DELETE request to Neutron API
     url = f"{neutron_endpoint}/v2.0/networks/{network_id}"
-    response = requests.delete(url, headers=headers)
+    response = _http.delete(url, headers=headers)
 
     if response.status_code not in (204, 202):
         raise Exception(f"❌ Failed to delete network {network_id}: {response.text}")
 
-    print(f"✅ Deleted network ID: {network_id}")
+    invalidate("networks", "topology")
+    oplog.info("✅ Deleted network", op="delete_network", network_id=network_id)
     return True
 
 
@@ -250,7 +631,6 @@ def delete_network(network_id):
 # ======================
 def list_routers():
     conn = get_conn()
-    token = conn["token"]
 
     # 🔹 1. Find Neutron (network) endpoint from the service catalog
     neutron_endpoint = None
@@ -268,19 +648,12 @@ def list_routers():
 
     # 🔹 2. Gửi yêu cầu GET đến API Routers
     url = f"{neutron_endpoint}/v2.0/routers"
-    headers = {"X-Auth-Token": token}
-    response = requests.get(url, headers=headers)
-
-    if response.status_code != 200:
-        raise Exception(f"❌ Failed to list routers: {response.text}")
-
-    routers = response.json().get("routers", [])
-    print(f"✅ Found {len(routers)} routers.")
+    routers = _fetch_list(conn, url, "routers", Router.from_api, "list routers")
+    oplog.info(f"✅ Found {len(routers)} routers.", op="list_routers", count=len(routers))
     return routers
 
 def list_external_networks():
     conn = get_conn()
-    token = conn["token"]
 
     # 🔹 1. Find Neutron (network) endpoint from catalog
     neutron_endpoint = None
@@ -296,21 +669,17 @@ def list_external_networks():
     if not neutron_endpoint:
         raise Exception("❌ Neutron endpoint not found in catalog")
 
-    # 🔹 2. Query all networks
+    # 🔹 2. Query external networks only (router:external=True, filtered by Neutron)
     url = f"{neutron_endpoint}/v2.0/networks"
-    headers = {"X-Auth-Token": token}
-    response = requests.get(url, headers=headers)
+    external_networks = _fetch_list(
+        conn, url, "networks", Network.from_api, "list networks", params={"router:external": "True"}
+    )
 
-    if response.status_code != 200:
-        raise Exception(f"❌ Failed to list networks: {response.text}")
-
-    # 🔹 3. Filter external networks (router:external=True)
-    networks = response.json().get("networks", [])
-    external_networks = [net for net in networks if net.get("router:external")]
-
-    print(f"✅ Found {len(external_networks)} external networks.")
+    oplog.info(f"✅ Found {len(external_networks)} external networks.", op="list_external_networks",
+               count=len(external_networks))
     return external_networks
 
+@oplog.operation()
 def create_router(name, external_network_id):
     conn = get_conn()
     token = conn["token"]
@@ -347,16 +716,35 @@ def create_router(name, external_network_id):
 
     # 🔹 3. Send POST request to create router
     url = f"{neutron_endpoint}/v2.0/routers"
-    response = requests.post(url, json=payload, headers=headers)
+    response = _http.post(url, json=payload, headers=headers)
 
     if response.status_code not in (201, 202):
         raise Exception(f"❌ Failed to create router: {response.text}")
 
     router = response.json()["router"]
-    print(f"✅ Created router '{router['name']}' (ID: {router['id']})")
+    invalidate("topology")
+    oplog.info(f"✅ Created router '{router['name']}'", op="create_router", router_id=router["id"])
 
     return router
 
+@oplog.operation()
+def add_router_interface(router_id, subnet_id):
+    conn = get_conn()
+    neutron_endpoint = get_network_endpoint(conn["catalog"])
+    headers = {"X-Auth-Token": conn["token"], "Content-Type": "application/json"}
+
+    # 🔹 Gắn subnet vào router (Neutron tạo port network:router_interface)
+    url = f"{neutron_endpoint}/v2.0/routers/{router_id}/add_router_interface"
+    res = _http.put(url, json={"subnet_id": subnet_id}, headers=headers)
+
+    if res.status_code != 200:
+        raise Exception(f"❌ Failed to add interface to router {router_id}: {res.text}")
+
+    invalidate("topology")
+    oplog.info("✅ Added router interface", op="add_router_interface", router_id=router_id, subnet_id=subnet_id)
+    return res.json()
+
+@oplog.operation()
 def delete_router(router_id):
     conn = get_conn()
     token = conn["token"]
@@ -378,13 +766,14 @@ def delete_router(router_id):
     # 🔹 2. Send DELETE request
     headers = {"X-Auth-Token": token}
     url = f"{neutron_endpoint}/v2.0/routers/{router_id}"
-    res = requests.delete(url, headers=headers)
+    res = _http.delete(url, headers=headers)
 
     # 🔹 3. Check response
     if res.status_code not in (204, 202):
         raise Exception(f"❌ Failed to delete router {router_id}: {res.text}")
 
-    print(f"✅ Deleted router ID: {router_id}")
+    invalidate("topology")
+    oplog.info("✅ Deleted router", op="delete_router", router_id=router_id)
     return True
 
 # ======================
@@ -392,7 +781,6 @@ def delete_router(router_id):
 # ======================
 def list_servers_detailed():
     conn = get_conn()
-    token = conn["token"]
 
     # 🔹 1. Find Nova (compute) endpoint from service catalog
     nova_endpoint = None
@@ -410,31 +798,12 @@ def list_servers_detailed():
 
     # 🔹 2. Send GET request for detailed server list
     url = f"{nova_endpoint}/servers/detail"
-    headers = {"X-Auth-Token": token}
-    res = requests.get(url, headers=headers)
-
-    if res.status_code != 200:
-        raise Exception(f"❌ Failed to list servers: {res.text}")
-
-    data = res.json()
-    servers = data.get("servers", [])
-
-    # 🔹 3. Return simplified structure
-    return [
-        {
-            "id": s["id"],
-            "name": s["name"],
-            "status": s["status"],
-            "flavor": s["flavor"]["id"],
-            "addresses": s.get("addresses", {}),
-            "image": s.get("image", {}).get("id"),
-        }
-        for s in servers
-    ]
+    # 🔹 3. Return compact models
+    return _fetch_list(conn, url, "servers", Server.from_api, "list servers")
 
+@cached("images")
 def list_images():
     conn = get_conn()
-    token = conn["token"]
 
     # 🔹 1. Find Glance (image) endpoint from service catalog
     glance_endpoint = None
@@ -452,30 +821,12 @@ def list_images():
 
     # 🔹 2. Send GET request to Glance API to list images
     url = f"{glance_endpoint}/v2/images"
-    headers = {"X-Auth-Token": token}
-    res = requests.get(url, headers=headers)
-
-    if res.status_code != 200:
-        raise Exception(f"❌ Failed to list images: {res.text}")
-
-    data = res.json()
-    images = data.get("images", [])
-
-    # 🔹 3. Return simplified list
-    return [
-        {
-            "id": img["id"],
-            "name": img.get("name"),
-            "status": img.get("status"),
-            "disk_format": img.get("disk_format"),
-            "size": img.get("size"),
-        }
-        for img in images
-    ]
+    # 🔹 3. Return compact models
+    return _fetch_list(conn, url, "images", Image.from_api, "list images")
 
+@cached("flavors")
 def list_flavors():
     conn = get_conn()
-    token = conn["token"]
 
     # 🔹 1. Find Nova (compute) endpoint from Keystone catalog
     nova_endpoint = None
@@ -493,31 +844,11 @@ def list_flavors():
 
     # 🔹 2. Send GET request to list detailed flavors
     url = f"{nova_endpoint}/flavors/detail"
-    headers = {"X-Auth-Token": token}
-    res = requests.get(url, headers=headers)
-
-    if res.status_code != 200:
-        raise Exception(f"❌ Failed to list flavors: {res.text}")
-
-    data = res.json()
-    flavors = data.get("flavors", [])
-
-    # 🔹 3. Return simplified info
-    return [
-        {
-            "id": f["id"],
-            "name": f.get("name"),
-            "vcpus": f.get("vcpus"),
-            "ram": f.get("ram"),
-            "disk": f.get("disk"),
-            "swap": f.get("swap"),
-        }
-        for f in flavors
-    ]
+    # 🔹 3. Return compact models
+    return _fetch_list(conn, url, "flavors", Flavor.from_api, "list flavors")
 
 def list_security_groups():
     conn = get_conn()
-    token = conn["token"]
 
     # 🔹 1. Find Neutron (network) endpoint from the Keystone catalog
     neutron_endpoint = None
@@ -535,30 +866,11 @@ def list_security_groups():
 
     # 🔹 2. Send GET request to list all security groups
     url = f"{neutron_endpoint}/v2.0/security-groups"
-    headers = {"X-Auth-Token": token}
-    res = requests.get(url, headers=headers)
-
-    if res.status_code != 200:
-        raise Exception(f"❌ Failed to list security groups: {res.text}")
-
     # 🔹 3. Parse JSON and extract relevant info
-    data = res.json()
-    sec_groups = data.get("security_groups", [])
-
-    return [
-        {
-            "id": sg["id"],
-            "name": sg.get("name"),
-            "description": sg.get("description"),
-            "tenant_id": sg.get("tenant_id"),
-            "rules": sg.get("security_group_rules", []),
-        }
-        for sg in sec_groups
-    ]
+    return _fetch_list(conn, url, "security_groups", SecurityGroup.from_api, "list security groups")
 
 def list_keypairs():
     conn = get_conn()
-    token = conn["token"]
 
     # 🔹 1. Find Nova (compute) endpoint from Keystone catalog
     nova_endpoint = None
@@ -576,27 +888,106 @@ def list_keypairs():
 
     # 🔹 2. Send GET request to list keypairs
     url = f"{nova_endpoint}/os-keypairs"
-    headers = {"X-Auth-Token": token}
-    res = requests.get(url, headers=headers)
+    # 🔹 3. Parse and return simplified keypair info
+    return _fetch_list(conn, url, "keypairs", _keypair_from_api, "list keypairs")
 
-    if res.status_code != 200:
-        raise Exception(f"❌ Failed to list keypairs: {res.text}")
 
-    # 🔹 3. Parse and return simplified keypair info
-    keypairs = res.json().get("keypairs", [])
-    result = []
-    for kp in keypairs:
-        kp_data = kp.get("keypair", {})
-        result.append({
-            "name": kp_data.get("name"),
-            "fingerprint": kp_data.get("fingerprint"),
-            "public_key": kp_data.get("public_key"),
-            "type": kp_data.get("type"),
-        })
-    return result
+# ======================
+# QUOTA PRE-FLIGHT
+# ======================
+class QuotaExceeded(Exception):
+    """Quota của project không đủ cho số server yêu cầu — chưa có request tạo nào được gửi."""
+
+    def __init__(self, requested, feasible, limiting):
+        super().__init__(
+            f"❌ Quota exceeded: requested {requested} instance(s), only {feasible} fit "
+            f"(limited by {limiting})"
+        )
+        self.requested = requested
+        self.feasible = feasible
+        self.limiting = limiting
 
 
-def create_instance(name, image, flavor, network_ids, key_name, security_group="nhom07_secgr"):
+@cached("quotas", ttl=QUOTA_TTL)
+def get_quota_usage():
+    """
+    Nova /limits + Neutron quota details của project hiện tại, gộp thành
+    {resource: {"limit", "used"}} (limit -1 = không giới hạn).
+    """
+    conn = get_conn()
+    headers = {"X-Auth-Token": conn["token"]}
+    nova_endpoint = get_compute_endpoint(conn["catalog"])
+    neutron_endpoint = get_network_endpoint(conn["catalog"])
+
+    # 🔹 Hai service độc lập => gọi song song
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        nova_res = _submit(pool, _http.get, f"{nova_endpoint}/limits", headers=headers)
+        neutron_res = _submit(
+            pool, _http.get, f"{neutron_endpoint}/v2.0/quotas/{conn['project_id']}/details.json", headers=headers
+        )
+        nova_res, neutron_res = nova_res.result(), neutron_res.result()
+
+    if nova_res.status_code != 200:
+        raise Exception(f"❌ Failed to get compute limits: {nova_res.text}")
+    if neutron_res.status_code != 200:
+        raise Exception(f"❌ Failed to get network quotas: {neutron_res.text}")
+
+    absolute = _decode(nova_res)["limits"]["absolute"]
+    usage = {
+        "instances": {"limit": absolute.get("maxTotalInstances", -1), "used": absolute.get("totalInstancesUsed", 0)},
+        "cores": {"limit": absolute.get("maxTotalCores", -1), "used": absolute.get("totalCoresUsed", 0)},
+        "ram": {"limit": absolute.get("maxTotalRAMSize", -1), "used": absolute.get("totalRAMUsed", 0)},
+    }
+    for resource, detail in _decode(neutron_res).get("quota", {}).items():
+        if resource in ("port", "floatingip"):
+            usage[resource] = {
+                "limit": detail.get("limit", -1),
+                "used": detail.get("used", 0) + detail.get("reserved", 0),
+            }
+    return usage
+
+
+def plan_capacity(flavor, count, ports_per_server=1, floating_ips_per_server=0, on_exceed="reject"):
+    """
+    Tính số server tối đa có thể tạo với `flavor` (ID) trước khi gửi request nào:
+    headroom (limit - used) của instances / cores / ram / port / floatingip chia cho
+    nhu cầu mỗi server (vcpus, ram lấy từ list_flavors()).
+    on_exceed="reject": thiếu quota => QuotaExceeded; "clamp": trả về số tối đa khả thi
+    (vẫn QuotaExceeded nếu không tạo được server nào).
+    Trả về {"requested", "feasible", "limiting", "headroom"}.
+    """
+    flv = next((f for f in list_flavors() if f.id == flavor or f.name == flavor), None)
+    if flv is None:
+        raise Exception(f"❌ Flavor not found: {flavor}")
+
+    needs = {
+        "instances": 1,
+        "cores": flv.vcpus or 0,
+        "ram": flv.ram or 0,
+        "port": ports_per_server,
+        "floatingip": floating_ips_per_server,
+    }
+    usage = get_quota_usage()
+
+    feasible, limiting, headroom = count, None, {}
+    for resource, need in needs.items():
+        quota = usage.get(resource)
+        if not need or quota is None or quota["limit"] < 0:
+            continue
+        headroom[resource] = max(0, quota["limit"] - quota["used"])
+        fits = headroom[resource] // need
+        if fits < feasible:
+            feasible, limiting = fits, resource
+
+    plan = {"requested": count, "feasible": feasible, "limiting": limiting, "headroom": headroom}
+    if feasible < count and (on_exceed == "reject" or feasible == 0):
+        raise QuotaExceeded(count, feasible, limiting)
+    return plan
+
+
+@oplog.operation()
+def create_instance(name, image, flavor, network_ids, key_name, security_group="nhom07_secgr",
+                    wait=False, wait_timeout=600, metadata=None, preflight=True):
     conn = get_conn()
     token = conn["token"]
 
@@ -614,6 +1005,10 @@ def create_instance(name, image, flavor, network_ids, key_name, security_group="
     if not nova_endpoint:
         raise Exception("❌ Nova endpoint not found in catalog")
 
+    # 🔹 Pre-flight: hết quota thì dừng ở đây, không gửi POST chắc chắn thất bại
+    if preflight:
+        plan_capacity(flavor, 1, ports_per_server=len(network_ids))
+
     # 🔹 2️⃣ Prepare user-data (Base64-encoded cloud-init script)
     user_data_script = """#!/bin/bash
     apt update -y
@@ -641,6 +1036,8 @@ def create_instance(name, image, flavor, network_ids, key_name, security_group="
             "user_data": user_data_encoded,
         }
     }
+    if metadata:
+        payload["server"]["metadata"] = metadata
 
     headers = {
         "X-Auth-Token": token,
@@ -649,16 +1046,90 @@ def create_instance(name, image, flavor, network_ids, key_name, security_group="
 
     # 🔹 5️⃣ Send POST request to create the instance
     url = f"{nova_endpoint}/servers"
-    res = requests.post(url, json=payload, headers=headers)
+    requested_at = time.time()
+    res = _http.post(url, json=payload, headers=headers)
 
     if res.status_code not in (202, 200):
         raise Exception(f"❌ Failed to create instance: {res.text}")
 
     server = res.json().get("server", {})
-    print(f"✅ Instance creation initiated: {server.get('id')} ({name})")
+    invalidate("quotas", "topology")
+    oplog.info(f"✅ Instance creation initiated: {name}", op="create_instance", server_id=server.get("id"), name=name)
+
+    # 🔹 6️⃣ Optionally block until the server leaves BUILD
+    if wait:
+        server["provisioning"] = wait_for_servers([server["id"]], since=requested_at, timeout=wait_timeout)[server["id"]]
     return server
 
 
+def wait_for_servers(server_ids, since=None, timeout=600, min_interval=2.0, max_interval=15.0):
+    """
+    Chờ một nhóm server rời trạng thái BUILD.
+    Mỗi vòng chỉ gửi MỘT request `servers/detail?changes-since=...` cho tất cả
+    server đang chờ; mốc changes-since tiến theo thời điểm của vòng poll thành công
+    trước đó => mỗi vòng chỉ tải các server vừa đổi, không tải lại mọi thay đổi từ `since`.
+    Khoảng poll tăng dần (x1.5, tối đa max_interval) khi không có gì thay đổi
+    và reset về min_interval khi có server đổi trạng thái.
+
+    Trả về {server_id: {"status", "seconds_to_active", "fault", "timed_out"}}.
+    """
+    conn = get_conn()
+    nova_endpoint = get_compute_endpoint(conn["catalog"])
+    headers = {"X-Auth-Token": conn["token"]}
+
+    since = since or time.time()
+    cursor = since
+
+    pending = set(server_ids)
+    result = {
+        sid: {"status": "BUILD", "seconds_to_active": None, "fault": None, "timed_out": False}
+        for sid in server_ids
+    }
+    started = time.monotonic()
+    interval = min_interval
+
+    while pending:
+        remaining = timeout - (time.monotonic() - started)
+        if remaining <= 0:
+            break
+        time.sleep(min(interval, remaining))
+
+        # Trừ vài giây phòng lệch đồng hồ giữa app và Nova
+        changes_since = datetime.fromtimestamp(cursor - 5, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        polled_at = time.time()
+        res = _http.get(f"{nova_endpoint}/servers/detail", params={"changes-since": changes_since}, headers=headers)
+        if res.status_code != 200:
+            raise Exception(f"❌ Failed to poll servers: {res.text}")
+        cursor = polled_at
+
+        changed = False
+        for s in res.json().get("servers", []):
+            sid = s["id"]
+            if sid not in pending:
+                continue
+            state = result[sid]
+            if s["status"] != state["status"]:
+                changed = True
+                state["status"] = s["status"]
+            if s["status"] == "ACTIVE":
+                state["seconds_to_active"] = time.time() - since
+                pending.discard(sid)
+            elif s["status"] in ("ERROR", "DELETED", "SOFT_DELETED"):
+                state["fault"] = (s.get("fault") or {}).get("message")
+                pending.discard(sid)
+
+        interval = min_interval if changed else min(max_interval, interval * 1.5)
+
+    for sid in pending:
+        result[sid]["timed_out"] = True
+
+    active = sum(1 for r in result.values() if r["status"] == "ACTIVE")
+    oplog.info(f"⏱️ {active}/{len(result)} server(s) ACTIVE", op="wait_for_servers", active=active,
+               total=len(result), duration_ms=round((time.monotonic() - started) * 1000, 1))
+    return result
+
+
+@oplog.operation()
 def delete_instance(server_id):
     conn = get_conn()
     token = conn["token"]
@@ -681,146 +1152,296 @@ def delete_instance(server_id):
     url = f"{nova_endpoint}/servers/{server_id}"
     headers = {"X-Auth-Token": token}
 
-    res = requests.delete(url, headers=headers)
+    res = _http.delete(url, headers=headers)
 
     # 🔹 3️⃣ Handle response
     if res.status_code not in (204, 202):
         raise Exception(f"❌ Failed to delete instance {server_id}: {res.text}")
 
-    print(f"🗑️ Deleted instance ID: {server_id}")
+    invalidate("quotas", "topology")
+    oplog.info("🗑️ Deleted instance", op="delete_instance", server_id=server_id)
     return True
 
 # ======================
-# FLOATING IP
+# TOPOLOGY
 # ======================
-def assign_floating_ip(instance_id):
-    conn = get_conn()
-    token = conn["token"]
+def _raw(item):
+    return item
 
-    # 🔹 1️⃣ Find Neutron endpoint
-    neutron_endpoint = None
-    for service in conn["catalog"]:
-        if service["type"] == "network":
-            for endpoint in service["endpoints"]:
-                if endpoint["interface"] == "public":
-                    neutron_endpoint = endpoint["url"]
-                    break
-        if neutron_endpoint:
-            break
-
-    if not neutron_endpoint:
-        raise Exception("❌ Neutron endpoint not found in catalog")
 
-    headers = {"X-Auth-Token": token, "Content-Type": "application/json"}
-
-    # ======================================================
-    # STEP 1️⃣ — Find external network
-    # ======================================================
-    res = requests.get(f"{neutron_endpoint}/v2.0/networks?router:external=True", headers=headers)
-    if res.status_code != 200:
-        raise Exception(f"❌ Failed to list networks: {res.text}")
+@cached("topology", ttl=TOPOLOGY_TTL)
+def get_topology():
+    """
+    Networks, subnets, routers, ports và floating IPs lấy bằng các list call song song,
+    dựng thành Topology (index bằng dict). Cache OSC_TOPOLOGY_TTL giây, bị xoá sau
+    mỗi thay đổi network / router / floating IP.
+    Chỉ lấy tài nguyên của project (tài khoản admin trong clouds.yaml thấy mọi tenant);
+    network / subnet thêm shared và external để vẫn thấy đường ra ngoài.
+    """
+    conn = get_conn()
+    neutron_endpoint = get_network_endpoint(conn["catalog"])
+    project = {"project_id": conn["project_id"]}
+    queries = (
+        ("networks", project), ("networks", {"shared": "true"}), ("networks", {"router:external": "true"}),
+        ("subnets", project), ("subnets", {"shared": "true"}),
+        ("routers", project), ("ports", project), ("floatingips", project),
+    )
+
+    with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+        futures = [
+            (name, _submit(pool, _fetch_list, conn, f"{neutron_endpoint}/v2.0/{name}", name, _raw, f"list {name}",
+                           params))
+            for name, params in queries
+        ]
+        data = {name: {} for name, _ in queries}
+        for name, future in futures:
+            data[name].update((item["id"], item) for item in future.result())
+
+    return Topology(*(list(data[name].values()) for name in ("networks", "subnets", "routers", "ports", "floatingips")),
+                    project_id=conn["project_id"])
+
+
+def _topology_with_ports(instance_ids):
+    """Topology đã cache; nếu thiếu port của instance nào (instance mới tạo) thì lấy lại một lần."""
+    topo = get_topology()
+    if any(not topo.ports_of(iid) for iid in instance_ids):
+        invalidate("topology")
+        topo = get_topology()
+    return topo
 
-    networks = res.json().get("networks", [])
-    if not networks:
-        raise Exception("❌ No external network found")
 
-    external_network = networks[0]
-    external_net_id = external_network["id"]
+# ======================
+# FLOATING IP
+# ======================
+@oplog.operation()
+def assign_floating_ip(instance_id):
+    conn = get_conn()
+    neutron_endpoint = get_network_endpoint(conn["catalog"])
+    headers = {"X-Auth-Token": conn["token"], "Content-Type": "application/json"}
 
     # ======================================================
-    # STEP 2️⃣ — Find ports belonging to the instance
+    # STEP 1️⃣ — Topology: external network, ports, routed networks
     # ======================================================
-    res = requests.get(f"{neutron_endpoint}/v2.0/ports?device_id={instance_id}", headers=headers)
-    if res.status_code != 200:
-        raise Exception(f"❌ Failed to list instance ports: {res.text}")
+    topo = _topology_with_ports([instance_id])
+    if not topo.external_network_ids:
+        raise Exception("❌ No external network found")
+    external_net_id = topo.external_network_ids[0]
 
-    ports = res.json().get("ports", [])
+    ports = topo.ports_of(instance_id)
     if not ports:
         raise Exception("❌ No ports found for this instance")
 
     # ======================================================
-    # STEP 3️⃣ — Find routers that have external gateway
+    # STEP 2️⃣ — Select a port on a network routed to the external network
     # ======================================================
-    res = requests.get(f"{neutron_endpoint}/v2.0/routers", headers=headers)
-    if res.status_code != 200:
-        raise Exception(f"❌ Failed to list routers: {res.text}")
-
-    routers = res.json().get("routers", [])
-    valid_internal_networks = set()
-
-    for r in routers:
-        gw_info = r.get("external_gateway_info")
-        if gw_info and gw_info.get("network_id") == external_net_id:
-            # List all router ports (internal interfaces)
-            res_ports = requests.get(f"{neutron_endpoint}/v2.0/ports?device_id={r['id']}", headers=headers)
-            if res_ports.status_code == 200:
-                for p in res_ports.json().get("ports", []):
-                    for ip in p.get("fixed_ips", []):
-                        subnet_id = ip["subnet_id"]
-                        # Fetch subnet details to get its network_id
-                        sub_res = requests.get(f"{neutron_endpoint}/v2.0/subnets/{subnet_id}", headers=headers)
-                        if sub_res.status_code == 200:
-                            subnet = sub_res.json().get("subnet", {})
-                            valid_internal_networks.add(subnet["network_id"])
-
-    # ======================================================
-    # STEP 4️⃣ — Select a target port
-    # ======================================================
-    target_port = None
-    for port in ports:
-        if port["network_id"] in valid_internal_networks:
-            target_port = port
-            break
-
+    valid_internal_networks = topo.routed_networks(external_net_id)
+    target_port = next((p for p in ports if p["network_id"] in valid_internal_networks), None)
     if not target_port:
         raise Exception("❌ No valid port connected to a router with external gateway found")
 
     # ======================================================
-    # STEP 5️⃣ — Find or create a floating IP
+    # STEP 3️⃣ — Find or create a floating IP
     # ======================================================
-    project_id = target_port["project_id"]
-
-    res = requests.get(f"{neutron_endpoint}/v2.0/floatingips?project_id={project_id}", headers=headers)
-    if res.status_code != 200:
-        raise Exception(f"❌ Failed to list floating IPs: {res.text}")
-
-    fips = res.json().get("floatingips", [])
-    unused_ips = [ip for ip in fips if ip["status"] == "DOWN" and not ip.get("port_id")]
-
+    unused_ips = topo.unused_floating_ips(conn["project_id"])
     if unused_ips:
         floating_ip = unused_ips[0]
     else:
-        # Create a new floating IP
         payload = {
             "floatingip": {
                 "floating_network_id": external_net_id,
-                "project_id": project_id
+                "project_id": target_port.get("project_id") or conn["project_id"],
             }
         }
-        res = requests.post(f"{neutron_endpoint}/v2.0/floatingips", headers=headers, json=payload)
+        res = _http.post(f"{neutron_endpoint}/v2.0/floatingips", headers=headers, json=payload)
         if res.status_code != 201:
             raise Exception(f"❌ Failed to create floating IP: {res.text}")
         floating_ip = res.json()["floatingip"]
 
     # ======================================================
-    # STEP 6️⃣ — Associate floating IP to instance port
+    # STEP 4️⃣ — Associate floating IP to instance port
     # ======================================================
     payload = {"floatingip": {"port_id": target_port["id"]}}
-    res = requests.put(f"{neutron_endpoint}/v2.0/floatingips/{floating_ip['id']}", headers=headers, json=payload)
+    res = _http.put(f"{neutron_endpoint}/v2.0/floatingips/{floating_ip['id']}", headers=headers, json=payload)
+    invalidate("topology")
 
     if res.status_code != 200:
         raise Exception(f"❌ Failed to associate floating IP: {res.text}")
 
     ip_address = floating_ip.get("floating_ip_address")
-    print(f"✅ Assigned Floating IP {ip_address} to instance {instance_id}")
+    oplog.info(f"✅ Assigned Floating IP {ip_address}", op="assign_floating_ip", server_id=instance_id,
+               floating_ip=ip_address)
     return floating_ip
 
+
+def _map_jobs(fn, items, submit=None, max_workers=8):
+    """
+    fn(item) cho từng item song song, qua `submit(fn, item)` nếu có, nếu không thì pool tạm.
+    Trả về [(item, result, error)] theo thứ tự: một job lỗi không làm mất kết quả của các job khác.
+    """
+    items = list(items)
+    if not items:
+        return []
+    pool = None
+    if submit is None:
+        pool = ThreadPoolExecutor(max_workers=min(max_workers, len(items)))
+        submit = functools.partial(_submit, pool)
+    try:
+        futures = []
+        for item in items:
+            try:
+                futures.append(submit(fn, item))
+            except Exception as e:  # ServiceBusy khi submit
+                futures.append(e)
+        outcomes = []
+        for item, future in zip(items, futures):
+            if isinstance(future, Exception):
+                outcomes.append((item, None, future))
+                continue
+            try:
+                outcomes.append((item, future.result(), None))
+            except Exception as e:
+                outcomes.append((item, None, e))
+        return outcomes
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+@oplog.operation()
+def assign_floating_ips_bulk(instance_ids=None, base_name=None, max_workers=8, submit=None):
+    """
+    Gán floating IP cho cả một nhóm instance (theo danh sách ID hoặc prefix base_name).
+    External network, port, router và floating IP lấy từ topology dùng chung (get_topology),
+    không query lại theo từng instance.
+    `submit(fn, arg)` -> Future chạy các POST / PUT song song (app: UpstreamExecutor "network",
+    để tuân theo giới hạn của service); mặc định một pool tạm `max_workers` thread.
+    Trả về dict {instance_id: floating_ip_address hoặc None nếu thất bại}.
+    """
+    conn = get_conn()
+    token = conn["token"]
+    neutron_endpoint = get_network_endpoint(conn["catalog"])
+    headers = {"X-Auth-Token": token, "Content-Type": "application/json"}
+
+    # ======================================================
+    # STEP 1️⃣ — Resolve the instance set
+    # ======================================================
+    instance_ids = list(instance_ids or [])
+    if base_name:
+        nova_endpoint = get_compute_endpoint(conn["catalog"])
+        # Nova's name filter is a regex, so ask only for this prefix (id + name only)
+        res = _http.get(
+            f"{nova_endpoint}/servers",
+            params={"name": f"^{re.escape(base_name)}"},
+            headers=headers,
+        )
+        if res.status_code != 200:
+            raise Exception(f"❌ Failed to list servers: {res.text}")
+        for s in res.json().get("servers", []):
+            if s["id"] not in instance_ids:
+                instance_ids.append(s["id"])
+
+    if not instance_ids:
+        raise Exception("❌ No instances selected for floating IP assignment")
+
+    # ======================================================
+    # STEP 2️⃣ — Topology: external network + routed internal networks
+    # ======================================================
+    topo = _topology_with_ports(instance_ids)
+    if not topo.external_network_ids:
+        raise Exception("❌ No external network found")
+    external_net_id = topo.external_network_ids[0]
+    valid_internal_networks = topo.routed_networks(external_net_id)
+
+    # ======================================================
+    # STEP 3️⃣ — Select a target port per instance
+    # ======================================================
+    result = {iid: None for iid in instance_ids}
+    target_ports = {}
+    for iid in instance_ids:
+        for port in topo.ports_of(iid):
+            if port["network_id"] in valid_internal_networks:
+                target_ports[iid] = port
+                break
+        else:
+            oplog.warning("⚠️ No valid routed port for instance, skipping", op="assign_floating_ips_bulk",
+                          server_id=iid)
+
+    if not target_ports:
+        return result
+
+    # ======================================================
+    # STEP 4️⃣ — Reuse existing / unused floating IPs, allocate the rest together
+    # ======================================================
+    project_id = next(iter(target_ports.values())).get("project_id") or conn["project_id"]
+    unused_ips = topo.unused_floating_ips(conn["project_id"])
+
+    pending = []
+    for iid, port in target_ports.items():
+        if port["id"] in topo.fip_by_port:
+            # Already has a floating IP — nothing to do
+            result[iid] = topo.fip_by_port[port["id"]].get("floating_ip_address")
+        else:
+            pending.append(iid)
+
+    def _create_fip(_):
+        payload = {"floatingip": {"floating_network_id": external_net_id, "project_id": project_id}}
+        r = _http.post(f"{neutron_endpoint}/v2.0/floatingips", headers=headers, json=payload)
+        if r.status_code != 201:
+            raise Exception(f"❌ Failed to create floating IP: {r.text}")
+        return r.json()["floatingip"]
+
+    missing = max(0, len(pending) - len(unused_ips))
+    created = []
+    for _, floating_ip, error in _map_jobs(_create_fip, range(missing), submit, max_workers):
+        if error is None:
+            created.append(floating_ip)
+        else:
+            oplog.warning("⚠️ Failed to create floating IP", op="assign_floating_ips_bulk", error=str(error))
+    # Thiếu floating IP => các instance cuối danh sách giữ None
+    available = unused_ips[:len(pending)] + created
+
+    # ======================================================
+    # STEP 5️⃣ — Associate concurrently
+    # ======================================================
+    def _associate(pair):
+        iid, floating_ip = pair
+        payload = {"floatingip": {"port_id": target_ports[iid]["id"]}}
+        r = _http.put(f"{neutron_endpoint}/v2.0/floatingips/{floating_ip['id']}", headers=headers, json=payload)
+        if r.status_code != 200:
+            raise Exception(f"❌ Failed to associate floating IP: {r.status_code} {r.text}")
+        return floating_ip.get("floating_ip_address")
+
+    created_ids = {f["id"] for f in created}
+    orphans = []
+    for (iid, floating_ip), ip_address, error in _map_jobs(_associate, zip(pending, available), submit, max_workers):
+        result[iid] = ip_address
+        if error is not None:
+            oplog.warning("⚠️ Failed to associate floating IP", op="assign_floating_ips_bulk", server_id=iid,
+                          floating_ip_id=floating_ip["id"], error=str(error))
+            if floating_ip["id"] in created_ids:
+                orphans.append(floating_ip)
+
+    # ======================================================
+    # STEP 6️⃣ — Release floating IPs created here but not associated
+    # ======================================================
+    for floating_ip in orphans:
+        r = _http.delete(f"{neutron_endpoint}/v2.0/floatingips/{floating_ip['id']}", headers=headers)
+        if r.status_code not in (204, 404):
+            oplog.warning("⚠️ Orphaned floating IP left allocated", op="assign_floating_ips_bulk",
+                          floating_ip_id=floating_ip["id"], floating_ip=floating_ip.get("floating_ip_address"),
+                          status=r.status_code)
+    invalidate("topology")
+
+    assigned = sum(1 for ip in result.values() if ip)
+    oplog.info(f"✅ Assigned floating IPs to {assigned}/{len(instance_ids)} instances", op="assign_floating_ips_bulk",
+               assigned=assigned, total=len(instance_ids))
+    return result
+
 # ======================
 # KEYPAIR
 # ======================
 def list_keypairs():
     conn = get_conn()
-    token = conn["token"]
 
     # 🔹 1️⃣ Find Nova (Compute) endpoint from the catalog
     nova_endpoint = None
@@ -838,47 +1459,61 @@ def list_keypairs():
 
     # 🔹 2️⃣ GET request to list keypairs
     url = f"{nova_endpoint}/os-keypairs"
-    headers = {"X-Auth-Token": token}
-
-    res = requests.get(url, headers=headers)
-
-    if res.status_code != 200:
-        raise Exception(f"❌ Failed to list keypairs: {res.text}")
-
-    data = res.json()
-
     # 🔹 3️⃣ Parse keypair info
-    result = []
-    for item in data.get("keypairs", []):
-        kp = item.get("keypair", {})
-        result.append({
-            "name": kp.get("name"),
-            "fingerprint": kp.get("fingerprint"),
-            "public_key": kp.get("public_key")
-        })
-
-    return result
+    return _fetch_list(conn, url, "keypairs", _keypair_from_api, "list keypairs")
 
 
-def create_keypair(name):
+def generate_keypair_material(key_type="ed25519", rsa_bits=4096):
+    """
+    Sinh keypair ngay trong process (không ghi file).
+    Trả về (private_key_pem, public_key_openssh) dạng str.
+    """
+    # Import muộn: cryptography chỉ cần khi sinh key cục bộ
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+
+    if key_type == "ed25519":
+        private_key = ed25519.Ed25519PrivateKey.generate()
+        private_format = serialization.PrivateFormat.OpenSSH
+    elif key_type == "rsa":
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=rsa_bits)
+        private_format = serialization.PrivateFormat.TraditionalOpenSSL
+    else:
+        raise Exception(f"❌ Unsupported key type: {key_type}")
+
+    private_pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=private_format,
+        encryption_algorithm=serialization.NoEncryption(),
+    ).decode("utf-8")
+    public_openssh = private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.OpenSSH,
+        format=serialization.PublicFormat.OpenSSH,
+    ).decode("utf-8")
+    return private_pem, public_openssh
+
+
+@oplog.operation()
+def create_keypair(name, key_type=None, public_key=None):
+    """
+    Tạo keypair trên Nova.
+    - key_type=None, public_key=None: Nova tự sinh key (hành vi cũ).
+    - key_type="ed25519"/"rsa": sinh key cục bộ, chỉ upload public key;
+      private key được trả về trong kết quả ("private_key"), không ghi ra đĩa.
+    - public_key="ssh-...": import public key có sẵn.
+    """
     conn = get_conn()
     token = conn["token"]
 
     # 🔹 1️⃣ Find Nova (Compute) endpoint
-    nova_endpoint = None
-    for service in conn["catalog"]:
-        if service["type"] == "compute":
-            for endpoint in service["endpoints"]:
-                if endpoint["interface"] == "public":
-                    nova_endpoint = endpoint["url"]
-                    break
-        if nova_endpoint:
-            break
+    nova_endpoint = get_compute_endpoint(conn["catalog"])
 
-    if not nova_endpoint:
-        raise Exception("❌ Nova endpoint not found in catalog")
+    # 🔹 2️⃣ Generate key material locally if requested
+    private_key = None
+    if key_type and not public_key:
+        private_key, public_key = generate_keypair_material(key_type)
 
-    # 🔹 2️⃣ Prepare request
+    # 🔹 3️⃣ Prepare request
     url = f"{nova_endpoint}/os-keypairs"
     headers = {
         "X-Auth-Token": token,
@@ -890,20 +1525,23 @@ def create_keypair(name):
             "name": name
         }
     }
+    if public_key:
+        payload["keypair"]["public_key"] = public_key
 
-    # 🔹 3️⃣ Send POST request
-    res = requests.post(url, json=payload, headers=headers)
+    # 🔹 4️⃣ Send POST request
+    res = _http.post(url, json=payload, headers=headers)
 
     if res.status_code != 200 and res.status_code != 201:
         raise Exception(f"❌ Failed to create keypair '{name}': {res.text}")
 
     keypair_data = res.json().get("keypair", {})
+    if private_key:
+        keypair_data["private_key"] = private_key
 
-    print(f"[+] Created Keypair: {keypair_data.get('name')}")
+    oplog.info(f"✅ Created keypair: {keypair_data.get('name')}", op="create_keypair", keypair=keypair_data.get("name"))
     return keypair_data
 
-import requests
-
+@oplog.operation()
 def delete_keypair(name):
     conn = get_conn()
     token = conn["token"]
@@ -931,12 +1569,12 @@ def delete_keypair(name):
     }
 
     # 🔹 3️⃣ Send DELETE request
-    res = requests.delete(url, headers=headers)
+    res = _http.delete(url, headers=headers)
 
     if res.status_code not in (202, 204):
         raise Exception(f"❌ Failed to delete keypair '{name}': {res.text}")
 
-    print(f"[-] Deleted keypair: {name}")
+    oplog.info(f"🗑️ Deleted keypair: {name}", op="delete_keypair", keypair=name)
     return True
 
 
@@ -945,134 +1583,240 @@ def delete_keypair(name):
 # ======================
 # SCALE
 # ======================
-def scale_up_instances(base_name, image, flavor, network_id, key_name, target_count):
-    conn = get_conn()
-    token = conn["token"]
+SCALE_GROUP_KEY = "scale_group"
+# Server tạo trước khi có metadata scale_group (chỉ khớp theo tên `<base>_<n>`): OSC_SCALE_LEGACY_NAMES=1
+# để vẫn tính là thành viên. Mặc định chỉ server có metadata scale_group == base_name mới thuộc nhóm
+# (server tạo tay tên "web_3" không bị đếm, không bị scale-down xoá).
+SCALE_LEGACY_NAMES = os.environ.get("OSC_SCALE_LEGACY_NAMES", "0") == "1"
 
-    # 🔹 1️⃣ Find Nova (Compute) endpoint
-    nova_endpoint = None
-    for service in conn["catalog"]:
-        if service["type"] == "compute":
-            for endpoint in service["endpoints"]:
-                if endpoint["interface"] == "public":
-                    nova_endpoint = endpoint["url"]
-                    break
-        if nova_endpoint:
-            break
 
-    if not nova_endpoint:
-        raise Exception("❌ Nova endpoint not found in service catalog")
+def _scale_group_pattern(base_name):
+    # Nova's name filter is a regex evaluated in the DB => chỉ trả về đúng thành viên của nhóm
+    return f"^{re.escape(base_name)}_[0-9]+$"
+
+
+def _scale_group_index(base_name, name):
+    # Backend lọc tên theo substring thay vì regex => có thể gặp tên không đúng dạng `<base>_<n>`
+    try:
+        return int(name[len(base_name) + 1:])
+    except ValueError:
+        return 0
+
+
+def _scale_member(item):
+    return {
+        "id": item["id"],
+        "name": item["name"],
+        "status": item.get("status"),
+        "created": item.get("created"),
+        "group": (item.get("metadata") or {}).get(SCALE_GROUP_KEY),
+    }
+
+
+def _in_scale_group(member, base_name, legacy_names):
+    if member["group"] == base_name:
+        return True
+    return legacy_names and member["group"] is None and member["name"].startswith(f"{base_name}_")
 
-    headers = {"X-Auth-Token": token, "Content-Type": "application/json"}
 
+def list_scale_group(base_name, legacy_names=None):
+    """
+    Thành viên của scale group `base_name`: `servers/detail` lọc tên `<base_name>_<n>` phía Nova,
+    rồi chỉ giữ server có metadata scale_group == base_name (legacy_names / OSC_SCALE_LEGACY_NAMES:
+    nhận thêm server chưa có metadata). Kèm status / created; sort theo số thứ tự n.
+    """
+    legacy_names = SCALE_LEGACY_NAMES if legacy_names is None else legacy_names
+    conn = get_conn()
+    nova_endpoint = get_compute_endpoint(conn["catalog"])
+    members = _fetch_list(conn, f"{nova_endpoint}/servers/detail", "servers", _scale_member,
+                          "list scale group", {"name": _scale_group_pattern(base_name)})
+    members = [m for m in members if _in_scale_group(m, base_name, legacy_names)]
+    return sorted(members, key=lambda m: _scale_group_index(base_name, m["name"]))
+
+
+def list_scale_groups(base_names, legacy_names=None):
+    """
+    Thành viên (như list_scale_group) của nhiều scale group trong MỘT request `servers/detail`
+    (regex `^(a|b|...)_[0-9]+$`). Trả về {base_name: [member, ...]} — dùng cho autoscaler.
+    """
+    legacy_names = SCALE_LEGACY_NAMES if legacy_names is None else legacy_names
+    base_names = sorted(set(base_names))
+    if not base_names:
+        return {}
+    conn = get_conn()
+    nova_endpoint = get_compute_endpoint(conn["catalog"])
+    pattern = "^(" + "|".join(re.escape(b) for b in base_names) + ")_[0-9]+$"
+
+    groups = {b: [] for b in base_names}
+    members = _fetch_list(conn, f"{nova_endpoint}/servers/detail", "servers", _scale_member,
+                          "list scale groups", {"name": pattern})
+    for m in members:
+        base = m["group"] or m["name"].rsplit("_", 1)[0]
+        if base in groups and _in_scale_group(m, base, legacy_names):
+            groups[base].append(m)
+    for base, items in groups.items():
+        items.sort(key=lambda m: _scale_group_index(base, m["name"]))
+    return groups
+
+
+@oplog.operation()
+def scale_up_instances(base_name, image, flavor, network_id, key_name, target_count,
+                       wait=False, wait_timeout=600, on_quota="reject"):
     # ======================================================
-    # STEP 1️⃣ — Get current list of instances
+    # STEP 1️⃣ — Get current members of the scale group
     # ======================================================
-    res = requests.get(f"{nova_endpoint}/servers/detail", headers=headers)
-    if res.status_code != 200:
-        raise Exception(f"❌ Failed to list servers: {res.text}")
+    members = list_scale_group(base_name)
+    current_count = len(members)
 
-    servers = res.json().get("servers", [])
-    current_count = len(servers)
-
-    print(f"[Scale-Up] Current instances: {current_count}, Target: {target_count}")
+    oplog.info(f"[Scale-Up] Group '{base_name}'", op="scale_up", group=base_name, current=current_count,
+               target=target_count)
 
     # ======================================================
     # STEP 2️⃣ — Check if scaling needed
     # ======================================================
     if current_count >= target_count:
-        print(f"[=] No scale-up needed (already have {current_count} instances).")
-        return True
+        oplog.info("[=] No scale-up needed", op="scale_up", group=base_name, current=current_count)
+        return []
 
     to_create = target_count - current_count
-    print(f"[+] Need to create {to_create} new instance(s).")
+    oplog.info(f"[+] Need to create {to_create} new instance(s).", op="scale_up", group=base_name, to_create=to_create)
+
+    # ======================================================
+    # STEP 2️⃣.5 — Quota pre-flight (reject hoặc clamp trước khi gửi POST nào)
+    # ======================================================
+    plan = plan_capacity(flavor, to_create, ports_per_server=1, on_exceed=on_quota)
+    if plan["feasible"] < to_create:
+        oplog.warning("⚠️ Quota too small, clamping", op="scale_up", group=base_name, requested=to_create,
+                      feasible=plan["feasible"], limiting=plan["limiting"])
+        to_create = plan["feasible"]
 
     # ======================================================
     # STEP 3️⃣ — Create new instances
     # ======================================================
+    # Đánh số tiếp sau số lớn nhất đang dùng => không trùng tên khi nhóm có "lỗ"
+    next_index = max((_scale_group_index(base_name, m["name"]) for m in members), default=0) + 1
+    requested_at = time.time()
+    created_ids = []
     for i in range(to_create):
-        name = f"{base_name}_{current_count + i + 1}"
-        print(f"[+] Creating instance: {name}")
+        name = f"{base_name}_{next_index + i}"
 
-        # You already have a REST-based create_instance() function — call it directly here
-        create_instance(
+        server = create_instance(
             name=name,
             image=image,
             flavor=flavor,
             network_ids=[network_id],
-            key_name=key_name
+            key_name=key_name,
+            metadata={SCALE_GROUP_KEY: base_name},
+            preflight=False,  # đã kiểm tra cho cả batch ở trên
         )
+        created_ids.append(server["id"])
 
-    print(f"✅ Successfully scaled up from {current_count} → {target_count} instances.")
-    return True
+    oplog.info(f"✅ Scaled up group '{base_name}'", op="scale_up", group=base_name, before=current_count,
+               after=current_count + to_create, server_ids=created_ids)
+
+    # ======================================================
+    # STEP 4️⃣ — Optionally wait for all new servers in one polling loop
+    # ======================================================
+    if wait:
+        return wait_for_servers(created_ids, since=requested_at, timeout=wait_timeout)
+    return created_ids  # caller tự chờ (vd. app: wait_for_servers ngoài pool "compute")
 
 
+@oplog.operation()
 def scale_down_instances(base_name, target_count):
     conn = get_conn()
-    token = conn["token"]
-
-    # 🔹 1️⃣ Find Nova (Compute) endpoint
-    nova_endpoint = None
-    for service in conn["catalog"]:
-        if service["type"] == "compute":
-            for endpoint in service["endpoints"]:
-                if endpoint["interface"] == "public":
-                    nova_endpoint = endpoint["url"]
-                    break
-        if nova_endpoint:
-            break
-
-    if not nova_endpoint:
-        raise Exception("❌ Nova endpoint not found in service catalog")
-
-    headers = {"X-Auth-Token": token, "Content-Type": "application/json"}
+    nova_endpoint = get_compute_endpoint(conn["catalog"])
+    headers = {"X-Auth-Token": conn["token"], "Content-Type": "application/json"}
 
     # ======================================================
-    # STEP 1️⃣ — Get all instances
+    # STEP 1️⃣ — Get current members of the scale group
     # ======================================================
-    res = requests.get(f"{nova_endpoint}/servers/detail", headers=headers)
-    if res.status_code != 200:
-        raise Exception(f"❌ Failed to list servers: {res.text}")
+    if not base_name:
+        raise Exception("❌ base_name is required to scale down")
 
-    instances = res.json().get("servers", [])
-    current_count = len(instances)
+    members = list_scale_group(base_name)
+    current_count = len(members)
 
-    print(f"[Scale-Down] Current instances: {current_count}, Target: {target_count}")
+    oplog.info(f"[Scale-Down] Group '{base_name}'", op="scale_down", group=base_name, current=current_count,
+               target=target_count)
 
     # ======================================================
     # STEP 2️⃣ — Check if scaling down needed
     # ======================================================
     if current_count <= target_count:
-        print(f"[=] No scale-down needed (already have {current_count} instances).")
+        oplog.info("[=] No scale-down needed", op="scale_down", group=base_name, current=current_count)
         return True
 
     # ======================================================
-    # STEP 3️⃣ — Determine how many to delete
+    # STEP 3️⃣ — Determine which instances to delete
     # ======================================================
     to_delete_count = current_count - target_count
-    print(f"[-] Need to delete {to_delete_count} instance(s).")
+    oplog.info(f"[-] Need to delete {to_delete_count} instance(s).", op="scale_down", group=base_name,
+               to_delete=to_delete_count)
 
-    # Sort instances by created time (newest first)
-    instances.sort(key=lambda s: s["created"], reverse=True)
-
-    # Pick newest ones to delete
-    to_delete = instances[:to_delete_count]
+    # Số thứ tự lớn nhất = mới nhất trong nhóm
+    to_delete = members[-to_delete_count:]
 
     # ======================================================
     # STEP 4️⃣ — Delete instances
     # ======================================================
-    for s in to_delete:
+    for s in reversed(to_delete):
         server_id = s["id"]
         server_name = s["name"]
-        print(f"[-] Deleting {server_name} ({server_id})")
 
         delete_url = f"{nova_endpoint}/servers/{server_id}"
-        del_res = requests.delete(delete_url, headers=headers)
+        del_res = _http.delete(delete_url, headers=headers)
 
         if del_res.status_code not in (204, 202):
-            print(f"⚠️ Failed to delete {server_name}: {del_res.text}")
+            oplog.warning(f"⚠️ Failed to delete {server_name}", op="scale_down", group=base_name,
+                          server_id=server_id, status=del_res.status_code, error=del_res.text)
         else:
-            print(f"✅ Deleted {server_name}")
+            oplog.info(f"✅ Deleted {server_name}", op="scale_down", group=base_name, server_id=server_id)
+
+    invalidate("quotas", "topology")
+    oplog.info(f"✅ Scaled down group '{base_name}'", op="scale_down", group=base_name, before=current_count,
+               after=target_count)
+    return True
+
+
+# ======================
+# WARM-UP
+# ======================
+def warmup(prefetch=("flavors", "images", "networks")):
+    """
+    Chuẩn bị process trước request đầu tiên: đọc config, xác thực Keystone,
+    resolve catalog và prefetch dữ liệu tham chiếu song song (mở sẵn kết nối
+    TLS tới Nova / Glance / Neutron trong pool của _http).
+    Trả về thời gian (giây) của từng bước.
+    """
+    timings = {}
+    started = time.perf_counter()
+
+    t = time.perf_counter()
+    load_cloud_config()
+    timings["config"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    conn = get_conn()
+    timings["auth"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    get_compute_endpoint(conn["catalog"])
+    get_network_endpoint(conn["catalog"])
+    timings["catalog"] = time.perf_counter() - t
+
+    loaders = {"flavors": list_flavors, "images": list_images, "networks": list_networks}
+
+    def _timed(name):
+        t0 = time.perf_counter()
+        loaders[name]()
+        return name, time.perf_counter() - t0
+
+    with ThreadPoolExecutor(max_workers=max(1, len(prefetch))) as pool:
+        for future in [_submit(pool, _timed, name) for name in prefetch]:
+            name, elapsed = future.result()
+            timings[f"prefetch_{name}"] = elapsed
 
-    print(f"✅ Successfully scaled down from {current_count} → {target_count} instances.")
-    return True
\ No newline at end of file
+    timings["total"] = time.perf_counter() - started
+    oplog.info("🔥 Warm-up finished", op="warmup", **{f"{k}_seconds": round(v, 3) for k, v in timings.items()})
+    return timings
@@ -0,0 +1,386 @@
+import argparse
+import functools
+import glob
+import heapq
+import inspect
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+
+# ======================
+# CONFIG
+# ======================
+# OSC_OPLOG_PATH         file NDJSON (mặc định instance/oplog.ndjson cạnh app). Mỗi process ghi file riêng
+#                        oplog.<pid>.ndjson (gunicorn worker không cùng xoay vòng một file); CLI đọc gộp mọi file
+# OSC_OPLOG_MAX_BYTES    dung lượng mỗi file trước khi xoay vòng (mặc định 10 MB)
+# OSC_OPLOG_BACKUPS      số file cũ giữ lại mỗi process (oplog.<pid>.ndjson.1 ... .N)
+# OSC_OPLOG_KEEP_PROCESSES  số bộ file của process đã kết thúc được giữ lại (mặc định 20, cũ nhất bị xoá)
+# OSC_OPLOG_ECHO=1       in thêm bản tóm tắt ra stderr (từ writer thread, không chặn caller)
+LOG_PATH = os.environ.get(
+    "OSC_OPLOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "oplog.ndjson")
+)
+MAX_BYTES = int(os.environ.get("OSC_OPLOG_MAX_BYTES", str(10 * 1024 * 1024)))
+BACKUPS = int(os.environ.get("OSC_OPLOG_BACKUPS", "5"))
+ECHO = os.environ.get("OSC_OPLOG_ECHO", "0") == "1"
+KEEP_PROCESSES = int(os.environ.get("OSC_OPLOG_KEEP_PROCESSES", "20"))
+
+QUEUE_SIZE = 10000
+BATCH_SIZE = 256
+FLUSH_INTERVAL = 0.5
+
+
+# ======================
+# REDACTION
+# ======================
+_SECRET_KEYS = re.compile(r"token|password|secret|private_key|credential|authorization", re.I)
+_SECRET_VALUES = [
+    (re.compile(r"-----BEGIN [A-Z ]*PRIVATE KEY-----.*?-----END [A-Z ]*PRIVATE KEY-----", re.S), "***PRIVATE KEY***"),
+    (re.compile(r"\bgAAAAA[0-9A-Za-z_\-]{20,}"), "***TOKEN***"),  # Keystone Fernet token
+    (re.compile(r"(X-Auth-Token['\"]?\s*[:=]\s*['\"]?)[^'\",\s}]+", re.I), r"\1***"),
+]
+
+
+def redact(value, key=None):
+    """Che token / password / private key trong value (đệ quy qua dict, list)."""
+    if key is not None and _SECRET_KEYS.search(str(key)) and value not in (None, ""):
+        return "***"
+    if isinstance(value, dict):
+        return {k: redact(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [redact(v) for v in value]
+    if isinstance(value, str):
+        for pattern, replacement in _SECRET_VALUES:
+            value = pattern.sub(replacement, value)
+        return value
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return redact(str(value))
+
+
+# ======================
+# NDJSON FORMAT
+# ======================
+class _NDJSONFormatter(logging.Formatter):
+    def format(self, record):
+        event = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        event.update(getattr(record, "event", {}))
+        return json.dumps(redact(event), ensure_ascii=False, default=str)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler không bao giờ chặn caller: queue đầy => bỏ event và đếm lại."""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DroppingQueueHandler.dropped += 1
+
+    def prepare(self, record):
+        # Giữ nguyên record (event dict được format ở writer thread, ngoài đường đi của request)
+        return record
+
+
+# ======================
+# BACKGROUND WRITER
+# ======================
+class _BatchWriter:
+    """Thread nền: gom tối đa BATCH_SIZE event hoặc FLUSH_INTERVAL giây rồi ghi + flush một lần."""
+
+    def __init__(self, q, path, max_bytes, backups, echo):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.queue = q
+        self.echo = echo
+        self.file = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                         encoding="utf-8")
+        self.file.setFormatter(_NDJSONFormatter())
+        self.written = 0
+        self._thread = threading.Thread(target=self._run, name="oplog-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:  # không bao giờ để writer chết
+                sys.stderr.write(f"⚠️ oplog write failed: {e}\n")
+
+    def _write(self, batch):
+        stream = self.file.stream
+        for record in batch:
+            if record is None:
+                continue
+            if self.file.shouldRollover(record):
+                self.file.doRollover()
+                stream = self.file.stream
+            stream.write(self.file.format(record) + "\n")
+            if self.echo:
+                sys.stderr.write(f"{record.getMessage()}\n")
+        stream.flush()
+        self.written += len(batch)
+
+
+_logger = logging.getLogger("osc.oplog")
+_logger.setLevel(logging.INFO)
+_logger.propagate = False
+_queue = queue.Queue(maxsize=QUEUE_SIZE)
+_handler = _DroppingQueueHandler(_queue)
+_logger.addHandler(_handler)
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def process_path(path=LOG_PATH, pid=None):
+    """File của một process: instance/oplog.ndjson => instance/oplog.<pid>.ndjson."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{pid or os.getpid()}{ext}"
+
+
+def _process_files(path):
+    """{pid: file chính} của mọi process đã ghi log cạnh `path`."""
+    root, ext = os.path.splitext(path)
+    files = {}
+    for name in glob.glob(f"{glob.escape(root)}.*{ext}"):
+        pid = name[len(root) + 1:len(name) - len(ext)]
+        if pid.isdigit():
+            files[int(pid)] = name
+    return files
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _prune(path, keep):
+    # Mỗi lần process mới bắt đầu ghi: chỉ giữ `keep` bộ file gần nhất của các process đã kết thúc
+    dead = [(os.path.getmtime(name), name) for pid, name in _process_files(path).items()
+            if pid != os.getpid() and not _alive(pid)]
+    for _, name in sorted(dead, reverse=True)[keep:]:
+        for old in [name] + [f"{name}.{i}" for i in range(1, BACKUPS + 1)]:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+
+
+def _ensure_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                path = process_path(LOG_PATH)
+                try:
+                    _prune(LOG_PATH, KEEP_PROCESSES)
+                except OSError as e:
+                    sys.stderr.write(f"⚠️ oplog prune failed: {e}\n")
+                _writer = _BatchWriter(_queue, path, MAX_BYTES, BACKUPS, ECHO)
+
+
+def _after_fork():
+    # gunicorn --preload: writer thread của master không sang worker => worker tạo writer + file của mình
+    global _writer, _writer_lock, _queue
+    _writer = None
+    _writer_lock = threading.Lock()
+    _queue = queue.Queue(maxsize=QUEUE_SIZE)
+    _handler.queue = _queue
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+# ======================
+# PUBLIC API
+# ======================
+def event(level, msg, **fields):
+    """Ghi một event: `msg` cho người đọc + các field có cấu trúc (op, server_id, ...)."""
+    _ensure_writer()
+    _logger.log(level, msg, extra={"event": fields})
+
+
+def info(msg, **fields):
+    event(logging.INFO, msg, **fields)
+
+
+def warning(msg, **fields):
+    event(logging.WARNING, msg, **fields)
+
+
+def error(msg, **fields):
+    event(logging.ERROR, msg, **fields)
+
+
+def _simple_args(fn, args, kwargs):
+    # Chỉ giữ tham số kiểu đơn giản (ID, tên, số lượng...) làm resource field
+    try:
+        bound = inspect.signature(fn).bind_partial(*args, **kwargs)
+    except TypeError:
+        return {}
+    return {
+        k: v for k, v in bound.arguments.items()
+        if isinstance(v, (str, int, float, bool)) or (isinstance(v, (list, tuple)) and len(v) <= 20)
+    }
+
+
+def operation(name=None):
+    """
+    Decorator cho thao tác thay đổi tài nguyên: một event khi kết thúc với
+    op, tham số (đã redact), duration_ms, outcome ("ok" / "error") và lỗi nếu có.
+    """
+    def decorator(fn):
+        op = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                error(f"❌ {op} failed: {e}", op=op, outcome="error", error=str(e),
+                      duration_ms=round((time.perf_counter() - started) * 1000, 1),
+                      **_simple_args(fn, args, kwargs))
+                raise
+            fields = _simple_args(fn, args, kwargs)
+            if isinstance(result, dict) and isinstance(result.get("id"), str):
+                fields.setdefault("resource_id", result["id"])
+            info(f"✅ {op} finished", op=op, outcome="ok",
+                 duration_ms=round((time.perf_counter() - started) * 1000, 1), **fields)
+            return result
+        return wrapper
+    return decorator
+
+
+def http_hook(response, *args, **kwargs):
+    """requests response hook: một event cho mỗi lời gọi upstream (method, path, status, thời gian)."""
+    request = response.request
+    info(
+        f"{request.method} {response.status_code}",
+        op="upstream",
+        method=request.method,
+        url=request.url.split("?", 1)[0],
+        status=response.status_code,
+        duration_ms=round(response.elapsed.total_seconds() * 1000, 1),
+        outcome="ok" if response.status_code < 400 else "error",
+    )
+
+
+def stats():
+    return {"dropped": _DroppingQueueHandler.dropped, "queued": _queue.qsize(),
+            "written": _writer.written if _writer else 0, "path": _writer.path if _writer else process_path()}
+
+
+# ======================
+# QUERY CLI
+# ======================
+def _parse_since(value):
+    # "15m", "2h", "1d" hoặc ISO timestamp
+    match = re.fullmatch(r"(\d+)([smhd])", value)
+    if match:
+        seconds = int(match.group(1)) * {"s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+        return datetime.fromtimestamp(time.time() - seconds, timezone.utc)
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _read_file_set(path):
+    # Một process: từ file cũ nhất (path.N) tới mới nhất (path)
+    files = [f"{path}.{i}" for i in range(BACKUPS, 0, -1)] + [path]
+    for name in files:
+        if not os.path.exists(name):
+            continue
+        with open(name, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def read_events(path=LOG_PATH):
+    """Đọc mọi event của mọi process (file chung kiểu cũ + oplog.<pid>.ndjson), gộp theo thời gian."""
+    paths = [path] + sorted(_process_files(path).values())
+    return heapq.merge(*(_read_file_set(p) for p in paths), key=lambda ev: ev.get("ts", ""))
+
+
+def query(op=None, outcome=None, since=None, level=None, grep=None, path=LOG_PATH, **fields):
+    since = _parse_since(since) if since else None
+    for ev in read_events(path):
+        if op and ev.get("op") != op:
+            continue
+        if outcome and ev.get("outcome") != outcome:
+            continue
+        if level and ev.get("level") != level:
+            continue
+        if since and datetime.fromisoformat(ev["ts"]) < since:
+            continue
+        if grep and grep not in json.dumps(ev, ensure_ascii=False):
+            continue
+        if any(str(ev.get(k)) != v for k, v in fields.items()):
+            continue
+        yield ev
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the openstack_client operation log (NDJSON).")
+    parser.add_argument("--path", default=LOG_PATH)
+    parser.add_argument("--op", help="operation, e.g. create_instance, upstream")
+    parser.add_argument("--outcome", choices=["ok", "error"])
+    parser.add_argument("--level", choices=["info", "warning", "error"])
+    parser.add_argument("--since", help="15m, 2h, 1d or ISO timestamp")
+    parser.add_argument("--grep", help="substring match on the whole event")
+    parser.add_argument("--field", action="append", default=[], metavar="KEY=VALUE",
+                        help="exact field match, e.g. --field server_id=abc (repeatable)")
+    parser.add_argument("--summary", action="store_true", help="count / error count / p95 duration per op")
+    args = parser.parse_args(argv)
+
+    fields = dict(f.split("=", 1) for f in args.field)
+    events = query(args.op, args.outcome, args.since, args.level, args.grep, args.path, **fields)
+
+    if not args.summary:
+        for ev in events:
+            print(json.dumps(ev, ensure_ascii=False))
+        return
+
+    per_op = {}
+    for ev in events:
+        s = per_op.setdefault(ev.get("op") or "-", {"count": 0, "errors": 0, "durations": []})
+        s["count"] += 1
+        s["errors"] += ev.get("outcome") == "error"
+        if ev.get("duration_ms") is not None:
+            s["durations"].append(ev["duration_ms"])
+    for op, s in sorted(per_op.items()):
+        d = sorted(s.pop("durations"))
+        s["p95_ms"] = d[int(len(d) * 0.95)] if d else None
+        print(json.dumps({"op": op, **s}))
+
+
+if __name__ == "__main__":
+    main()
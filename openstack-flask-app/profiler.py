@@ -0,0 +1,271 @@
+import contextlib
+import contextvars
+import functools
+import hmac
+import inspect
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+
+# ======================
+# CONFIG
+# ======================
+# OSC_PROFILE_TOKEN          secret của admin; header X-Profile-Token: <token> bật profile cho request đó
+# OSC_PROFILE_SAMPLE_RATE    tỉ lệ request được profile ngẫu nhiên (0.01 = 1%), mặc định 0 (tắt)
+# OSC_PROFILE_INTERVAL_MS    chu kỳ lấy mẫu stack (mặc định 5 ms)
+# OSC_PROFILE_DIR            thư mục lưu profile (mặc định instance/profiles cạnh app)
+# OSC_PROFILE_MAX_FILES      số profile giữ lại; cũ nhất bị xoá trước
+TOKEN = os.environ.get("OSC_PROFILE_TOKEN", "")
+SAMPLE_RATE = float(os.environ.get("OSC_PROFILE_SAMPLE_RATE", "0"))
+INTERVAL = float(os.environ.get("OSC_PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_DIR = os.environ.get(
+    "OSC_PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "profiles")
+)
+MAX_FILES = int(os.environ.get("OSC_PROFILE_MAX_FILES", "200"))
+
+_current = contextvars.ContextVar("osc_profile_session", default=None)
+
+
+def _frame_label(frame):
+    # "render_template (flask/templating.py)": thư mục cha phân biệt app.py của Flask và của app
+    code = frame.f_code
+    parent, name = os.path.split(code.co_filename)
+    return f"{code.co_name} ({os.path.basename(parent)}/{name})".replace(";", ":")
+
+
+def _collapse(root, frame):
+    # Định dạng "collapsed stack" (flamegraph.pl, speedscope, inferno): root;...;leaf
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    stack.append(root)
+    return ";".join(reversed(stack))
+
+
+# ======================
+# PROFILE SESSION (một request)
+# ======================
+class ProfileSession:
+    """
+    Các thread đang chạy code của một request (request thread, event loop của async view,
+    worker của UpstreamExecutor) cùng bộ đếm stack đã lấy mẫu của chúng.
+    Thời gian chờ trong hàng đợi của executor được ghi thành stack giả "<service>;queue wait".
+    """
+
+    def __init__(self, name, reason):
+        self.id = uuid.uuid4().hex[:8]
+        self.name = name
+        self.reason = reason
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.stacks = Counter()
+        self.samples = 0
+        self.threads_seen = set()
+        self._threads = {}  # ident -> root label
+        self._lock = threading.Lock()
+
+    def add_thread(self, ident, label):
+        with self._lock:
+            self._threads[ident] = label
+            self.threads_seen.add(label)
+
+    def remove_thread(self, ident):
+        with self._lock:
+            self._threads.pop(ident, None)
+
+    def add_wait(self, label, seconds):
+        ticks = int(seconds / INTERVAL)
+        if ticks:
+            with self._lock:
+                self.stacks[f"{label};queue wait"] += ticks
+
+    def sample(self, frames):
+        with self._lock:
+            threads = list(self._threads.items())
+        stacks = [_collapse(label, frames[ident]) for ident, label in threads if ident in frames]
+        with self._lock:
+            self.stacks.update(stacks)
+            self.samples += 1
+
+
+# ======================
+# SAMPLER THREAD
+# ======================
+class _Sampler:
+    """Một thread lấy mẫu sys._current_frames() mỗi INTERVAL giây, chỉ chạy khi có session."""
+
+    def __init__(self):
+        self._sessions = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, session):
+        with self._lock:
+            self._sessions.add(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+                self._thread.start()
+
+    def discard(self, session):
+        with self._lock:
+            self._sessions.discard(session)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                sessions = list(self._sessions)
+                if not sessions:
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            for session in sessions:
+                session.sample(frames)
+            del frames
+            time.sleep(INTERVAL)
+
+
+_sampler = _Sampler()
+
+
+# ======================
+# PUBLIC API
+# ======================
+def current():
+    return _current.get()
+
+
+def is_admin(token):
+    """Token khớp OSC_PROFILE_TOKEN (so sánh thời gian hằng); chưa đặt token => không ai là admin."""
+    return bool(TOKEN and token) and hmac.compare_digest(token.encode(), TOKEN.encode())
+
+
+def requested(flag):
+    """Bật profile cho request này? (token admin đúng, hoặc rơi vào tỉ lệ lấy mẫu)."""
+    if is_admin(flag):
+        return "admin"
+    if SAMPLE_RATE and random.random() < SAMPLE_RATE:
+        return "sampled"
+    return None
+
+
+def start(name, reason):
+    """Bắt đầu profile trên thread hiện tại; session được truyền theo contextvars."""
+    session = ProfileSession(name, reason)
+    session.add_thread(threading.get_ident(), "request")
+    _current.set(session)
+    _sampler.add(session)
+    return session
+
+
+def stop(session, **meta):
+    """Dừng lấy mẫu và ghi profile ra PROFILE_DIR; trả về metadata đã ghi."""
+    _sampler.discard(session)
+    _current.set(None)
+    duration_ms = round((time.perf_counter() - session.started) * 1000, 1)
+    info = {
+        "id": session.id,
+        "name": session.name,
+        "reason": session.reason,
+        "at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(session.started_at)),
+        "duration_ms": duration_ms,
+        "samples": session.samples,
+        "interval_ms": INTERVAL * 1000,
+        "threads": sorted(session.threads_seen),
+        **meta,
+    }
+    _write(session, info)
+    return info
+
+
+@contextlib.contextmanager
+def thread_scope(ctx, label, waited=0.0):
+    """Cho UpstreamExecutor: lấy mẫu worker thread khi job thuộc về một request đang được profile."""
+    session = ctx.get(_current)
+    if session is None:
+        yield
+        return
+    ident = threading.get_ident()
+    session.add_wait(label, waited)
+    session.add_thread(ident, label)
+    try:
+        yield
+    finally:
+        session.remove_thread(ident)
+
+
+def follow_coroutine(func):
+    """
+    Async view chạy trong event loop của asgiref trên thread khác với request thread:
+    bọc coroutine function để thread đó cũng được lấy mẫu.
+    """
+    if not inspect.iscoroutinefunction(func):
+        return func
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        session = _current.get()
+        if session is None:
+            return await func(*args, **kwargs)
+        ident = threading.get_ident()
+        session.add_thread(ident, "event-loop")
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            session.remove_thread(ident)
+    return wrapper
+
+
+# ======================
+# STORAGE (thư mục có giới hạn)
+# ======================
+_NAME = re.compile(r"^[0-9]{8}-[0-9]{6}-[A-Za-z0-9_.-]+$")
+
+
+def _write(session, info):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(session.started_at))
+    base = f"{stamp}-{re.sub(r'[^A-Za-z0-9_.-]', '_', session.name)}-{session.id}"
+    info["file"] = base
+    with open(os.path.join(PROFILE_DIR, base + ".collapsed"), "w", encoding="utf-8") as f:
+        for stack, count in session.stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    with open(os.path.join(PROFILE_DIR, base + ".json"), "w", encoding="utf-8") as f:
+        json.dump(info, f)
+    _prune()
+
+
+def _prune():
+    names = sorted(n[:-5] for n in os.listdir(PROFILE_DIR) if n.endswith(".json"))
+    for base in names[:max(0, len(names) - MAX_FILES)]:
+        for ext in (".json", ".collapsed"):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(PROFILE_DIR, base + ext))
+
+
+def list_profiles():
+    """Metadata của các profile đã lưu, mới nhất trước."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    result = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if name.endswith(".json"):
+            with contextlib.suppress(OSError, ValueError):
+                with open(os.path.join(PROFILE_DIR, name), encoding="utf-8") as f:
+                    result.append(json.load(f))
+    return result
+
+
+def profile_path(base):
+    """Đường dẫn file .collapsed của profile `base` (None nếu tên không hợp lệ / không tồn tại)."""
+    if not _NAME.match(base):
+        return None
+    path = os.path.join(PROFILE_DIR, base + ".collapsed")
+    return path if os.path.exists(path) else None
@@ -0,0 +1,240 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
+
+import oplog
+import openstack_client as osc
+
+# Region vừa timeout / không kết nối được bị bỏ qua trong OSC_REGION_COOLDOWN giây
+# (trang trả về ngay với các region còn lại thay vì chờ lại đủ timeout mỗi lần).
+COOLDOWN = float(os.environ.get("OSC_REGION_COOLDOWN", "30"))
+
+# Pool riêng cho fan-out (không dùng slot "compute"/"network" của trang): job của region treo chạy nốt ở đây.
+# Mỗi region giữ tối đa OSC_FANOUT_PER_REGION job chưa xong; vượt => region đó trả snapshot thay vì xếp hàng thêm.
+_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("OSC_FANOUT_WORKERS", "16")), thread_name_prefix="fanout")
+PER_REGION = int(os.environ.get("OSC_FANOUT_PER_REGION", "4"))
+_inflight = {}  # label -> số job chưa xong
+_inflight_lock = threading.Lock()
+_down = {}  # label -> (until, lý do)
+_down_lock = threading.Lock()
+
+
+def parse_targets(value):
+    """
+    "mycloud/RegionOne,othercloud" (cloud = mọi region của cloud đó) hoặc "all" / rỗng
+    => list Target đã cấu hình (bỏ qua label không biết).
+    """
+    if not value or value == "all":
+        return list(osc.list_targets())
+    labels = {v.strip() for v in value.split(",") if v.strip()}
+    return [t for t in osc.list_targets() if t.label in labels or t.cloud in labels]
+
+
+def _mark_down(target, reason):
+    with _down_lock:
+        _down[target.label] = (time.monotonic() + COOLDOWN, reason)
+    oplog.warning("⚠️ Region unavailable", op="fan_out", region=target.label, reason=reason, cooldown=COOLDOWN)
+
+
+def _mark_up(target):
+    with _down_lock:
+        _down.pop(target.label, None)
+
+
+def _is_down(target):
+    with _down_lock:
+        entry = _down.get(target.label)
+        if entry is not None and entry[0] <= time.monotonic():
+            del _down[target.label]
+            return None
+        return entry and entry[1]
+
+
+def _unreachable(error):
+    return isinstance(error, (osc.requests.ConnectionError, osc.requests.Timeout))
+
+
+# ======================
+# RESULT (gộp theo region)
+# ======================
+class RegionResult:
+    """Trạng thái của một region: ok | stale (snapshot) | timeout | error | skipped."""
+
+    __slots__ = ("target", "state", "items", "error", "elapsed", "as_of")
+
+    def __init__(self, target, state, items=(), error=None, elapsed=None, as_of=None):
+        self.target = target
+        self.state = state
+        self.items = items
+        self.error = error
+        self.elapsed = elapsed
+        self.as_of = as_of
+
+    @property
+    def label(self):
+        return self.target.label
+
+    def to_dict(self):
+        return {
+            "region": self.label, "cloud": self.target.cloud, "state": self.state, "count": len(self.items),
+            "error": self.error, "as_of": self.as_of,
+            "elapsed_ms": round(self.elapsed * 1000, 1) if self.elapsed is not None else None,
+        }
+
+
+class RegionView:
+    """
+    Kết quả fan-out: `items` = [(region label, item), ...] theo thứ tự target,
+    `regions` = RegionResult của từng target (kể cả region lỗi / timeout).
+    """
+
+    def __init__(self, regions):
+        self.regions = regions
+        self.items = [(r.label, item) for r in regions for item in r.items]
+
+    @property
+    def partial(self):
+        return any(r.state != "ok" for r in self.regions)
+
+    def to_dict(self):
+        return {
+            "partial": self.partial,
+            "regions": [r.to_dict() for r in self.regions],
+            "items": [{"region": label, **(item.to_dict() if hasattr(item, "to_dict") else item)}
+                      for label, item in self.items],
+        }
+
+
+# ======================
+# FAN-OUT
+# ======================
+class FanOut:
+    """
+    Chạy fn() trên từng target song song, mỗi target có deadline riêng (target.timeout).
+    Hết deadline => region đó "timeout" (job vẫn chạy nốt ở nền, kết quả bị bỏ), các region
+    khác không phải chờ. `fallback(target)` -> (items, as_of) | None: dữ liệu thay thế (snapshot).
+    """
+
+    def __init__(self, targets, fallback=None):
+        self.targets = list(targets)
+        self.fallback = fallback
+        self.started = time.monotonic()
+        self.pending = {}  # future -> target
+        self.results = {}  # label -> RegionResult
+
+    def start(self, fn, submit):
+        for target in self.targets:
+            reason = _is_down(target)
+            if reason:
+                self._fail(target, "skipped", f"unavailable, retrying after cooldown ({reason})")
+                continue
+            try:
+                future = submit(target, _bind(fn, target))
+            except Exception as e:  # ServiceBusy, ...
+                self._fail(target, "error", str(e))
+                continue
+            future.add_done_callback(_track(target))
+            self.pending[future] = target
+
+    def next_timeout(self):
+        now = time.monotonic()
+        return max(0.0, min(self.started + t.timeout - now for t in self.pending.values()))
+
+    def settle(self):
+        """Ghi nhận các future đã xong và các region đã quá deadline."""
+        now = time.monotonic()
+        for future, target in list(self.pending.items()):
+            if future.done():
+                del self.pending[future]
+                error = future.exception()
+                if error is None:
+                    items, elapsed = future.result()
+                    self.results[target.label] = RegionResult(target, "ok", items, elapsed=elapsed)
+                else:
+                    self._fail(target, "error", str(error), now - self.started)
+            elif now >= self.started + target.timeout:
+                del self.pending[future]
+                self._fail(target, "timeout", f"no answer within {target.timeout:g}s", now - self.started)
+
+    def _fail(self, target, state, error, elapsed=None):
+        result = RegionResult(target, state, error=error, elapsed=elapsed)
+        if self.fallback is not None:
+            stale = self.fallback(target)
+            if stale is not None:
+                result.state, (result.items, result.as_of) = "stale", stale
+        self.results[target.label] = result
+
+    def view(self):
+        return RegionView([self.results[t.label] for t in self.targets])
+
+
+def _bind(fn, target):
+    def job():
+        osc.use_target(target)
+        osc.use_timeout(target.timeout)  # chỉ lời gọi của fan-out; trang thường không bị giới hạn
+        started = time.monotonic()
+        return fn(), time.monotonic() - started
+    return job
+
+
+def _track(target):
+    # Chạy cả khi page đã bỏ region này (timeout): region trả lời được => bỏ cooldown
+    def callback(future):
+        error = future.exception()
+        if error is None:
+            _mark_up(target)
+        elif _unreachable(error):
+            _mark_down(target, type(error).__name__)
+    return callback
+
+
+def submit_job(target, job):
+    """Chạy job của `target` trên pool "fanout" (copy contextvars); region đã đủ job treo => Exception."""
+    with _inflight_lock:
+        if _inflight.get(target.label, 0) >= PER_REGION:
+            raise Exception(f"❌ {PER_REGION} earlier requests to {target.label} are still running")
+        _inflight[target.label] = _inflight.get(target.label, 0) + 1
+    try:
+        future = _pool.submit(contextvars.copy_context().run, job)
+    except Exception:
+        _release(target)
+        raise
+    future.add_done_callback(lambda f: _release(target))
+    return future
+
+
+def _release(target):
+    with _inflight_lock:
+        _inflight[target.label] -= 1
+
+
+def fan_out(fn, targets=None, submit=None, fallback=None):
+    """
+    Gọi fn() (vd. osc.list_servers_detailed) trên mọi target; trả về RegionView.
+    `submit(target, job)` -> concurrent Future (mặc định: submit_job, pool "fanout" riêng của module).
+    """
+    run = FanOut(osc.list_targets() if targets is None else targets, fallback)
+    run.start(fn, submit or submit_job)
+    while run.pending:
+        futures.wait(list(run.pending), timeout=run.next_timeout(), return_when=futures.FIRST_COMPLETED)
+        run.settle()
+    return run.view()
+
+
+async def gather(fn, targets=None, submit=None, fallback=None):
+    """Như fan_out() nhưng chờ trong event loop (async view)."""
+    run = FanOut(osc.list_targets() if targets is None else targets, fallback)
+    run.start(fn, submit or submit_job)
+    waiters = {}
+    for future in run.pending:
+        waiters[future] = asyncio.wrap_future(future)
+        waiters[future].add_done_callback(lambda f: f.cancelled() or f.exception())  # tránh "never retrieved"
+    while run.pending:
+        await asyncio.wait([waiters[f] for f in run.pending], timeout=run.next_timeout(),
+                           return_when=asyncio.FIRST_COMPLETED)
+        run.settle()
+    return run.view()
@@ -0,0 +1,114 @@
+import bisect
+import threading
+from collections import defaultdict
+
+
+SORT_KEYS = {
+    "name": lambda s: (s.name or "").lower(),
+    "status": lambda s: (s.status or "", (s.name or "").lower()),
+    "created": lambda s: s.created or "",
+    "updated": lambda s: s.updated or "",
+}
+
+
+# ======================
+# SERVER INDEX (search / filter / sort / pagination)
+# ======================
+class ServerIndex:
+    """
+    Index trong RAM cho bảng instances:
+    - name prefix: list tên đã sort + bisect,
+    - status, network, IP: dict -> tập server ID,
+    - q: substring trên tên và IP (chuỗi tìm kiếm tính sẵn cho mỗi server).
+    update() chỉ cập nhật các server thêm / đổi / bị xoá so với lần trước.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._servers = {}                      # id -> Server
+        self._search = {}                       # id -> "name ip1 ip2" (lowercase)
+        self._names = []                        # [(lower_name, id)] đã sort
+        self._by_status = defaultdict(set)
+        self._by_network = defaultdict(set)
+        self._by_ip = defaultdict(set)
+        self._source = None
+
+    # ---------- build ----------
+    def update(self, servers):
+        """Đồng bộ index với danh sách server mới nhất (incremental)."""
+        if servers is self._source:
+            return  # cùng list (ví dụ từ single-flight / cache) => không có gì đổi
+        with self._lock:
+            self._source = servers
+            fresh = {s.id: s for s in servers}
+            for sid in [sid for sid in self._servers if sid not in fresh]:
+                self._remove(sid)
+            for sid, server in fresh.items():
+                old = self._servers.get(sid)
+                if old == server:
+                    continue
+                if old is not None:
+                    self._remove(sid)
+                self._add(server)
+
+    def _add(self, s):
+        self._servers[s.id] = s
+        ips = s.ips
+        self._search[s.id] = " ".join(((s.name or "").lower(),) + ips)
+        bisect.insort(self._names, ((s.name or "").lower(), s.id))
+        self._by_status[s.status].add(s.id)
+        for net in s.networks:
+            self._by_network[net].add(s.id)
+        for ip in ips:
+            self._by_ip[ip].add(s.id)
+
+    def _remove(self, sid):
+        s = self._servers.pop(sid)
+        del self._search[sid]
+        key = ((s.name or "").lower(), sid)
+        i = bisect.bisect_left(self._names, key)
+        if i < len(self._names) and self._names[i] == key:
+            del self._names[i]
+        for index, keys in ((self._by_status, (s.status,)), (self._by_network, s.networks), (self._by_ip, s.ips)):
+            for k in keys:
+                index[k].discard(sid)
+                if not index[k]:
+                    del index[k]
+
+    # ---------- query ----------
+    def facets(self):
+        with self._lock:
+            return {
+                "statuses": sorted(self._by_status),
+                "networks": sorted(self._by_network),
+                "total": len(self._servers),
+            }
+
+    def query(self, q=None, name=None, status=None, network=None, ip=None,
+              sort="name", desc=False, page=1, page_size=50):
+        """Trả về (servers của trang, tổng số kết quả)."""
+        with self._lock:
+            candidates = None
+            if name:
+                prefix = name.lower()
+                i = bisect.bisect_left(self._names, (prefix,))
+                ids = set()
+                while i < len(self._names) and self._names[i][0].startswith(prefix):
+                    ids.add(self._names[i][1])
+                    i += 1
+                candidates = ids
+            for index, value in ((self._by_status, status), (self._by_network, network), (self._by_ip, ip)):
+                if value:
+                    ids = index.get(value, set())
+                    candidates = ids.copy() if candidates is None else candidates & ids
+            if candidates is None:
+                candidates = self._servers.keys()
+            if q:
+                needle = q.lower()
+                candidates = [sid for sid in candidates if needle in self._search[sid]]
+
+            matched = [self._servers[sid] for sid in candidates]
+
+        matched.sort(key=SORT_KEYS.get(sort, SORT_KEYS["name"]), reverse=desc)
+        start = (max(page, 1) - 1) * page_size
+        return matched[start:start + page_size], len(matched)
@@ -0,0 +1,63 @@
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_openstack import FakeOpenStack, FakeServer, clouds_yaml  # noqa: E402
+
+GROUP = {"base_name": "web", "desired": 1, "image": "img", "flavor": "m1.small", "network_id": "net",
+         "key_name": "key"}
+
+
+@pytest.fixture(scope="module")
+def dashboard():
+    server = FakeServer(FakeOpenStack(1, 1, "0", "0", "0"))
+    url = server.__enter__()
+    d = tempfile.mkdtemp()
+    with open(os.path.join(d, "clouds.yaml"), "w") as f:
+        f.write(clouds_yaml(url))
+    os.environ.update(
+        OS_CLIENT_CONFIG_FILE=os.path.join(d, "clouds.yaml"), OS_CLOUD="fake", OSC_USER_AUTH="1",
+        OSC_AUTOSCALER_BACKEND="fake", OSC_AUTOSCALER_PATH=os.path.join(d, "autoscaler.db"),
+        OSC_INVENTORY_PATH=os.path.join(d, "inventory.db"), OSC_OPLOG_PATH=os.path.join(d, "oplog.ndjson"),
+    )
+    import app
+
+    yield app
+    app.autoscaler.stop()
+    server.__exit__(None, None, None)
+
+
+def login(dashboard, project_id):
+    client = dashboard.app.test_client()
+    conn = {"token": "t-" + project_id, "catalog": [], "expires_at": time.time() + 3600,
+            "user": "u-" + project_id, "project": project_id, "project_id": project_id}
+    with client.session_transaction() as session:
+        session["auth_key"] = dashboard.tokens.put(conn)
+    return client
+
+
+def test_other_project_cannot_modify_or_remove_group(dashboard):
+    owner = login(dashboard, dashboard.autoscaler.backend.project_id())
+    other = login(dashboard, "p-other")
+
+    r = owner.post("/autoscaler", json=GROUP)
+    assert r.status_code == 200
+    assert "web" in r.json["groups"]
+
+    assert other.get("/autoscaler").json["groups"] == {}
+    assert other.post("/autoscaler", json={**GROUP, "desired": 5}).status_code == 403
+    assert other.post("/autoscaler/web/remove").status_code == 403
+    r = other.post("/scale", data={**GROUP, "action": "scale_up", "target_count": "5", "managed": "1"})
+    assert r.status_code == 302
+
+    groups = dashboard.autoscaler.groups()
+    assert groups["web"]["desired"] == 1
+    assert groups["web"]["project_id"] == dashboard.autoscaler.backend.project_id()
+
+    assert owner.post("/autoscaler/web/remove").status_code == 200
+    assert "web" not in dashboard.autoscaler.groups()
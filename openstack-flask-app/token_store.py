@@ -0,0 +1,84 @@
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+
+# ======================
+# TOKEN STORE (in-memory LRU hoặc cache dùng chung, hết hạn theo expires_at)
+# ======================
+class TokenStore:
+    """
+    Giữ token Keystone + catalog của từng user đã đăng nhập phía server.
+    - Flask session chỉ chứa key ngẫu nhiên (opaque), không chứa token.
+    - Entry hết hạn `margin` giây trước `expires_at` của token.
+    - Không có `backend`: RAM của process, tối đa `max_entries` entry (LRU).
+    - Có `backend` (cache_backend.SQLiteCache): mọi gunicorn worker cùng thấy entry, TTL = expires_at;
+      key trong cache là hash của key trong session.
+    """
+
+    def __init__(self, max_entries=1000, margin=60, backend=None):
+        self.max_entries = max_entries
+        self.margin = margin
+        self.backend = backend
+        self._items = OrderedDict()  # key -> conn (dict trả về từ osc.authenticate)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+
+    @staticmethod
+    def _backend_key(key):
+        return "user-token:" + hashlib.sha256(key.encode()).hexdigest()
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def put(self, conn):
+        """Lưu conn của user, trả về key ngẫu nhiên để đặt vào session."""
+        key = secrets.token_urlsafe(24)
+        if self.backend is not None:
+            self.backend.set(self._backend_key(key), conn, max(1, conn["expires_at"] - self.margin - time.time()))
+            return key
+        with self._lock:
+            self._items[key] = conn
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+                self._stats["evictions"] += 1
+        return key
+
+    def get(self, key):
+        """conn còn hạn của key, None nếu không có / đã hết hạn."""
+        if not key:
+            return None
+        if self.backend is not None:
+            conn = self.backend.get(self._backend_key(key))
+            self._count("misses" if conn is None else "hits")
+            return conn
+        with self._lock:
+            conn = self._items.get(key)
+            if conn is None:
+                self._stats["misses"] += 1
+                return None
+            if conn["expires_at"] - self.margin <= time.time():
+                del self._items[key]
+                self._stats["expired"] += 1
+                return None
+            self._items.move_to_end(key)
+            self._stats["hits"] += 1
+            return conn
+
+    def discard(self, key):
+        if self.backend is not None and key:
+            self.backend.delete(self._backend_key(key))
+        with self._lock:
+            self._items.pop(key, None)
+
+    def __len__(self):
+        return len(self._items)
+
+    def metrics(self):
+        with self._lock:
+            if self.backend is not None:
+                return {**self._stats, "backend": type(self.backend).__name__}
+            return {**self._stats, "entries": len(self._items), "max_entries": self.max_entries}
@@ -0,0 +1,158 @@
+import time
+from collections import defaultdict
+
+
+# ======================
+# NETWORK TOPOLOGY GRAPH
+# ======================
+class Topology:
+    """
+    Đồ thị network → subnet → router → port → floating IP dựng từ các list API của Neutron
+    (networks, subnets, routers, ports, floatingips), toàn bộ join bằng dict index.
+
+    Reachability:
+    - network "external"  : router:external,
+    - network "routed"    : có interface trên một router có gateway ra external network,
+    - network "isolated"  : còn lại;
+    - instance "public"   : có floating IP,
+    - instance "routable" : có port trên network routed (ra ngoài qua SNAT, gán được floating IP),
+    - instance "isolated" : không có đường ra ngoài.
+    """
+
+    def __init__(self, networks, subnets, routers, ports, floating_ips, fetched_at=None, project_id=None):
+        self.fetched_at = fetched_at or time.time()
+        self.project_id = project_id
+        self.networks = {n["id"]: n for n in networks}
+        self.subnets = {s["id"]: s for s in subnets}
+        self.routers = {r["id"]: r for r in routers}
+        self.ports = {p["id"]: p for p in ports}
+        self.floating_ips = {f["id"]: f for f in floating_ips}
+
+        # Thứ tự như Neutron trả về (network external đầu tiên = mặc định)
+        self.external_network_ids = [n["id"] for n in networks if n.get("router:external")]
+
+        self.subnets_by_network = defaultdict(list)
+        for s in subnets:
+            self.subnets_by_network[s.get("network_id")].append(s["id"])
+
+        self.ports_by_device = defaultdict(list)
+        for p in ports:
+            self.ports_by_device[p.get("device_id")].append(p)
+
+        self.fip_by_port = {f["port_id"]: f for f in floating_ips if f.get("port_id")}
+
+        # router -> các network nội bộ gắn vào router (qua subnet của interface)
+        self.router_networks = defaultdict(set)
+        for p in ports:
+            if p.get("device_owner", "").startswith("network:router_interface") and p.get("device_id") in self.routers:
+                for ip in p.get("fixed_ips", []):
+                    subnet = self.subnets.get(ip.get("subnet_id"))
+                    network_id = subnet["network_id"] if subnet else p.get("network_id")
+                    self.router_networks[p["device_id"]].add(network_id)
+
+        # Index ngược network -> router (to_dict tra O(1) thay vì quét mọi router cho mỗi network)
+        self.network_routers = defaultdict(list)
+        for rid, network_ids in self.router_networks.items():
+            for network_id in network_ids:
+                self.network_routers[network_id].append(rid)
+
+        # network nội bộ -> các router có gateway (ra external network nào)
+        self.gateways = defaultdict(list)  # network_id -> [(router_id, external_network_id)]
+        for rid, router in self.routers.items():
+            ext = (router.get("external_gateway_info") or {}).get("network_id")
+            if ext:
+                for network_id in self.router_networks[rid]:
+                    self.gateways[network_id].append((rid, ext))
+
+    # ---------- queries ----------
+    def routed_networks(self, external_network_id=None):
+        """Network nội bộ ra được external network (mọi external nếu không chỉ định)."""
+        return {
+            network_id for network_id, gws in self.gateways.items()
+            if any(external_network_id in (None, ext) for _, ext in gws)
+        }
+
+    def ports_of(self, device_id):
+        return self.ports_by_device.get(device_id, [])
+
+    def unused_floating_ips(self, project_id=None):
+        """Floating IP chưa gắn port của `project_id` (mặc định project của topology)."""
+        project_id = project_id or self.project_id
+        return [
+            f for f in self.floating_ips.values()
+            if not f.get("port_id") and f.get("status") == "DOWN"
+            and project_id in (None, f.get("project_id") or f.get("tenant_id"))
+        ]
+
+    def network_reachability(self, network_id):
+        if network_id in self.networks and self.networks[network_id].get("router:external"):
+            return "external"
+        return "routed" if self.gateways.get(network_id) else "isolated"
+
+    def instance_reachability(self, server_id):
+        """{"status", "floating_ips", "routed_ports", "networks"} của một instance."""
+        ports = self.ports_of(server_id)
+        fips = [self.fip_by_port[p["id"]]["floating_ip_address"] for p in ports if p["id"] in self.fip_by_port]
+        routed = [p["id"] for p in ports if self.gateways.get(p.get("network_id"))]
+        status = "public" if fips else "routable" if routed else "isolated"
+        return {
+            "status": status,
+            "floating_ips": fips,
+            "routed_ports": routed,
+            "networks": sorted({p.get("network_id") for p in ports}),
+        }
+
+    def instance_ids(self):
+        return [device for device, ports in self.ports_by_device.items()
+                if any(p.get("device_owner", "").startswith("compute:") for p in ports)]
+
+    # ---------- export ----------
+    def to_dict(self, server_names=None):
+        """Dạng JSON: network (kèm subnet, router, instance) + router + tóm tắt reachability."""
+        server_names = server_names or {}
+        instances_by_network = defaultdict(list)
+        instances = []
+        for sid in self.instance_ids():
+            reach = self.instance_reachability(sid)
+            item = {"id": sid, "name": server_names.get(sid), **reach}
+            instances.append(item)
+            for network_id in reach["networks"]:
+                instances_by_network[network_id].append(sid)
+
+        networks = []
+        for nid, n in self.networks.items():
+            networks.append({
+                "id": nid,
+                "name": n.get("name"),
+                "reachability": self.network_reachability(nid),
+                "subnets": [
+                    {"id": sid, "name": self.subnets[sid].get("name"), "cidr": self.subnets[sid].get("cidr")}
+                    for sid in self.subnets_by_network.get(nid, [])
+                ],
+                "routers": list(self.network_routers.get(nid, ())),
+                "gateways": [{"router_id": rid, "external_network_id": ext} for rid, ext in self.gateways.get(nid, [])],
+                "instances": instances_by_network.get(nid, []),
+            })
+
+        routers = [
+            {
+                "id": rid,
+                "name": r.get("name"),
+                "external_network_id": (r.get("external_gateway_info") or {}).get("network_id"),
+                "networks": sorted(self.router_networks.get(rid, ())),
+            }
+            for rid, r in self.routers.items()
+        ]
+
+        summary = defaultdict(int)
+        for item in instances:
+            summary[item["status"]] += 1
+
+        return {
+            "fetched_at": self.fetched_at,
+            "networks": networks,
+            "routers": routers,
+            "instances": instances,
+            "summary": {"instances": dict(summary), "floating_ips": len(self.floating_ips),
+                        "unused_floating_ips": len(self.unused_floating_ips())},
+        }
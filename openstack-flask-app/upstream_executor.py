@@ -0,0 +1,134 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import profiler
+
+
+class ServiceBusy(Exception):
+    """Hàng đợi của service đã đầy — request bị từ chối ngay (HTTP 503)."""
+
+    def __init__(self, service, queued):
+        super().__init__(f"⏳ {service} is busy ({queued} calls queued), please retry")
+        self.service = service
+        self.queued = queued
+
+
+# ======================
+# BOUNDED UPSTREAM EXECUTOR
+# ======================
+class UpstreamExecutor:
+    """
+    Thread pool riêng cho các lời gọi openstack_client (thay cho asyncio.to_thread).
+    - Mỗi service (compute, network, image, ...) có giới hạn số lời gọi chạy song song.
+    - Lời gọi vượt giới hạn nằm trong hàng đợi riêng của service, tối đa `max_queue`;
+      quá mức đó => ServiceBusy ngay lập tức thay vì xếp hàng vô hạn.
+    - Pool có đúng sum(limits) thread nên một service bị nghẽn không chiếm thread của service khác.
+    """
+
+    def __init__(self, limits, max_queue=32):
+        self.limits = dict(limits)
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=sum(self.limits.values()), thread_name_prefix="upstream")
+        self._lock = threading.Lock()
+        self._queues = {svc: deque() for svc in self.limits}
+        self._running = {svc: 0 for svc in self.limits}
+        self._stats = {
+            svc: {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0,
+                  "wait_total": 0.0, "wait_max": 0.0, "waits": deque(maxlen=512)}
+            for svc in self.limits
+        }
+
+    @classmethod
+    def from_env(cls):
+        """
+        OSC_SERVICE_LIMITS="compute=8,network=8,image=4,identity=4"  (số lời gọi song song mỗi service)
+        OSC_MAX_QUEUE=32                                 (số lời gọi chờ tối đa mỗi service)
+        Ngoài các service còn hai "service" nội bộ:
+        - wait  : poll chờ server ACTIVE (chủ yếu ngủ, tối đa vài phút) — không giữ slot compute,
+        - batch : điều phối thao tác hàng loạt; các lời gọi con của nó đi qua service thật.
+        """
+        limits = {"compute": 8, "network": 8, "image": 4, "identity": 4, "wait": 16, "batch": 2}
+        for item in filter(None, os.environ.get("OSC_SERVICE_LIMITS", "").split(",")):
+            svc, _, n = item.partition("=")
+            limits[svc.strip()] = int(n)
+        return cls(limits, max_queue=int(os.environ.get("OSC_MAX_QUEUE", "32")))
+
+    def submit(self, service, fn, *args, **kwargs):
+        """Đưa fn vào hàng đợi của service; trả về concurrent.futures.Future."""
+        future = Future()
+        # Giữ contextvars của caller (request context, profiler, ...) trong worker thread
+        ctx = contextvars.copy_context()
+        job = (future, ctx, fn, args, kwargs, time.monotonic())
+
+        with self._lock:
+            stats = self._stats[service]
+            queue = self._queues[service]
+            if self._running[service] >= self.limits[service]:
+                if len(queue) >= self.max_queue:
+                    stats["rejected"] += 1
+                    raise ServiceBusy(service, len(queue))
+                queue.append(job)
+                stats["submitted"] += 1
+                return future
+            self._running[service] += 1
+            stats["submitted"] += 1
+
+        self._pool.submit(self._run, service, job)
+        return future
+
+    async def run(self, service, fn, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(service, fn, *args, **kwargs))
+
+    def _run(self, service, job):
+        while job is not None:
+            future, ctx, fn, args, kwargs, enqueued = job
+            waited = time.monotonic() - enqueued
+            ok = False
+            if future.set_running_or_notify_cancel():
+                # Request đang được profile => lấy mẫu cả worker này (+ thời gian chờ trong hàng đợi)
+                with profiler.thread_scope(ctx, f"upstream:{service}", waited):
+                    try:
+                        future.set_result(ctx.run(fn, *args, **kwargs))
+                        ok = True
+                    except BaseException as e:
+                        future.set_exception(e)
+
+            # Lấy tiếp job của cùng service (nếu có) thay vì trả slot
+            with self._lock:
+                stats = self._stats[service]
+                stats["completed" if ok else "failed"] += 1
+                stats["wait_total"] += waited
+                stats["wait_max"] = max(stats["wait_max"], waited)
+                stats["waits"].append(waited)
+                queue = self._queues[service]
+                if queue:
+                    job = queue.popleft()
+                else:
+                    self._running[service] -= 1
+                    job = None
+
+    def metrics(self):
+        with self._lock:
+            result = {}
+            for svc, stats in self._stats.items():
+                waits = sorted(stats["waits"])
+                done = stats["completed"] + stats["failed"]
+                result[svc] = {
+                    "limit": self.limits[svc],
+                    "running": self._running[svc],
+                    "queue_depth": len(self._queues[svc]),
+                    "max_queue": self.max_queue,
+                    "submitted": stats["submitted"],
+                    "completed": stats["completed"],
+                    "failed": stats["failed"],
+                    "rejected": stats["rejected"],
+                    "wait_avg_ms": 1000 * stats["wait_total"] / done if done else 0.0,
+                    "wait_p95_ms": 1000 * waits[int(len(waits) * 0.95)] if waits else 0.0,
+                    "wait_max_ms": 1000 * stats["wait_max"],
+                }
+            return result
@@ -0,0 +1,102 @@
+import threading
+from collections import defaultdict
+
+
+DIMENSIONS = ("flavor", "image", "status", "network")
+METRICS = ("instances", "vcpus", "ram", "disk")
+
+
+def _zero():
+    return dict.fromkeys(METRICS, 0)
+
+
+# ======================
+# USAGE AGGREGATOR
+# ======================
+class UsageAggregator:
+    """
+    Tổng vCPU / RAM (MB) / disk (GB) / số instance của project theo flavor, image, status, network.
+    - Flavor / image được index theo ID một lần (dict) => join với server list trong một lượt.
+    - Mỗi server giữ "phần đóng góp" của nó; update() chỉ trừ / cộng các server
+      thêm / đổi / bị xoá so với lần trước. Flavor hoặc image list đổi => tính lại toàn bộ.
+    - Server nằm trên nhiều network được tính vào từng network đó.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._servers = {}        # id -> Server
+        self._contrib = {}        # id -> (keys theo dimension, (vcpus, ram, disk))
+        self._totals = {d: defaultdict(_zero) for d in DIMENSIONS}
+        self._total = _zero()
+        self._flavors = {}
+        self._images = {}
+        self._sources = (None, None, None)
+
+    # ---------- build ----------
+    def update(self, servers, flavors, images):
+        if self._sources == (servers, flavors, images):
+            return
+        with self._lock:
+            if (flavors, images) != self._sources[1:]:
+                self._flavors = {f.id: f for f in flavors}
+                self._images = {i.id: i for i in images}
+                self._reset()
+            self._sources = (servers, flavors, images)
+
+            fresh = {s.id: s for s in servers}
+            for sid in [sid for sid in self._servers if sid not in fresh]:
+                self._apply(sid, -1)
+                del self._servers[sid], self._contrib[sid]
+            for sid, server in fresh.items():
+                old = self._servers.get(sid)
+                if old == server:
+                    continue
+                if old is not None:
+                    self._apply(sid, -1)
+                self._servers[sid] = server
+                self._contrib[sid] = self._contribution(server)
+                self._apply(sid, +1)
+
+    def _reset(self):
+        self._totals = {d: defaultdict(_zero) for d in DIMENSIONS}
+        self._total = _zero()
+        for sid, server in self._servers.items():
+            self._contrib[sid] = self._contribution(server)
+            self._apply(sid, +1)
+
+    def _contribution(self, s):
+        flavor = self._flavors.get(s.flavor)
+        image = self._images.get(s.image)
+        keys = {
+            "flavor": (flavor.name if flavor else f"(unknown {s.flavor})",),
+            "image": ((image.name or image.id) if image else ("(boot from volume)" if not s.image else f"(unknown {s.image})"),),
+            "status": (s.status,),
+            "network": s.networks or ("(no network)",),
+        }
+        resources = (flavor.vcpus or 0, flavor.ram or 0, flavor.disk or 0) if flavor else (0, 0, 0)
+        return keys, resources
+
+    def _apply(self, sid, sign):
+        keys, (vcpus, ram, disk) = self._contrib[sid]
+        delta = {"instances": sign, "vcpus": sign * vcpus, "ram": sign * ram, "disk": sign * disk}
+        for metric, value in delta.items():
+            self._total[metric] += value
+        for dim, values in keys.items():
+            bucket = self._totals[dim]
+            for value in values:
+                row = bucket[value]
+                for metric, d in delta.items():
+                    row[metric] += d
+                if row["instances"] == 0:
+                    del bucket[value]
+
+    # ---------- read ----------
+    def snapshot(self):
+        """{"total": {...}, "by_flavor": [{"key", "instances", "vcpus", "ram", "disk"}, ...], ...}."""
+        with self._lock:
+            result = {"total": dict(self._total)}
+            for dim in DIMENSIONS:
+                rows = [{"key": key, **values} for key, values in self._totals[dim].items()]
+                rows.sort(key=lambda r: (-r["vcpus"], -r["instances"], str(r["key"])))
+                result[f"by_{dim}"] = rows
+            return result